@@ -3,12 +3,14 @@ import traceback
 import re
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, session
 from flask_login import login_user, logout_user, current_user, login_required
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_wtf.csrf import CSRFProtect, generate_csrf
 from models import User, db
 from forms import RegistrationForm, LoginForm, ResetPasswordForm, ResetPasswordConfirmForm
 from utils import send_reset_email
 from itsdangerous import URLSafeTimedSerializer
+from sqlalchemy.exc import IntegrityError
+from identity import identity_cache
+from passwords import password_hasher, HasherBusy
 
 
 auth_bp = Blueprint("auth", __name__)
@@ -20,6 +22,30 @@ PASSWORD_PATTERN = re.compile(r"^(?=.*[A-Z])(?=.*\d)(?=.*[@$!%*?&])[A-Za-z\d@$!%
 serializer = URLSafeTimedSerializer("your_secret_key_here")
 
 
+BUSY_MESSAGE = "The server is busy, please try again in a moment."
+
+
+def _busy_response():
+    """Shed load when the password hashing queue is full"""
+    return jsonify({"status": "error", "message": BUSY_MESSAGE}), 503, {"Retry-After": "1"}
+
+
+def _check_password(user, password):
+    """Verify a password, storing an upgraded hash if the configured cost has changed"""
+    if user is None:
+        return False
+    authenticated, new_hash = password_hasher.verify(user.password_hash, password)
+    if new_hash:
+        user.password_hash = new_hash
+        try:
+            db.session.commit()
+            logging.info(f"Rehashed password for user {user.id} with {password_hasher.method}.")
+        except Exception as e:
+            db.session.rollback()
+            logging.error(f"Could not store rehashed password for user {user.id}: {e}")
+    return authenticated
+
+
 @auth_bp.route("/api/register", methods=["POST"])
 @csrf.exempt
 def api_register():
@@ -46,16 +72,22 @@ def api_register():
         if password != confirm_password:
             return jsonify({"status": "error", "message": "Passwords do not match"}), 400
             
-        if User.query.filter_by(email=email).first():
-            return jsonify({"status": "error", "message": "Email already exists"}), 400
+        try:
+            password_hash = password_hasher.hash(password)
+        except HasherBusy:
+            return _busy_response()
 
-        
         new_user = User(
             email=email,
-            password_hash=generate_password_hash(password)  
+            password_hash=password_hash
         )
         db.session.add(new_user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            return jsonify({"status": "error", "message": "Email already exists"}), 400
+        identity_cache.mark_users_exist()
 
         return jsonify({
             "status": "success", 
@@ -80,20 +112,24 @@ def register_page():
     form = RegistrationForm()
     if form.validate_on_submit():
         try:
-            if User.query.filter_by(email=form.email.data).first():
-                flash("Email already registered", "danger")
-                return redirect(url_for("auth.register_page"))
-
             new_user = User(
                 email=form.email.data,
-                password_hash=generate_password_hash(form.password.data)  
+                password_hash=password_hasher.hash(form.password.data)
             )
             db.session.add(new_user)
             db.session.commit()
+            identity_cache.mark_users_exist()
             
             flash("Registration successful! Please login", "success")
             return redirect(url_for("auth.login_page"))
 
+        except IntegrityError:
+            db.session.rollback()
+            flash("Email already registered", "danger")
+            return redirect(url_for("auth.register_page"))
+        except HasherBusy:
+            flash(BUSY_MESSAGE, "warning")
+            return render_template("register.html", form=form), 503
         except Exception as e:
             db.session.rollback()
             logging.error(f"Registration error: {str(e)}\n{traceback.format_exc()}")
@@ -106,7 +142,7 @@ def register_page():
 def login_page():
     """Login with flow validation"""
     
-    if not User.query.first():
+    if not identity_cache.users_exist():
         return redirect(url_for("auth.register_page"))
 
     if current_user.is_authenticated:
@@ -114,9 +150,15 @@ def login_page():
 
     form = LoginForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data).first()
-        if user and check_password_hash(user.password_hash, form.password.data):
-            login_user(user, remember=form.remember.data)
+        user = User.get_by_email(form.email.data)
+        try:
+            authenticated = _check_password(user, form.password.data)
+        except HasherBusy:
+            flash(BUSY_MESSAGE, "warning")
+            return render_template("login.html", form=form), 503
+        if authenticated:
+            login_user(user, remember=form.remember_me.data)
+            identity_cache.remember(user)
             next_page = request.args.get('next')
             flash("Login successful", "success")
             return redirect(next_page) if next_page else redirect(url_for("main.upload_image"))
@@ -139,7 +181,7 @@ def reset_password():
     """Password reset request handler"""
     form = ResetPasswordForm()
     if form.validate_on_submit():
-        user = User.query.filter_by(email=form.email.data).first()
+        user = form.user
         if user:
             token = serializer.dumps(user.email, salt="password-reset")
             send_reset_email(user.email, token)
@@ -161,8 +203,13 @@ def reset_password_confirm(token):
     if form.validate_on_submit():
         user = User.query.filter_by(email=email).first()
         if user:
-            user.password_hash = generate_password_hash(form.password.data)
+            try:
+                user.password_hash = password_hasher.hash(form.password.data)
+            except HasherBusy:
+                flash(BUSY_MESSAGE, "warning")
+                return render_template("reset_password_confirm.html", form=form), 503
             db.session.commit()
+            identity_cache.invalidate(user.id)
             flash("Password updated successfully", "success")
             return redirect(url_for("auth.login_page"))
     return render_template("reset_password_confirm.html", form=form)
@@ -182,8 +229,13 @@ def api_login():
         remember_me = data.get("remember_me", False)
 
         user = User.query.filter_by(email=email).first()
-        if user and check_password_hash(user.password_hash, password):
+        try:
+            authenticated = _check_password(user, password)
+        except HasherBusy:
+            return _busy_response()
+        if authenticated:
             login_user(user, remember=remember_me)
+            identity_cache.remember(user)
             return jsonify({
                 "status": "success", 
                 "message": "Login successful",
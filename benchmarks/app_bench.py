@@ -0,0 +1,329 @@
+"""
+Benchmarks metadata extraction, uploads and metadata endpoints.
+
+Runs ``create_app()`` against a temporary SQLite database and upload folder.
+The corpus is the PNGs in ``uploads/`` plus JPEGs generated with small,
+medium and large EXIF blocks. The benchmark measures:
+
+- ``extract``: ``utils.extract_metadata`` per-file latency and throughput for
+  each corpus group.
+- ``upload``: end-to-end ``POST /upload`` latency for new content and for
+  already-stored (deduplicated) content.
+- ``metadata``: ``GET /metadata/<id>`` and ``GET /download_metadata/<id>``
+  latency for each metadata size, with the metadata cache bypassed and (unless
+  ``--metadata-cache none``) served from the cache. Extraction is finished
+  before these are timed, also with ``--extraction-mode async``.
+
+Inputs are generated from a fixed seed. Results, along with the commit and
+settings, are written as JSON. ``--compare`` prints the change between two
+result files.
+
+    python benchmarks/app_bench.py [--requests 200] [--output results.json]
+    python benchmarks/app_bench.py --compare before.json after.json
+"""
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from PIL import Image as PILImage
+from stages import percentile
+
+
+# Generated JPEG groups: (private EXIF tags added, bytes per tag value).
+METADATA_SIZES = {
+    "small": (8, 16),
+    "medium": (64, 64),
+    "large": (240, 200),
+}
+PASSWORD = "Passw0rd!"
+
+
+def summarize(timings):
+    """Latency summary in milliseconds for a list of durations in seconds."""
+    ordered = sorted(timings)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+        "p90_ms": round(percentile(ordered, 90) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def make_jpeg(rng, tags, value_size, edge=640):
+    """A JPEG with camera, capture and GPS tags plus ``tags`` private ASCII tags."""
+    exif = PILImage.Exif()
+    exif[0x010F] = "BenchCam"
+    exif[0x0110] = f"Model {rng.randrange(100)}"
+    for i in range(tags):
+        exif[0xC000 + i] = f"{i:04d}-" + "".join(rng.choices("abcdefghijklmnopqrstuvwxyz", k=value_size))
+    exif_ifd = exif.get_ifd(0x8769)
+    exif_ifd[0x9003] = f"2024:{rng.randrange(1, 13):02d}:{rng.randrange(1, 29):02d} 12:00:00"
+    exif_ifd[0x829D] = 2.8
+    exif_ifd[0x8827] = rng.choice((100, 400, 1600))
+    gps = exif.get_ifd(0x8825)
+    gps[1], gps[2] = "N", (float(rng.randrange(90)), float(rng.randrange(60)), 0.0)
+    gps[3], gps[4] = "E", (float(rng.randrange(180)), float(rng.randrange(60)), 0.0)
+
+    # Random pixels keep every file's content, and so its hash, unique.
+    pixels = PILImage.frombytes("RGB", (64, 48), rng.randbytes(64 * 48 * 3)).resize((edge, edge * 3 // 4))
+    buffer = io.BytesIO()
+    pixels.save(buffer, "JPEG", quality=85, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def build_corpus(directory, rng, per_size):
+    """Writes the corpus files; returns {group: [path, ...]}."""
+    corpus = {"png": []}
+    uploads = os.path.join(ROOT, "uploads")
+    for name in sorted(os.listdir(uploads)):
+        if name.lower().endswith(".png"):
+            corpus["png"].append(os.path.join(uploads, name))
+    for size, (tags, value_size) in METADATA_SIZES.items():
+        corpus[f"jpeg-{size}"] = []
+        for i in range(per_size):
+            path = os.path.join(directory, f"{size}-{i}.jpg")
+            with open(path, "wb") as fp:
+                fp.write(make_jpeg(rng, tags, value_size))
+            corpus[f"jpeg-{size}"].append(path)
+    return corpus
+
+
+def bench_extract(corpus, passes):
+    from utils import extract_metadata
+
+    results = {}
+    for group, paths in corpus.items():
+        if not paths:
+            continue
+        timings, keys = [], []
+        total_bytes = sum(os.path.getsize(path) for path in paths) * passes
+        for _ in range(passes):
+            for path in paths:
+                started = time.perf_counter()
+                metadata = extract_metadata(path) or {}
+                timings.append(time.perf_counter() - started)
+                keys.append(len(metadata))
+        elapsed = sum(timings)
+        results[group] = dict(
+            summarize(timings),
+            files_per_s=round(len(timings) / elapsed, 1),
+            mb_per_s=round(total_bytes / elapsed / 1e6, 2),
+            metadata_keys=round(statistics.fmean(keys), 1),
+        )
+    return results
+
+
+def timed(client, method, url, expected, **kwargs):
+    started = time.perf_counter()
+    response = getattr(client, method)(url, **kwargs)
+    elapsed = time.perf_counter() - started
+    if response.status_code != expected:
+        raise RuntimeError(f"{method.upper()} {url} returned {response.status_code}, expected {expected}")
+    return elapsed, response
+
+
+def upload(client, data, name):
+    return timed(client, "post", "/upload", 302,
+                 data={"file": (io.BytesIO(data), name)}, content_type="multipart/form-data")
+
+
+def bench_upload(client, corpus, rng, count):
+    """Uploads ``count`` new JPEGs (medium metadata) and the PNG corpus twice, the second time deduplicated."""
+    tags, value_size = METADATA_SIZES["medium"]
+    new = [upload(client, make_jpeg(rng, tags, value_size), f"new-{i}.jpg")[0] for i in range(count)]
+    pngs = [open(path, "rb").read() for path in corpus["png"]]
+    new += [upload(client, data, "corpus.png")[0] for data in pngs]
+    dedup = [upload(client, data, "again.png")[0] for data in pngs]
+    return {"new": summarize(new), "deduplicated": summarize(dedup)}
+
+
+def wait_for_extraction(app, image_id):
+    """Blocks until the image's metadata has been extracted, so reads time the stored document."""
+    from models import db, Image, EXTRACTION_PENDING
+
+    app.extensions["extraction_queue"].join()
+    with app.app_context():
+        if db.session.get(Image, image_id).extraction_status == EXTRACTION_PENDING:
+            raise RuntimeError(f"Extraction for image {image_id} is still pending")
+
+
+def bench_metadata(app, client, corpus, requests):
+    """
+    Times the metadata endpoints per metadata size, uncached and (unless the cache is off) cached.
+
+    The uncached run drops the image's cache entry before every request, so
+    it measures loading, decompressing and serializing the stored document.
+    """
+    cache = app.extensions["metadata_cache"]
+    results = {}
+    for size in METADATA_SIZES:
+        path = corpus[f"jpeg-{size}"][0]
+        with open(path, "rb") as fp:
+            _, response = upload(client, fp.read(), os.path.basename(path))
+        image_id = int(response.headers["Location"].rstrip("/").rsplit("/", 1)[-1])
+        wait_for_extraction(app, image_id)
+        results[size] = {}
+        for endpoint in ("metadata", "download_metadata"):
+            url = f"/{endpoint}/{image_id}"
+            uncached = []
+            for _ in range(requests):
+                cache.invalidate(image_id)
+                elapsed, response = timed(client, "get", url, 200)
+                uncached.append(elapsed)
+            results[size][endpoint] = {"uncached": summarize(uncached), "response_bytes": len(response.data)}
+            if cache.backend is not None:
+                timed(client, "get", url, 200)
+                results[size][endpoint]["cached"] = summarize(
+                    [timed(client, "get", url, 200)[0] for _ in range(requests)])
+    return results
+
+
+def create_client(tmp, args):
+    os.environ.update(
+        SQLALCHEMY_DATABASE_URI="sqlite:///" + os.path.join(tmp, "bench.db"),
+        UPLOAD_FOLDER=os.path.join(tmp, "uploads"),
+        RATELIMIT_STORAGE_URI="shm://" + os.path.join(tmp, "limits"),
+        EXTRACTION_MODE=args.extraction_mode,
+        METADATA_CACHE_BACKEND=args.metadata_cache,
+        OUTBOX_SENDER="off",
+    )
+    # app.py logs to ./app.log; keep that out of the working tree.
+    os.chdir(tmp)
+    from app import create_app
+    from models import db
+
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, SESSION_COOKIE_SECURE=False)
+    # Every request comes from one client, which the limits exist to stop.
+    for limiter in app.extensions["limiter"]:
+        limiter.enabled = False
+    logging.getLogger().setLevel(logging.WARNING)
+    with app.app_context():
+        db.create_all()
+
+    client = app.test_client()
+    credentials = {"email": "bench@example.com", "password": PASSWORD}
+    timed(client, "post", "/auth/api/register", 201, json=dict(credentials, confirm_password=PASSWORD))
+    timed(client, "post", "/auth/api/login", 200, json=credentials)
+    return app, client
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = os.path.join(tmp, "corpus")
+        os.makedirs(corpus_dir)
+        corpus = build_corpus(corpus_dir, rng, args.files_per_size)
+        app, client = create_client(tmp, args)
+        try:
+            results = {
+                "meta": {
+                    "commit": git_commit(),
+                    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                    "python": platform.python_version(),
+                    "platform": platform.platform(),
+                    "cpus": os.cpu_count(),
+                    "settings": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+                    "corpus": {group: len(paths) for group, paths in corpus.items()},
+                },
+                "extract": bench_extract(corpus, args.passes),
+                "upload": bench_upload(client, corpus, rng, args.uploads),
+                "metadata": bench_metadata(app, client, corpus, args.requests),
+            }
+        finally:
+            app.extensions["extraction_queue"].shutdown(wait=True)
+            os.chdir(ROOT)
+    return results
+
+
+def flatten(results, prefix=""):
+    """Maps "section.group.stat" paths to numbers, skipping run metadata."""
+    flat = {}
+    for key, value in results.items():
+        if key == "meta":
+            continue
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(before_path, after_path):
+    with open(before_path) as fp:
+        before = json.load(fp)
+    with open(after_path) as fp:
+        after = json.load(fp)
+    print(f"before: {before['meta'].get('commit')}  after: {after['meta'].get('commit')}")
+    old, new = flatten(before), flatten(after)
+    for key in sorted(old.keys() & new.keys()):
+        if not key.endswith(("_ms", "_per_s")):
+            continue
+        change = (new[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+        print(f"{key:<48} {old[key]:>12.3f} {new[key]:>12.3f} {change:>+8.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--files-per-size", type=int, default=20, help="generated JPEGs per metadata size")
+    parser.add_argument("--passes", type=int, default=3, help="extraction passes over the corpus")
+    parser.add_argument("--uploads", type=int, default=50, help="new JPEG uploads to time")
+    parser.add_argument("--requests", type=int, default=200, help="requests per metadata endpoint and size")
+    parser.add_argument("--extraction-mode", choices=("sync", "async"), default="sync",
+                        help="sync includes extraction in upload latency")
+    parser.add_argument("--metadata-cache", choices=("memory", "sqlite", "none"), default="sqlite",
+                        help="backend for the cached metadata run; none skips it")
+    parser.add_argument("--output", help="results file (default app_bench-<commit>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two results files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    results = run(args)
+    output = args.output or f"app_bench-{(results['meta']['commit'] or 'unknown')[:10]}.json"
+    with open(output, "w") as fp:
+        json.dump(results, fp, indent=2, sort_keys=True)
+
+    for group, stats in results["extract"].items():
+        print(f"extract {group:<14} {stats['files_per_s']:>9.1f} files/s  p50 {stats['p50_ms']:.3f}ms  "
+              f"p99 {stats['p99_ms']:.3f}ms  {stats['metadata_keys']:.0f} keys")
+    for kind, stats in results["upload"].items():
+        print(f"upload  {kind:<14} p50 {stats['p50_ms']:.2f}ms  p99 {stats['p99_ms']:.2f}ms")
+    for size, endpoints in results["metadata"].items():
+        for endpoint, runs in endpoints.items():
+            for run_name in ("uncached", "cached"):
+                if run_name in runs:
+                    stats = runs[run_name]
+                    print(f"{endpoint:<17} {size:<6} {run_name:<8} p50 {stats['p50_ms']:.2f}ms  "
+                          f"p99 {stats['p99_ms']:.2f}ms  {runs['response_bytes']} bytes")
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
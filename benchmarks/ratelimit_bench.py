@@ -0,0 +1,84 @@
+"""
+Measures the per-check cost of the rate-limit storage backends.
+
+Runs Flask-Limiter's sliding-window-counter strategy (the one the app uses)
+against the per-process memory storage and the shared-memory storage, single
+process and with several processes hitting the same keys, and reports
+microseconds per check. The shared storage's p99 must stay under the 100us
+budget; the mean is also printed, but with more processes than cores it
+mostly measures time spent descheduled rather than in the storage.
+
+    python benchmarks/ratelimit_bench.py [--checks 20000] [--processes 4]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import SlidingWindowCounterRateLimiter
+import ratelimit_storage  # noqa: F401  registers shm://
+
+
+BUDGET_US = 100.0
+
+
+def run_checks(uri, checks, keys=64):
+    """Returns per-check latencies in microseconds."""
+    limiter = SlidingWindowCounterRateLimiter(storage_from_string(uri))
+    item = parse("1000000 per minute")
+    timings = []
+    for i in range(checks):
+        key = f"10.0.{i % keys // 256}.{i % 256}"
+        started = time.perf_counter_ns()
+        limiter.hit(item, key)
+        timings.append((time.perf_counter_ns() - started) / 1000)
+    return timings
+
+
+def _worker(args):
+    return run_checks(*args)
+
+
+def summarize(label, timings):
+    timings = sorted(timings)
+    p50 = timings[len(timings) // 2]
+    p99 = timings[int(len(timings) * 0.99)]
+    mean = statistics.fmean(timings)
+    print(f"{label:<32} mean {mean:7.1f}us  p50 {p50:7.1f}us  p99 {p99:7.1f}us")
+    return p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--checks", type=int, default=20000)
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shm_uri = "shm://" + os.path.join(tmp, "limits")
+        summarize("memory:// (per process)", run_checks("memory://", args.checks))
+        single = summarize("shm:// single process", run_checks(shm_uri, args.checks))
+
+        per_worker = args.checks // args.processes
+        started = time.perf_counter()
+        with Pool(args.processes) as pool:
+            results = pool.map(_worker, [(shm_uri, per_worker)] * args.processes)
+        elapsed = time.perf_counter() - started
+        contended = summarize(f"shm:// {args.processes} processes", [t for r in results for t in r])
+
+    print(f"{'':<32} {per_worker * args.processes / elapsed:,.0f} checks/s across {os.cpu_count()} CPU(s)")
+
+    ok = single < BUDGET_US and contended < BUDGET_US
+    print(f"{'PASS' if ok else 'FAIL'}: p99 budget {BUDGET_US:.0f}us per check")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
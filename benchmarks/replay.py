@@ -0,0 +1,368 @@
+"""
+Replays traffic captured in Werkzeug access logs against a running app.
+
+Access lines (``127.0.0.1 - - [27/Feb/2025 02:15:26] "POST /auth/login HTTP/1.1" 200 -``),
+bare or behind the ``app.log`` logging prefix and with or without ANSI colors,
+are parsed into a workload:
+
+- the route mix, with ids, hashes and filenames folded into route templates
+- the gaps between requests; gaps longer than ``--max-gap`` are shortened, so
+  idle hours in a development log don't stall the replay
+- one session per client address, each with its own cookie jar
+
+Sessions start with the cookies from a Netscape ``cookies.txt`` (``--cookies``)
+or, with ``--login``, log in through ``/auth/api/login`` before their first
+request. Captured cookies are signed with the capturing server's
+``SECRET_KEY``, so ``--login`` is the usual choice for a local app.
+
+The logs do not record request bodies. Logins are sent the ``--login``
+credentials, uploads cycle through the images in ``--upload-dir``, and other
+requests are sent without a body; the per-endpoint status counts show which
+replayed requests the app rejected (for example form posts without a CSRF
+token).
+
+The workload is replayed at ``--speed`` times the captured rate by
+``--concurrency`` threads, ``--repeat`` times over. The report gives
+throughput and latency percentiles per endpoint, plus how far the schedule
+slipped when the app or the client could not keep up.
+
+    python benchmarks/replay.py --describe
+    python benchmarks/replay.py --target http://127.0.0.1:5000 --speed 10 --concurrency 8 \\
+        --login you@example.com:password --repeat 20
+"""
+import argparse
+import http.cookiejar
+import itertools
+import json
+import mimetypes
+import os
+import queue
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import Counter, defaultdict, namedtuple
+from datetime import datetime
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stages import percentile
+
+DEFAULT_LOGS = [os.path.join(ROOT, "app.log"), os.path.join(ROOT, "flask_log.txt")]
+
+ANSI = re.compile(r"\x1b\[[0-9;]*m")
+ACCESS = re.compile(
+    r'(?:(?P<logged>\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d{3}) - \w+ - )?'
+    r'(?P<client>\S+) - \S+ \[(?P<stamp>[^\]]+)\] '
+    r'"(?P<method>[A-Z]+) (?P<target>\S+) HTTP/[\d.]+" (?P<status>\d{3}) '
+)
+# Path segments folded into placeholders so one route is counted once.
+SEGMENTS = (
+    (re.compile(r"^\d+$"), "<id>"),
+    (re.compile(r"^[0-9a-f]{64}$"), "<hash>"),
+    (re.compile(r"^[\w-]+\.(?:png|jpe?g|gif|webp)$", re.IGNORECASE), "<filename>"),
+    (re.compile(r"^[\w-]+\.[\w-]+\.[\w-]+$"), "<token>"),
+)
+LOGIN_PATHS = {"/auth/login", "/auth/api/login"}
+UPLOAD_PATHS = {"/upload"}
+
+Event = namedtuple("Event", "time client method target status")
+Request = namedtuple("Request", "offset session method target route captured_status")
+Result = namedtuple("Result", "route status seconds lag")
+
+
+def parse_logs(paths):
+    """Yields an Event per access line in the given files, in file order."""
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as fp:
+            for line in fp:
+                match = ACCESS.search(ANSI.sub("", line))
+                if not match:
+                    continue
+                if match["logged"]:
+                    # The logging prefix carries milliseconds; Werkzeug's own stamp only seconds.
+                    when = datetime.strptime(match["logged"], "%Y-%m-%d %H:%M:%S,%f")
+                else:
+                    when = datetime.strptime(match["stamp"], "%d/%b/%Y %H:%M:%S")
+                yield Event(when.timestamp(), match["client"], match["method"], match["target"], int(match["status"]))
+
+
+def route_template(method, target):
+    path = target.split("?", 1)[0]
+    parts = [next((placeholder for pattern, placeholder in SEGMENTS if pattern.match(part)), part)
+             for part in path.split("/")]
+    return f"{method} {'/'.join(parts) or '/'}"
+
+
+def build_workload(events, max_gap, include_static=False):
+    """
+    Turns access events into replayable requests.
+
+    Returns:
+        list: Requests ordered by their offset in seconds from the first one.
+    """
+    events = sorted(
+        (event for event in events
+         if "__debugger__" not in event.target
+         and (include_static or not event.target.startswith(("/static/", "/favicon.ico")))),
+        key=lambda event: event.time
+    )
+    workload, offset, previous = [], 0.0, None
+    for event in events:
+        if previous is not None:
+            offset += min(event.time - previous, max_gap)
+        previous = event.time
+        workload.append(Request(offset, event.client, event.method, event.target,
+                                route_template(event.method, event.target), event.status))
+    return workload
+
+
+def describe(workload):
+    """Prints the workload model: size, route mix, gaps and sessions."""
+    if not workload:
+        print("No replayable access lines found.")
+        return
+    gaps = [b.offset - a.offset for a, b in zip(workload, workload[1:])]
+    print(f"{len(workload)} requests over {workload[-1].offset:.1f}s (after gap capping) "
+          f"from {len({r.session for r in workload})} session(s)")
+    if gaps:
+        ordered = sorted(gaps)
+        print(f"inter-arrival: mean {statistics.fmean(gaps):.3f}s  p50 {ordered[len(ordered) // 2]:.3f}s  "
+              f"max {ordered[-1]:.3f}s")
+    statuses = defaultdict(Counter)
+    for request in workload:
+        statuses[request.route][request.captured_status] += 1
+    print(f"\n{'route':<40} {'share':>7}  captured statuses")
+    for route, count in Counter(r.route for r in workload).most_common():
+        captured = " ".join(f"{status}x{n}" for status, n in sorted(statuses[route].items()))
+        print(f"{route:<40} {count / len(workload):>6.1%}  {captured}")
+
+
+def load_cookies(path):
+    """Loads a Netscape cookies.txt, including curl's ``#HttpOnly_`` lines, which MozillaCookieJar skips."""
+    with open(path, encoding="utf-8") as fp:
+        text = fp.read().replace("#HttpOnly_", "")
+    if not text.startswith("# Netscape HTTP Cookie File"):
+        text = "# Netscape HTTP Cookie File\n" + text
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as tmp:
+        tmp.write(text)
+    try:
+        jar = http.cookiejar.MozillaCookieJar()
+        jar.load(tmp.name, ignore_discard=True, ignore_expires=True)
+    finally:
+        os.remove(tmp.name)
+    return list(jar)
+
+
+def multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{filename}\"\r\n"
+        f"Content-Type: {mimetype}\r\n\r\n"
+    ).encode("utf-8") + data + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+class Replayer:
+    def __init__(self, args):
+        self.target = args.target.rstrip("/")
+        self.speed = args.speed
+        self.concurrency = args.concurrency
+        self.timeout = args.timeout
+        self.credentials = args.login.split(":", 1) if args.login else None
+        self.cookies = load_cookies(args.cookies) if args.cookies else []
+        self.uploads = self._upload_files(args.upload_dir)
+        self._upload_cycle = itertools.cycle(self.uploads) if self.uploads else None
+        self._openers = {}
+        self._session_locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _upload_files(directory):
+        if not directory or not os.path.isdir(directory):
+            return []
+        return [os.path.join(directory, name) for name in sorted(os.listdir(directory))
+                if name.lower().endswith((".png", ".jpg", ".jpeg", ".gif"))]
+
+    def _opener(self, session):
+        with self._lock:
+            opener = self._openers.get(session)
+            if opener is not None:
+                return opener
+            session_lock = self._session_locks.setdefault(session, threading.Lock())
+        # Other workers on the same session wait here, so none of them sends
+        # before the session's login has completed.
+        with session_lock:
+            with self._lock:
+                opener = self._openers.get(session)
+            if opener is not None:
+                return opener
+            jar = http.cookiejar.CookieJar(PlainHTTPCookiePolicy())
+            for cookie in self.cookies:
+                jar.set_cookie(cookie)
+            # Redirects are part of what is being measured, not followed.
+            opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar), NoRedirect())
+            if self.credentials:
+                email, password = self.credentials
+                self._send(opener, "POST", "/auth/api/login",
+                           json.dumps({"email": email, "password": password}).encode("utf-8"), "application/json")
+            with self._lock:
+                self._openers[session] = opener
+        return opener
+
+    def _body(self, request):
+        path = request.target.split("?", 1)[0]
+        if request.method != "POST":
+            return None, None
+        if path in LOGIN_PATHS and self.credentials:
+            email, password = self.credentials
+            if path == "/auth/api/login":
+                return json.dumps({"email": email, "password": password}).encode("utf-8"), "application/json"
+            return urllib.parse.urlencode({"email": email, "password": password}).encode("utf-8"), \
+                "application/x-www-form-urlencoded"
+        if path in UPLOAD_PATHS and self._upload_cycle:
+            with self._lock:
+                filename = next(self._upload_cycle)
+            with open(filename, "rb") as fp:
+                return multipart("file", os.path.basename(filename), fp.read())
+        return b"", "application/x-www-form-urlencoded"
+
+    def _send(self, opener, method, target, body=None, content_type=None):
+        request = urllib.request.Request(self.target + target, data=body, method=method)
+        if content_type:
+            request.add_header("Content-Type", content_type)
+        try:
+            with opener.open(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+        except (urllib.error.URLError, OSError):
+            return 0
+
+    def run(self, workload, repeat):
+        """Replays the workload ``repeat`` times; returns (results, wall-clock seconds)."""
+        span = (workload[-1].offset if workload else 0.0) + 1.0
+        jobs = queue.Queue()
+        for round_ in range(repeat):
+            for request in workload:
+                # Each round gets its own sessions, like a fresh set of users.
+                jobs.put(request._replace(offset=request.offset + round_ * span, session=(round_, request.session)))
+        results = []
+        started = time.perf_counter()
+
+        def worker():
+            while True:
+                try:
+                    request = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                due = started + request.offset / self.speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                opener = self._opener(request.session)
+                body, content_type = self._body(request)
+                sent = time.perf_counter()
+                status = self._send(opener, request.method, request.target, body, content_type)
+                results.append(Result(request.route, status, time.perf_counter() - sent, max(0.0, sent - due)))
+
+        threads = [threading.Thread(target=worker, daemon=True) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, time.perf_counter() - started
+
+
+class PlainHTTPCookiePolicy(http.cookiejar.DefaultCookiePolicy):
+    """Sends ``Secure`` cookies over plain HTTP too; the app sets them, and a local replay target has no TLS."""
+
+    def return_ok_secure(self, cookie, request):
+        return True
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def report(results, elapsed):
+    """Per-endpoint throughput and latency; returns the same figures as a dict."""
+    by_route = defaultdict(list)
+    for result in results:
+        by_route[result.route].append(result)
+
+    summary = {"elapsed_s": round(elapsed, 3), "requests": len(results),
+               "throughput_rps": round(len(results) / elapsed, 2) if elapsed else None, "endpoints": {}}
+    print(f"{'endpoint':<40} {'n':>6} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}  statuses")
+    for route, route_results in sorted(by_route.items(), key=lambda item: -len(item[1])):
+        ordered = sorted(r.seconds * 1000 for r in route_results)
+        statuses = Counter(r.status for r in route_results)
+        stats = {
+            "n": len(ordered),
+            "rps": round(len(ordered) / elapsed, 2),
+            "p50_ms": round(percentile(ordered, 50), 2),
+            "p90_ms": round(percentile(ordered, 90), 2),
+            "p99_ms": round(percentile(ordered, 99), 2),
+            "max_ms": round(ordered[-1], 2),
+            "statuses": {str(status): n for status, n in sorted(statuses.items())},
+        }
+        summary["endpoints"][route] = stats
+        print(f"{route:<40} {stats['n']:>6} {stats['rps']:>8.2f} {stats['p50_ms']:>8.2f} {stats['p90_ms']:>8.2f} "
+              f"{stats['p99_ms']:>8.2f} {stats['max_ms']:>8.2f}  "
+              + " ".join(f"{status or 'conn-error'}x{n}" for status, n in sorted(statuses.items())))
+
+    lags = sorted(r.lag * 1000 for r in results)
+    if lags:
+        summary["schedule_lag_p99_ms"] = round(percentile(lags, 99), 2)
+    print(f"\n{len(results)} requests in {elapsed:.2f}s ({summary['throughput_rps']} req/s); "
+          f"schedule lag p99 {summary.get('schedule_lag_p99_ms', 0):.2f}ms")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("logs", nargs="*", help="access logs (default: app.log and flask_log.txt)")
+    parser.add_argument("--target", default="http://127.0.0.1:5000")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay rate as a multiple of the captured rate")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1, help="replay the workload this many times back to back")
+    parser.add_argument("--max-gap", type=float, default=5.0, help="longest captured gap kept, in seconds")
+    parser.add_argument("--include-static", action="store_true", help="also replay /static/ and favicon requests")
+    parser.add_argument("--login", metavar="EMAIL:PASSWORD", help="log every session in first")
+    parser.add_argument("--cookies", help="Netscape cookies.txt to seed every session with")
+    parser.add_argument("--upload-dir", default=os.path.join(ROOT, "uploads"), help="images sent for /upload posts")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--describe", action="store_true", help="print the workload model and exit")
+    parser.add_argument("--output", help="write the report as JSON")
+    args = parser.parse_args()
+
+    paths = [path for path in (args.logs or DEFAULT_LOGS) if os.path.exists(path)]
+    events = list(parse_logs(paths))
+    workload = build_workload(events, args.max_gap, args.include_static)
+    if args.describe or not workload:
+        describe(workload)
+        return 0 if workload else 1
+
+    results, elapsed = Replayer(args).run(workload, args.repeat)
+    summary = report(results, elapsed)
+    if args.output:
+        summary["settings"] = {key: value for key, value in vars(args).items() if key != "login"}
+        with open(args.output, "w") as fp:
+            json.dump(summary, fp, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""
+Measures cold start of the app in each STARTUP_MODE.
+
+Every run is a fresh interpreter, so nothing is warm in ``sys.modules``. Each
+reports the time to import ``app``, to run ``create_app()``, to answer the
+first request (``/healthz``, then ``/readyz``, which is the first to touch the
+database in lazy mode), and the wall-clock time from spawning the process to
+the first response. Medians over ``--runs`` are printed per mode.
+
+    python benchmarks/startup_bench.py [--runs 7] [--database-uri sqlite:///...]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+client = application.test_client()
+assert client.get("/healthz").status_code == 200
+first_request = time.perf_counter()
+wall_first_response = time.time()
+assert client.get("/readyz").status_code == 200
+ready = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "first_request_ms": (first_request - created) * 1000,
+    "readyz_ms": (ready - first_request) * 1000,
+    "wall_first_response": wall_first_response,
+}}))
+"""
+
+COLUMNS = ("import_ms", "create_app_ms", "first_request_ms", "readyz_ms", "spawn_to_first_response_ms")
+
+
+def run_once(mode, env, cwd):
+    env = dict(env, STARTUP_MODE=mode)
+    spawned = time.time()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD.format(root=ROOT)],
+        env=env, cwd=cwd, capture_output=True, text=True, check=True
+    )
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["spawn_to_first_response_ms"] = (timings.pop("wall_first_response") - spawned) * 1000
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--database-uri", help="defaults to a temporary SQLite database")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            SQLALCHEMY_DATABASE_URI=args.database_uri or "sqlite:///" + os.path.join(tmp, "bench.db"),
+            UPLOAD_FOLDER=os.path.join(tmp, "uploads"),
+            RATELIMIT_STORAGE_URI="shm://" + os.path.join(tmp, "limits"),
+            OUTBOX_SENDER="off",
+        )
+        # Not timed: warms the OS page cache and compiles .pyc files.
+        run_once("eager", env, tmp)
+
+        print(f"{'mode':<8}" + "".join(f"{column:>30}" for column in COLUMNS))
+        for mode in ("eager", "lazy"):
+            runs = [run_once(mode, env, tmp) for _ in range(args.runs)]
+            medians = [statistics.median(run[column] for run in runs) for column in COLUMNS]
+            print(f"{mode:<8}" + "".join(f"{median:>28.1f}ms" for median in medians))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from models import db, User, Image, Blob
+from ingest import stage_file, register_staged
+from jobs import safe_extract
+from storage import UploadTooLarge
+from forms import MAX_UPLOAD_SIZE
+from utils import allowed_file
+
+
+def _walk_images(directory, allowed_extensions, exclude=()):
+    """
+    Yields image paths under ``directory`` in a stable order so checkpoints stay valid.
+
+    Directories in ``exclude`` (such as the thumbnail cache, which lives in the
+    upload folder by default) are not descended into.
+    """
+    excluded = {os.path.realpath(path) for path in exclude}
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(
+            d for d in dirs
+            if not d.startswith(".") and os.path.realpath(os.path.join(root, d)) not in excluded
+        )
+        for name in sorted(files):
+            if not name.startswith(".") and allowed_file(name, allowed_extensions):
+                yield os.path.join(root, name)
+
+
+def _default_checkpoint(directory, upload_folder):
+    key = hashlib.sha1(os.path.abspath(directory).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(upload_folder, f".ingest-{key}.checkpoint")
+
+
+def _load_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding="utf-8") as fp:
+        return {line.rstrip("\n") for line in fp if line.strip()}
+
+
+def _stage_or_error(file_path, upload_folder, max_size):
+    """Worker wrapper around ``stage_file`` that returns errors instead of raising."""
+    try:
+        return stage_file(file_path, upload_folder, max_size), None
+    except (UploadTooLarge, OSError) as e:
+        return None, str(e)
+
+
+@click.command("ingest")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option("--user", "user_email", required=True, help="Email of the user who will own the images.")
+@click.option("--workers", type=click.IntRange(min=1), default=None, help="Worker processes (default: EXTRACTION_WORKERS).")
+@click.option("--chunk-size", type=click.IntRange(min=1), default=200, show_default=True, help="Files committed per transaction.")
+@click.option("--checkpoint", type=click.Path(dir_okay=False), default=None,
+              help="Progress file used to resume an interrupted run.")
+@click.option("--include-registered", is_flag=True,
+              help="Also ingest files that existing images or blobs already point at.")
+@click.option("--remove-source", is_flag=True, help="Delete each source file once it is committed.")
+@with_appcontext
+def ingest_command(directory, user_email, workers, chunk_size, checkpoint, include_registered, remove_source):
+    """Register every image under DIRECTORY without going through HTTP."""
+    user = User.get_by_email(user_email)
+    if not user:
+        raise click.ClickException(f"No user with email {user_email}.")
+
+    upload_folder = current_app.config["UPLOAD_FOLDER"]
+    workers = workers or current_app.config["EXTRACTION_WORKERS"]
+    checkpoint = checkpoint or _default_checkpoint(directory, upload_folder)
+    done = _load_checkpoint(checkpoint)
+
+    registered = set()
+    if not include_registered:
+        registered.update(path for (path,) in db.session.query(Image.file_path))
+        registered.update(path for (path,) in db.session.query(Blob.file_path))
+
+    pending = [
+        path for path in _walk_images(
+            directory, current_app.config["ALLOWED_EXTENSIONS"], exclude=[current_app.config["THUMBNAIL_FOLDER"]]
+        )
+        if os.path.relpath(path, directory) not in done and path not in registered
+    ]
+    if done:
+        click.echo(f"Resuming from {checkpoint}: {len(done)} file(s) already ingested.")
+    click.echo(f"Ingesting {len(pending)} file(s) with {workers} worker(s).")
+
+    counts = {"created": 0, "deduplicated": 0, "error": 0}
+    started = time.monotonic()
+    processed = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool, open(checkpoint, "a", encoding="utf-8") as progress:
+        def extract_many(paths):
+            chunksize = max(1, len(paths) // (workers * 4))
+            return list(pool.map(safe_extract, paths, chunksize=chunksize))
+
+        for offset in range(0, len(pending), chunk_size):
+            chunk = pending[offset:offset + chunk_size]
+            stage = partial(_stage_or_error, upload_folder=upload_folder, max_size=MAX_UPLOAD_SIZE)
+            staged = []
+            for path, (outcome, error) in zip(chunk, pool.map(stage, chunk)):
+                if error:
+                    counts["error"] += 1
+                    click.echo(f"Skipping {path}: {error}", err=True)
+                    continue
+                tmp_path, digest, size = outcome
+                staged.append(({"name": path}, tmp_path, digest, size, path.rsplit(".", 1)[-1].lower()))
+
+            register_staged(staged, user.id, upload_folder, extract_many)
+
+            for result, *_ in staged:
+                counts[result["status"]] += 1
+                progress.write(os.path.relpath(result["name"], directory) + "\n")
+            progress.flush()
+            os.fsync(progress.fileno())
+
+            if remove_source:
+                for result, *_ in staged:
+                    # Never delete a source that is itself the stored blob.
+                    if not os.path.basename(result["name"]).startswith(result["sha256"]):
+                        os.remove(result["name"])
+
+            processed += len(chunk)
+            elapsed = time.monotonic() - started
+            click.echo(f"[{processed}/{len(pending)}] {processed / elapsed:.1f} files/sec")
+
+    elapsed = time.monotonic() - started
+    rate = processed / elapsed if elapsed else 0.0
+    click.echo(
+        f"Done: {counts['created']} created, {counts['deduplicated']} deduplicated, "
+        f"{counts['error']} failed in {elapsed:.1f}s ({rate:.1f} files/sec)."
+    )
+
+
+@click.command("send-outbox")
+@click.option("--loop", is_flag=True, help="Keep delivering until interrupted instead of draining once.")
+@with_appcontext
+def send_outbox_command(loop):
+    """Deliver queued email from the outbox."""
+    sender = current_app.extensions["outbox_sender"]
+    total = 0
+    while True:
+        delivered = sender.deliver_batch()
+        total += delivered
+        if not delivered:
+            if not loop:
+                break
+            time.sleep(current_app.config["OUTBOX_POLL_INTERVAL"])
+    click.echo(f"Processed {total} outbox email(s).")
+
+
+@click.command("profile-token")
+@with_appcontext
+def profile_token_command():
+    """Print a token that profiles requests sent with it as X-Profile-Token."""
+    profiler = current_app.extensions["request_profiler"]
+    if not current_app.config["PROFILING"]:
+        raise click.ClickException("Profiling is disabled: set PROFILING=true and a non-default SECRET_KEY.")
+    click.echo(profiler.make_token())
+    click.echo(
+        f"Valid for {current_app.config['PROFILE_TOKEN_MAX_AGE']}s; "
+        f"captures are written to {current_app.config['PROFILE_DIR']}.", err=True
+    )
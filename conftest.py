@@ -0,0 +1,75 @@
+"""
+Shared fixtures for ``python -m pytest``.
+
+test_mysql.py and test_registration.py are manual scripts that need a live
+MySQL server, so they are not collected.
+"""
+import pytest
+from flask import Flask
+from models import db, User
+
+
+PASSWORD = "Passw0rd!"
+
+
+collect_ignore = ["test_mysql.py", "test_registration.py"]
+
+
+@pytest.fixture
+def app(tmp_path):
+    """A minimal app on a file-backed SQLite database, inside an app context."""
+    upload_folder = tmp_path / "uploads"
+    upload_folder.mkdir()
+    app = Flask("image_meta_test")
+    app.config.update(
+        TESTING=True,
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'test.db'}",
+        UPLOAD_FOLDER=str(upload_folder),
+    )
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture
+def user_id(app):
+    user = User("owner@example.com", password_hash="unused")
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """A test client for the full ``create_app()`` on SQLite, logged in as owner@example.com."""
+    # app.py logs to ./app.log; keep that out of the working tree.
+    monkeypatch.chdir(tmp_path)
+    for name, value in {
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'app.db'}",
+        "UPLOAD_FOLDER": str(tmp_path / "uploads"),
+        "RATELIMIT_STORAGE_URI": f"shm://{tmp_path / 'limits'}",
+        "EXTRACTION_MODE": "sync",
+        "METADATA_CACHE_BACKEND": "memory",
+        "OUTBOX_SENDER": "off",
+        # The production scrypt cost dominates every test that logs in.
+        "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+    }.items():
+        monkeypatch.setenv(name, value)
+    from app import create_app
+
+    app = create_app()
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, SESSION_COOKIE_SECURE=False)
+    for limiter in app.extensions["limiter"]:
+        limiter.enabled = False
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+        credentials = {"email": "owner@example.com", "password": PASSWORD}
+        assert client.post("/auth/api/register", json=dict(credentials, confirm_password=PASSWORD)).status_code == 201
+        assert client.post("/auth/api/login", json=credentials).status_code == 200
+        yield client
+        db.session.remove()
+        db.drop_all()
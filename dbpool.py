@@ -0,0 +1,105 @@
+"""
+Database connection pool settings and live pool statistics.
+
+The engine uses ``TimedQueuePool``, a ``QueuePool`` that also records how long
+each checkout waited for a connection (including opening a new one), how many
+threads are waiting right now and how many gave up after ``pool_timeout``.
+Counters are per process and restart when the pool is recreated, e.g. after
+``engine.dispose()``.
+"""
+import threading
+import time
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    """``QueuePool`` that times each checkout."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.waiting = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        with self._stats_lock:
+            self.waiting += 1
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.waiting -= 1
+        with self._stats_lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return connection
+
+
+def engine_options(database_uri, pool_size, max_overflow, pool_timeout, pool_recycle, pool_pre_ping):
+    """
+    Builds ``SQLALCHEMY_ENGINE_OPTIONS`` for a database URI.
+
+    In-memory SQLite keeps Flask-SQLAlchemy's single shared connection, so only
+    ``pool_pre_ping`` applies to it.
+
+    Returns:
+        dict: Keyword arguments for ``create_engine``.
+    """
+    url = make_url(database_uri)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {"pool_pre_ping": pool_pre_ping}
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": pool_timeout,
+        # Reconnect before the server drops idle connections (MySQL wait_timeout).
+        "pool_recycle": pool_recycle,
+        "pool_pre_ping": pool_pre_ping,
+    }
+
+
+def pool_stats(engine):
+    """
+    Reports the engine's pool occupancy and, for a ``TimedQueuePool``, checkout wait times.
+
+    Returns:
+        dict: Pool statistics for this process.
+    """
+    pool = engine.pool
+    stats = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            # overflow() counts up from -size, so it is negative until the pool is full.
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout(),
+        })
+    if isinstance(pool, TimedQueuePool):
+        with pool._stats_lock:
+            waiting, checkouts, timeouts = pool.waiting, pool.checkouts, pool.timeouts
+            wait_total, wait_max = pool.wait_total, pool.wait_max
+        stats.update({
+            "waiting": waiting,
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "wait_seconds_total": round(wait_total, 6),
+            "wait_seconds_avg": round(wait_total / checkouts, 6) if checkouts else None,
+            "wait_seconds_max": round(wait_max, 6),
+        })
+    return stats
@@ -0,0 +1,84 @@
+"""
+Sending stored files with long-lived caching.
+
+Stored files never change once written: blobs are named after their SHA-256
+and derivatives after the blob, so every response carries a strong ETag derived
+from the name and is marked ``immutable``. Depending on ``FILE_DELIVERY`` the
+bytes are streamed by the worker (``direct``, with conditional GET and byte
+ranges) or handed off to the front proxy with ``X-Sendfile`` or
+``X-Accel-Redirect``.
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+from flask import current_app, request, send_file, abort, Response
+from werkzeug.security import safe_join
+
+
+DELIVERY_DIRECT = "direct"
+DELIVERY_X_SENDFILE = "x-sendfile"
+DELIVERY_X_ACCEL = "x-accel-redirect"
+
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+def init_app(app):
+    """Sets the delivery defaults, overridable from the environment."""
+    app.config.setdefault("FILE_DELIVERY", os.getenv("FILE_DELIVERY", DELIVERY_DIRECT))
+    app.config.setdefault("FILE_MAX_AGE", int(os.getenv("FILE_MAX_AGE", ONE_YEAR)))
+    # Internal nginx location that aliases X_ACCEL_REDIRECT_ROOT.
+    app.config.setdefault("X_ACCEL_REDIRECT_PREFIX", os.getenv("X_ACCEL_REDIRECT_PREFIX", "/protected-uploads/"))
+    app.config.setdefault("X_ACCEL_REDIRECT_ROOT", os.getenv("X_ACCEL_REDIRECT_ROOT", app.config["UPLOAD_FOLDER"]))
+    if app.config["FILE_DELIVERY"] not in (DELIVERY_DIRECT, DELIVERY_X_SENDFILE, DELIVERY_X_ACCEL):
+        raise ValueError(f"Unknown FILE_DELIVERY mode: {app.config['FILE_DELIVERY']}")
+
+
+def send_immutable(directory, filename, etag=None, mimetype=None):
+    """
+    Sends a stored file with a strong ETag and ``Cache-Control: immutable``.
+
+    Args:
+        directory (str): Directory the file must live in.
+        filename (str): Path of the file relative to ``directory``.
+        etag (str): Strong validator; defaults to the filename without extension.
+        mimetype (str): Content type; guessed from the filename if omitted.
+
+    Returns:
+        Response: 200/206 with the file, 304 if the client's copy is current,
+        or an empty response carrying the proxy offload header.
+    """
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    config = current_app.config
+    etag = etag or os.path.splitext(os.path.basename(filename))[0]
+    mimetype = mimetype or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    mode = config["FILE_DELIVERY"]
+
+    if mode == DELIVERY_DIRECT or (mode == DELIVERY_X_ACCEL and _accel_uri(path) is None):
+        # Werkzeug answers If-None-Match with 304 and Range with 206.
+        response = send_file(path, mimetype=mimetype, etag=etag, conditional=True, max_age=config["FILE_MAX_AGE"])
+    else:
+        response = Response(mimetype=mimetype)
+        response.set_etag(etag)
+        if request.if_none_match.contains(etag):
+            response.status_code = 304
+        elif mode == DELIVERY_X_SENDFILE:
+            response.headers["X-Sendfile"] = path
+        else:
+            response.headers["X-Accel-Redirect"] = _accel_uri(path)
+        response.cache_control.public = True
+        response.cache_control.max_age = config["FILE_MAX_AGE"]
+
+    response.cache_control.immutable = True
+    return response
+
+
+def _accel_uri(path):
+    """Maps a file path to the proxy's internal URI, or None if it is outside the aliased root."""
+    root = os.path.abspath(current_app.config["X_ACCEL_REDIRECT_ROOT"])
+    relative = os.path.relpath(os.path.abspath(path), root)
+    if relative.startswith(os.pardir):
+        return None
+    return current_app.config["X_ACCEL_REDIRECT_PREFIX"].rstrip("/") + "/" + quote(relative.replace(os.sep, "/"))
@@ -0,0 +1,281 @@
+"""
+Header-only EXIF/XMP reader for JPEG and PNG files.
+
+Walks JPEG APPn segments and PNG chunks, seeking past compressed image data
+instead of decoding it, and returns tags in the same shape as Pillow's
+``_getexif()`` (numeric tag ids, the Exif IFD merged into IFD0 and ``GPSInfo``
+as a nested dict) so ``utils.get_exif_data`` can use either source.
+"""
+import logging
+import struct
+import zlib
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on bytes read from any one file; metadata segments beyond it are ignored.
+MAX_HEADER_BYTES = 1024 * 1024
+
+EXIF_IFD_TAG = 0x8769
+GPS_IFD_TAG = 0x8825
+
+JPEG_SOI = b"\xff\xd8"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+EXIF_HEADER = b"Exif\x00\x00"
+XMP_HEADER = b"http://ns.adobe.com/xap/1.0/\x00"
+XMP_KEYWORD = "XML:com.adobe.xmp"
+RAW_EXIF_KEYWORD = "Raw profile type exif"
+
+# TIFF field type -> (size in bytes, struct code); ASCII/UNDEFINED/BYTE are handled as raw bytes.
+TIFF_TYPES = {
+    1: (1, None),   # BYTE
+    2: (1, None),   # ASCII
+    3: (2, "H"),    # SHORT
+    4: (4, "L"),    # LONG
+    5: (8, "L"),    # RATIONAL
+    6: (1, "b"),    # SBYTE
+    7: (1, None),   # UNDEFINED
+    8: (2, "h"),    # SSHORT
+    9: (4, "l"),    # SLONG
+    10: (8, "l"),   # SRATIONAL
+    11: (4, "f"),   # FLOAT
+    12: (8, "d"),   # DOUBLE
+    13: (4, "L"),   # IFD
+}
+
+
+class Rational(float):
+    """
+    A TIFF RATIONAL value.
+
+    Behaves as a float (and formats like Pillow's ``IFDRational``) while keeping
+    the numerator and denominator, which are also reachable as ``value[0]`` and
+    ``value[1]`` for code written against the legacy tuple representation.
+    """
+
+    def __new__(cls, numerator, denominator):
+        value = numerator / denominator if denominator else float("nan")
+        obj = super().__new__(cls, value)
+        obj.numerator = numerator
+        obj.denominator = denominator
+        return obj
+
+    def __getitem__(self, index):
+        return (self.numerator, self.denominator)[index]
+
+    def __getnewargs__(self):
+        return (self.numerator, self.denominator)
+
+
+class _BoundedReader:
+    """Wraps a file and refuses to read more than ``limit`` bytes in total."""
+
+    def __init__(self, fp, limit):
+        self.fp = fp
+        self.limit = limit
+        self.remaining = limit
+
+    def read(self, size):
+        if size > self.remaining:
+            raise EOFError("metadata read budget exhausted")
+        data = self.fp.read(size)
+        self.remaining -= len(data)
+        if len(data) < size:
+            raise EOFError("truncated file")
+        return data
+
+    def skip(self, size):
+        self.fp.seek(size, 1)
+
+
+def read_metadata(image_path, max_bytes=MAX_HEADER_BYTES):
+    """
+    Reads EXIF, XMP and text metadata from a JPEG or PNG without decoding pixels.
+
+    Args:
+        image_path (str): Path to the image file.
+        max_bytes (int): Maximum number of bytes read from the file.
+
+    Returns:
+        dict: Tags keyed like Pillow's ``_getexif()``, plus ``"XMP"`` and PNG text
+        keywords; empty if the file has no metadata. None if the format is not
+        supported and the caller should fall back to Pillow.
+    """
+    with open(image_path, "rb") as fp:
+        signature = fp.read(8)
+        fp.seek(0)
+        reader = _BoundedReader(fp, max_bytes)
+        if signature.startswith(JPEG_SOI):
+            return _read_jpeg(reader)
+        if signature == PNG_SIGNATURE:
+            return _read_png(reader)
+    return None
+
+
+def _read_jpeg(reader):
+    metadata = {}
+    reader.read(2)
+    try:
+        while True:
+            marker = reader.read(2)
+            while marker[0] != 0xFF or marker[1] == 0xFF:
+                # Skip fill bytes between segments.
+                marker = marker[1:] + reader.read(1)
+            code = marker[1]
+            if code == 0xD9 or code == 0xDA:
+                # EOI, or SOS: everything after is entropy-coded scan data.
+                break
+            if code == 0x01 or 0xD0 <= code <= 0xD7:
+                continue
+            length = struct.unpack(">H", reader.read(2))[0] - 2
+            if code == 0xE1:
+                segment = reader.read(length)
+                if segment.startswith(EXIF_HEADER) and not _has_exif(metadata):
+                    metadata.update(parse_tiff(segment[len(EXIF_HEADER):]))
+                elif segment.startswith(XMP_HEADER) and "XMP" not in metadata:
+                    metadata["XMP"] = segment[len(XMP_HEADER):].decode("utf-8", "replace")
+            else:
+                reader.skip(length)
+    except EOFError as e:
+        logger.debug(f"Stopped reading JPEG header: {e}")
+    return metadata
+
+
+def _read_png(reader):
+    metadata = {}
+    reader.read(8)
+    try:
+        while True:
+            length, chunk_type = struct.unpack(">I4s", reader.read(8))
+            if chunk_type == b"IEND":
+                break
+            if chunk_type == b"eXIf":
+                data = reader.read(length)
+                if data.startswith(EXIF_HEADER):
+                    data = data[len(EXIF_HEADER):]
+                metadata.update(parse_tiff(data))
+            elif chunk_type in (b"tEXt", b"zTXt", b"iTXt"):
+                keyword, text = _decode_text_chunk(chunk_type, reader.read(length), reader.limit)
+                if keyword == XMP_KEYWORD:
+                    metadata["XMP"] = text
+                elif keyword == RAW_EXIF_KEYWORD:
+                    if not _has_exif(metadata):
+                        metadata.update(parse_tiff(_decode_raw_profile(text)))
+                elif keyword:
+                    metadata[keyword] = text
+            else:
+                # IDAT and every other chunk: seek past the data, never read it.
+                reader.skip(length)
+            reader.skip(4)  # CRC
+    except EOFError as e:
+        logger.debug(f"Stopped reading PNG chunks: {e}")
+    return metadata
+
+
+def _has_exif(metadata):
+    return any(isinstance(key, int) for key in metadata)
+
+
+def _inflate(data, max_length):
+    """Decompresses a zlib stream, refusing to produce more than ``max_length`` bytes."""
+    decompressor = zlib.decompressobj()
+    text = decompressor.decompress(data, max_length)
+    if decompressor.unconsumed_tail:
+        raise zlib.error(f"decompresses to more than {max_length} bytes")
+    if not decompressor.eof:
+        raise zlib.error("incomplete or truncated stream")
+    return text
+
+
+def _decode_text_chunk(chunk_type, data, max_length):
+    keyword, _, rest = data.partition(b"\x00")
+    keyword = keyword.decode("latin-1")
+    try:
+        if chunk_type == b"tEXt":
+            return keyword, rest.decode("latin-1")
+        if chunk_type == b"zTXt":
+            return keyword, _inflate(rest[1:], max_length).decode("latin-1")
+        compressed, _method, rest = rest[0], rest[1], rest[2:]
+        _language, _, rest = rest.partition(b"\x00")
+        _translated, _, text = rest.partition(b"\x00")
+        if compressed:
+            text = _inflate(text, max_length)
+        return keyword, text.decode("utf-8", "replace")
+    except (zlib.error, IndexError, UnicodeDecodeError) as e:
+        logger.debug(f"Skipping malformed {chunk_type.decode()} chunk {keyword!r}: {e}")
+        return None, None
+
+
+def _decode_raw_profile(text):
+    """Decodes ImageMagick's hex-encoded 'Raw profile type exif' text."""
+    lines = text.strip().split("\n", 2)
+    data = bytes.fromhex("".join(lines[-1].split())) if lines else b""
+    return data[len(EXIF_HEADER):] if data.startswith(EXIF_HEADER) else data
+
+
+def parse_tiff(data):
+    """
+    Parses a TIFF-structured EXIF block.
+
+    Args:
+        data (bytes): The block, starting at the TIFF byte-order mark.
+
+    Returns:
+        dict: IFD0 tags with the Exif IFD merged in and the GPS IFD nested under
+        tag 0x8825, matching Pillow's ``_getexif()`` layout.
+    """
+    if data[:2] == b"II":
+        endian = "<"
+    elif data[:2] == b"MM":
+        endian = ">"
+    else:
+        return {}
+    try:
+        offset = struct.unpack(endian + "L", data[4:8])[0]
+        tags = _parse_ifd(data, offset, endian)
+        if EXIF_IFD_TAG in tags:
+            tags.update(_parse_ifd(data, tags[EXIF_IFD_TAG], endian))
+        if GPS_IFD_TAG in tags:
+            tags[GPS_IFD_TAG] = _parse_ifd(data, tags[GPS_IFD_TAG], endian)
+        return tags
+    except (struct.error, TypeError, ValueError) as e:
+        logger.debug(f"Malformed TIFF block: {e}")
+        return {}
+
+
+def _parse_ifd(data, offset, endian):
+    tags = {}
+    if not isinstance(offset, int) or offset + 2 > len(data):
+        return tags
+    count = struct.unpack(endian + "H", data[offset:offset + 2])[0]
+    for index in range(count):
+        entry = offset + 2 + index * 12
+        if entry + 12 > len(data):
+            break
+        tag, field_type, value_count = struct.unpack(endian + "HHL", data[entry:entry + 8])
+        if field_type not in TIFF_TYPES:
+            continue
+        size = TIFF_TYPES[field_type][0] * value_count
+        if size <= 4:
+            raw = data[entry + 8:entry + 8 + size]
+        else:
+            value_offset = struct.unpack(endian + "L", data[entry + 8:entry + 12])[0]
+            raw = data[value_offset:value_offset + size]
+        if len(raw) < size:
+            continue
+        tags[tag] = _decode_value(raw, field_type, value_count, endian)
+    return tags
+
+
+def _decode_value(raw, field_type, count, endian):
+    if field_type == 2:
+        return raw.split(b"\x00", 1)[0].decode("utf-8", "replace")
+    if field_type in (1, 7):
+        return raw
+    code = TIFF_TYPES[field_type][1]
+    if field_type in (5, 10):
+        numbers = struct.unpack(f"{endian}{count * 2}{code}", raw)
+        values = tuple(Rational(numbers[i], numbers[i + 1]) for i in range(0, len(numbers), 2))
+    else:
+        values = struct.unpack(f"{endian}{count}{code}", raw)
+    return values[0] if len(values) == 1 else values
@@ -1,21 +1,20 @@
+import os
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed
 from wtforms import StringField, PasswordField, SubmitField, BooleanField
 from wtforms.validators import DataRequired, Length, Email, EqualTo, ValidationError
 from models import User
 
+
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024
+
 class RegistrationForm(FlaskForm):
     """User Registration Form"""
     email = StringField("Email", validators=[DataRequired(), Email(), Length(max=120)])
     password = PasswordField("Password", validators=[DataRequired(), Length(min=6)])
     confirm_password = PasswordField("Confirm Password", validators=[DataRequired(), EqualTo("password")])
     submit = SubmitField("Register")
-
-    def validate_email(self, email):
-        """Custom validator to check if the email already exists."""
-        user = User.query.filter_by(email=email.data).first()
-        if user:
-            raise ValidationError("Email is already registered. Please use a different one.")
+    # Duplicate emails are rejected by the unique constraint when the user is inserted.
 
 class LoginForm(FlaskForm):
     """User Login Form"""
@@ -37,11 +36,14 @@ class UploadForm(FlaskForm):
         if not file.data:
             raise ValidationError("No file selected. Please choose an image.")
 
-        file_data = file.data.read()
-        if len(file_data) > 10 * 1024 * 1024:  
-            raise ValidationError("File is too large. Maximum size is 10MB.")
-        
-        file.data.seek(0)  
+        # Measure the spooled upload without reading it; the streaming save
+        # enforces the same limit for streams that cannot seek.
+        stream = file.data.stream
+        if stream.seekable():
+            size = stream.seek(0, os.SEEK_END)
+            stream.seek(0)
+            if size > MAX_UPLOAD_SIZE:
+                raise ValidationError("File is too large. Maximum size is 10MB.")
 
 class ResetPasswordForm(FlaskForm):
     """Password Reset Request Form"""
@@ -49,9 +51,9 @@ class ResetPasswordForm(FlaskForm):
     submit = SubmitField("Request Password Reset")
 
     def validate_email(self, email):
-        """Custom validator to check if the email exists."""
-        user = User.query.filter_by(email=email.data).first()
-        if not user:
+        """Custom validator to check if the email exists; keeps the user for the view."""
+        self.user = User.get_by_email(email.data)
+        if not self.user:
             raise ValidationError("Email not found. Please check your email address.")
 
 class ResetPasswordConfirmForm(FlaskForm):
@@ -0,0 +1,143 @@
+"""
+Geohash encoding and bounding-box covers for indexed location queries.
+
+Images store the geohash of their GPS position, so a spatial query becomes a
+handful of prefix range scans on the ``(user_id, geohash)`` index followed by an
+exact latitude/longitude check.
+"""
+import math
+
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 12
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = 111320.0
+
+# Upper bound on prefixes per query; more cells means tighter but more range scans.
+MAX_COVER_CELLS = 16
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """
+    Encodes a position as a geohash.
+
+    Args:
+        latitude (float): Latitude in decimal degrees.
+        longitude (float): Longitude in decimal degrees.
+        precision (int): Number of characters.
+
+    Returns:
+        str: The geohash, or None if either coordinate is missing.
+    """
+    if latitude is None or longitude is None:
+        return None
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        if coordinate >= middle:
+            value = (value << 1) | 1
+            interval[0] = middle
+        else:
+            value <<= 1
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision):
+    """Returns the (latitude, longitude) size in degrees of a geohash cell."""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def _cells(min_lat, min_lon, max_lat, max_lon, precision):
+    lat_step, lon_step = cell_size(precision)
+    rows = range(int((min_lat + 90) // lat_step), int(min((max_lat + 90) // lat_step, 180 / lat_step - 1)) + 1)
+    cols = range(int((min_lon + 180) // lon_step), int(min((max_lon + 180) // lon_step, 360 / lon_step - 1)) + 1)
+    return rows, cols, lat_step, lon_step
+
+
+def cover(min_lat, min_lon, max_lat, max_lon, max_cells=MAX_COVER_CELLS):
+    """
+    Returns geohash prefixes whose cells together cover a bounding box.
+
+    The longest prefix length that needs at most ``max_cells`` cells is used.
+    Boxes crossing the antimeridian (``min_lon > max_lon``) are split in two.
+
+    Args:
+        min_lat (float): Southern edge.
+        min_lon (float): Western edge.
+        max_lat (float): Northern edge.
+        max_lon (float): Eastern edge.
+        max_cells (int): Maximum number of prefixes per half of the box.
+
+    Returns:
+        list: Sorted, de-duplicated geohash prefixes.
+    """
+    if min_lon > max_lon:
+        return sorted(set(cover(min_lat, min_lon, max_lat, 180.0, max_cells)) |
+                      set(cover(min_lat, -180.0, max_lat, max_lon, max_cells)))
+
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        rows, cols, lat_step, lon_step = _cells(min_lat, min_lon, max_lat, max_lon, precision)
+        if len(rows) * len(cols) <= max_cells:
+            break
+    else:
+        rows, cols, lat_step, lon_step = _cells(min_lat, min_lon, max_lat, max_lon, 1)
+        precision = 1
+
+    return sorted({
+        encode(-90 + (row + 0.5) * lat_step, -180 + (col + 0.5) * lon_step, precision)
+        for row in rows for col in cols
+    })
+
+
+def prefix_upper_bound(prefix):
+    """
+    Returns the next prefix of the same length, an exclusive upper bound on every geohash starting with ``prefix``.
+
+    The bound is built from geohash characters only, so the range stays correct
+    under any collation that orders digits before letters (binary, and the
+    case-insensitive MySQL defaults), unlike a sentinel such as ``'{'``.
+
+    Returns:
+        str: The bound, or None if ``prefix`` is all ``'z'`` and has no upper bound.
+    """
+    stripped = prefix.rstrip(BASE32[-1])
+    if not stripped:
+        return None
+    return stripped[:-1] + BASE32[BASE32.index(stripped[-1]) + 1]
+
+
+def radius_bbox(latitude, longitude, radius_m):
+    """
+    Returns the bounding box (min_lat, min_lon, max_lat, max_lon) of a circle.
+
+    Longitudes may wrap, giving ``min_lon > max_lon`` across the antimeridian.
+    """
+    dlat = radius_m / METERS_PER_DEGREE
+    min_lat, max_lat = max(latitude - dlat, -90.0), min(latitude + dlat, 90.0)
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat < 1e-9 or radius_m / (METERS_PER_DEGREE * cos_lat) >= 180:
+        return min_lat, -180.0, max_lat, 180.0
+    dlon = radius_m / (METERS_PER_DEGREE * cos_lat)
+    min_lon = (longitude - dlon + 180) % 360 - 180
+    max_lon = (longitude + dlon + 180) % 360 - 180
+    return min_lat, min_lon, max_lat, max_lon
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Returns the great-circle distance in meters between two positions."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
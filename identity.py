@@ -0,0 +1,75 @@
+"""
+Per-process caches for the authentication hot paths.
+
+``load_user`` runs on every authenticated request but only needs the user's
+id, so it returns a small snapshot cached for ``USER_CACHE_TTL`` seconds
+instead of querying the users table. Snapshots hold no credentials; a stale
+one in another worker cannot outlive its TTL. Password resets invalidate the
+entry in the worker that performed them.
+
+Whether any user exists only ever changes from False to True (users are never
+deleted), so once seen it is remembered for the life of the process.
+"""
+import os
+from flask_login import UserMixin
+from metadata_cache import MemoryBackend
+from models import db, User
+
+
+class SessionUser(UserMixin):
+    """The identity Flask-Login needs for a request, detached from any database session."""
+
+    def __init__(self, id, email):
+        self.id = id
+        self.email = email
+
+    def __repr__(self):
+        return f"<SessionUser {self.email}>"
+
+
+class IdentityCache:
+    def __init__(self, app=None):
+        self.users = None
+        self._users_exist = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("USER_CACHE_SIZE", int(os.getenv("USER_CACHE_SIZE", 4096)))
+        app.config.setdefault("USER_CACHE_TTL", int(os.getenv("USER_CACHE_TTL", 300)))
+        self.users = MemoryBackend(app.config["USER_CACHE_SIZE"], app.config["USER_CACHE_TTL"])
+        app.extensions["identity_cache"] = self
+
+    def load_user(self, user_id):
+        """Flask-Login user loader; queries the database only on a cache miss."""
+        user_id = int(user_id)
+        user = self.users.get(user_id)
+        if user is None:
+            row = db.session.query(User.id, User.email).filter(User.id == user_id).first()
+            if row is None:
+                return None
+            user = self.remember(row)
+        return user
+
+    def remember(self, user):
+        """Caches the identity of a user that was just loaded or logged in."""
+        snapshot = SessionUser(user.id, user.email)
+        self.users.set(user.id, snapshot)
+        self._users_exist = True
+        return snapshot
+
+    def invalidate(self, user_id):
+        """Drops a cached identity; call after changing the user's credentials."""
+        self.users.delete([int(user_id)])
+
+    def users_exist(self):
+        """Returns whether any user is registered, querying until the first one is seen."""
+        if not self._users_exist:
+            self._users_exist = db.session.query(User.id).limit(1).first() is not None
+        return self._users_exist
+
+    def mark_users_exist(self):
+        self._users_exist = True
+
+
+identity_cache = IdentityCache()
@@ -0,0 +1,456 @@
+import logging
+import os
+import time
+import zipfile
+from collections import Counter
+from werkzeug.utils import secure_filename
+from sqlalchemy.exc import IntegrityError
+from models import db, Image, Blob, promote_metadata, EXTRACTION_PENDING, EXTRACTION_DONE, EXTRACTION_FAILED
+from storage import stream_to_temp, blob_filename, discard, UploadTooLarge
+from utils import extract_metadata, get_lat_lon, allowed_file
+from metadata_cache import metadata_cache
+import metrics
+from stages import stage
+
+
+logger = logging.getLogger(__name__)
+
+
+def attach_blob(blob, user_id):
+    """
+    Creates an Image for ``user_id`` that points at an existing blob.
+
+    The blob's stored metadata document is copied onto the image, so EXIF
+    extraction does not run again. The caller commits.
+
+    Args:
+        blob (Blob): The content-addressed blob.
+        user_id (int): Owner of the new image.
+
+    Returns:
+        Image: The new (flushed) image.
+    """
+    image = Image(
+        user_id=user_id,
+        filename=blob.filename,
+        file_path=blob.file_path,
+        latitude=blob.latitude,
+        longitude=blob.longitude,
+        content_hash=blob.sha256
+    )
+    image.copy_metadata(blob)
+    blob.acquire()
+    db.session.add(image)
+    db.session.flush()
+    return image
+
+
+def discard_unreferenced(file_path):
+    """
+    Removes a blob file moved into place by a failed transaction, unless a committed blob points at it.
+
+    Blob paths are shared by every upload of the same bytes, so a concurrent
+    upload may have committed a row for the file this transaction renamed
+    over. If the check itself fails the file is kept: an orphaned file is
+    reused by the next upload of those bytes, a blob row without one is not.
+
+    Args:
+        file_path (str): Path of the blob file.
+
+    Returns:
+        bool: True if the file was removed.
+    """
+    try:
+        referenced = db.session.query(Blob.sha256).filter_by(file_path=file_path).first() is not None
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Keeping {file_path}: could not check for a blob referencing it: {e}")
+        return False
+    if referenced:
+        return False
+    discard(file_path)
+    return True
+
+
+def extract_for_storage(file_path):
+    """
+    Extracts metadata in the form stored on a blob.
+
+    Runs in extraction worker processes, so it only returns picklable values.
+
+    Args:
+        file_path (str): Path to the stored file.
+
+    Returns:
+        tuple: A tuple containing (metadata dict of strings, latitude, longitude).
+    """
+    with stage("extract"):
+        metadata = extract_metadata(file_path) or {}
+    with stage("geo"):
+        latitude, longitude = get_lat_lon(metadata)
+    return {key: str(value) for key, value in metadata.items()}, latitude, longitude
+
+
+def complete_extraction(digest, result):
+    """
+    Stores the result of a deferred extraction on the blob and its images.
+
+    Args:
+        digest (str): SHA-256 of the blob.
+        result (tuple): Return value of ``extract_for_storage``, or None if it failed.
+    """
+    blob = Blob.get_by_hash(digest)
+    if not blob or blob.extraction_status != EXTRACTION_PENDING:
+        return
+
+    try:
+        if result is None:
+            blob.extraction_status = EXTRACTION_FAILED
+        else:
+            metadata, latitude, longitude = result
+            blob.set_metadata(metadata)
+            blob.latitude = latitude
+            blob.longitude = longitude
+            blob.extraction_status = EXTRACTION_DONE
+
+            promoted = promote_metadata(metadata)
+            for image in blob.images:
+                image.set_location(latitude, longitude)
+                image.copy_metadata(blob, promoted)
+        db.session.commit()
+        metadata_cache.invalidate(*(image.id for image in blob.images))
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def ingest_stream(stream, original_filename, user_id, upload_folder, max_size=None, defer_extraction=False):
+    """
+    Stores an uploaded stream in the content-addressed store and registers it.
+
+    Identical bytes are stored once: if a blob with the same SHA-256 already
+    exists the temporary copy is dropped and its metadata is reused.
+
+    Args:
+        stream: A readable binary file-like object.
+        original_filename (str): Client-supplied filename, used for the extension.
+        user_id (int): Owner of the new image.
+        upload_folder (str): Directory holding the blobs.
+        max_size (int): Maximum number of bytes accepted, or None for no limit.
+        defer_extraction (bool): Register a new blob as pending instead of
+            extracting its metadata inline; the caller submits the extraction job.
+
+    Returns:
+        Image: The committed image.
+
+    Raises:
+        UploadTooLarge: If the stream is larger than ``max_size``.
+    """
+    file_ext = original_filename.rsplit(".", 1)[-1].lower()
+    with stage("save"):
+        tmp_path, digest, size = stream_to_temp(stream, upload_folder, max_size)
+    metrics.UPLOAD_BYTES.inc(amount=size)
+
+    new_path = None
+    try:
+        with stage("dedup"):
+            blob = Blob.get_by_hash(digest)
+        if blob:
+            discard(tmp_path)
+            logger.info(f"Deduplicated upload {original_filename} onto blob {digest}.")
+        else:
+            filename = secure_filename(blob_filename(digest, file_ext))
+            new_path = os.path.join(upload_folder, filename)
+            with stage("store"):
+                os.replace(tmp_path, new_path)
+
+            if defer_extraction:
+                metadata, latitude, longitude = {}, None, None
+                status = EXTRACTION_PENDING
+            else:
+                started = time.perf_counter()
+                metadata, latitude, longitude = result = extract_for_storage(new_path)
+                metrics.record_extraction(result, time.perf_counter() - started)
+                status = EXTRACTION_DONE
+            blob = Blob(
+                sha256=digest,
+                filename=filename,
+                file_path=new_path,
+                size=size,
+                metadata=metadata,
+                latitude=latitude,
+                longitude=longitude,
+                extraction_status=status
+            )
+            db.session.add(blob)
+
+        with stage("flush"):
+            image = attach_blob(blob, user_id)
+        with stage("commit"):
+            db.session.commit()
+        return image
+
+    except IntegrityError:
+        # A concurrent upload of the same bytes created the blob first; both
+        # requests renamed identical content onto the same path.
+        db.session.rollback()
+        blob = Blob.get_by_hash(digest)
+        if new_path and (not blob or blob.file_path != new_path):
+            discard_unreferenced(new_path)
+        if not blob:
+            raise
+        image = attach_blob(blob, user_id)
+        db.session.commit()
+        return image
+
+    except BaseException:
+        db.session.rollback()
+        discard(tmp_path)
+        if new_path:
+            discard_unreferenced(new_path)
+        raise
+
+
+def iter_batch_entries(files):
+    """
+    Yields every image in a batch upload, streaming ZIP members in place.
+
+    Archives are read through their central directory and each member is
+    decompressed as it is consumed, so nothing is unpacked into memory. Each
+    stream is only valid until the next item is requested.
+
+    Args:
+        files (list): Uploaded ``FileStorage`` objects; ZIP archives are expanded.
+
+    Yields:
+        tuple: A tuple containing (entry name, readable binary stream).
+    """
+    for file in files:
+        if not file or not file.filename:
+            continue
+        if file.filename.lower().endswith(".zip") or zipfile.is_zipfile(file.stream):
+            file.stream.seek(0)
+            with zipfile.ZipFile(file.stream) as archive:
+                for info in archive.infolist():
+                    if info.is_dir() or os.path.basename(info.filename).startswith("."):
+                        continue
+                    with archive.open(info) as member:
+                        yield f"{file.filename}/{info.filename}", member
+        else:
+            file.stream.seek(0)
+            yield file.filename, file.stream
+
+
+def stage_file(file_path, upload_folder, max_size=None):
+    """
+    Copies a file into a temporary file in the store, hashing it on the way.
+
+    Runs in worker processes for bulk ingest.
+
+    Args:
+        file_path (str): Source file.
+        upload_folder (str): Directory holding the blobs.
+        max_size (int): Maximum number of bytes accepted, or None for no limit.
+
+    Returns:
+        tuple: A tuple containing (temporary path, sha256 hex digest, size in bytes).
+    """
+    with open(file_path, "rb") as fp:
+        return stream_to_temp(fp, upload_folder, max_size)
+
+
+def ingest_batch(entries, user_id, upload_folder, allowed_extensions, extract_many, max_size=None, max_files=None):
+    """
+    Stores and registers many images with parallel extraction and bulk inserts.
+
+    Every entry is streamed to disk and hashed first, then handed to
+    ``register_staged``.
+
+    Args:
+        entries: Iterable of (name, stream) pairs, e.g. from ``iter_batch_entries``.
+        user_id (int): Owner of the new images.
+        upload_folder (str): Directory holding the blobs.
+        allowed_extensions (set): Accepted file extensions.
+        extract_many (callable): Maps a list of paths to ``extract_for_storage``
+            results (None for failures), e.g. ``ExtractionQueue.map``.
+        max_size (int): Maximum size of each entry, or None for no limit.
+        max_files (int): Maximum number of entries accepted, or None for no limit.
+
+    Returns:
+        list: One result dict per entry, in input order.
+    """
+    manifest = []
+    staged = []
+    try:
+        for name, stream in entries:
+            result = {"name": name}
+            manifest.append(result)
+            if max_files is not None and len(manifest) > max_files:
+                result.update(status="error", message=f"Batch limit of {max_files} files reached")
+                continue
+            if not allowed_file(name, allowed_extensions):
+                result.update(status="error", message="Invalid file format")
+                continue
+            try:
+                with stage("save"):
+                    tmp_path, digest, size = stream_to_temp(stream, upload_folder, max_size)
+            except (UploadTooLarge, zipfile.BadZipFile, OSError) as e:
+                result.update(status="error", message=str(e))
+                continue
+            metrics.UPLOAD_BYTES.inc(amount=size)
+            staged.append((result, tmp_path, digest, size, name.rsplit(".", 1)[-1].lower()))
+    except BaseException:
+        for _, tmp_path, *_ in staged:
+            discard(tmp_path)
+        raise
+
+    register_staged(staged, user_id, upload_folder, extract_many)
+    logger.info(f"Batch upload for user {user_id}: {len(staged)} of {len(manifest)} files stored.")
+    return manifest
+
+
+def register_staged(staged, user_id, upload_folder, extract_many):
+    """
+    Registers staged files as images in one transaction.
+
+    Blobs that already exist (or repeat within ``staged``) are reused and their
+    temporary copies dropped; new blobs are moved into place and extracted
+    together through ``extract_many``. Blobs and images (each carrying its
+    metadata document) are written with executemany inserts and committed once.
+    If a concurrent upload commits one of the new blobs first, the transaction
+    is retried once with that blob reused.
+
+    Args:
+        staged (list): Tuples of (result dict, temporary path, digest, size, file
+            extension); each result dict is updated in place with the outcome.
+        user_id (int): Owner of the new images.
+        upload_folder (str): Directory holding the blobs.
+        extract_many (callable): Maps a list of paths to ``extract_for_storage`` results.
+    """
+    new_blobs = {}
+    try:
+        digests = {digest for _, _, digest, _, _ in staged}
+        with stage("dedup"):
+            existing = _existing_blobs(digests)
+
+        for result, tmp_path, digest, size, file_ext in staged:
+            result["sha256"] = digest
+            if digest in existing or digest in new_blobs:
+                discard(tmp_path)
+                result["status"] = "deduplicated"
+                continue
+            filename = secure_filename(blob_filename(digest, file_ext))
+            file_path = os.path.join(upload_folder, filename)
+            with stage("store"):
+                os.replace(tmp_path, file_path)
+            new_blobs[digest] = (filename, file_path, size)
+            result["status"] = "created"
+
+        with stage("extract"):
+            extracted = dict(zip(new_blobs, extract_many([file_path for _, file_path, _ in new_blobs.values()])))
+
+        try:
+            _insert_staged(staged, user_id, existing, new_blobs, extracted)
+        except IntegrityError:
+            # A concurrent upload committed some of the same bytes between the
+            # dedup query and the flush; reuse its blobs.
+            db.session.rollback()
+            existing = _existing_blobs(digests)
+            for digest in new_blobs.keys() & existing.keys():
+                _, file_path, _ = new_blobs.pop(digest)
+                if existing[digest].file_path != file_path:
+                    discard_unreferenced(file_path)
+            for result, *_ in staged:
+                if result["sha256"] in existing:
+                    result["status"] = "deduplicated"
+            _insert_staged(staged, user_id, existing, new_blobs, extracted)
+
+    except BaseException:
+        db.session.rollback()
+        for _, tmp_path, *_ in staged:
+            discard(tmp_path)
+        for _, file_path, _ in new_blobs.values():
+            discard_unreferenced(file_path)
+        raise
+
+
+def _existing_blobs(digests):
+    return {blob.sha256: blob for blob in Blob.query.filter(Blob.sha256.in_(digests))} if digests else {}
+
+
+def _insert_staged(staged, user_id, existing, new_blobs, extracted):
+    """Writes the blobs and images for ``register_staged`` and commits them."""
+    blobs = dict(existing)
+    for digest, (filename, file_path, size) in new_blobs.items():
+        outcome = extracted[digest]
+        metadata, latitude, longitude = outcome or ({}, None, None)
+        blobs[digest] = Blob(
+            sha256=digest,
+            filename=filename,
+            file_path=file_path,
+            size=size,
+            metadata=metadata,
+            latitude=latitude,
+            longitude=longitude,
+            extraction_status=EXTRACTION_DONE if outcome else EXTRACTION_FAILED
+        )
+
+    references = Counter(result["sha256"] for result, *_ in staged)
+    for digest, count in references.items():
+        blob = blobs[digest]
+        if digest in existing:
+            blob.ref_count = Blob.ref_count + count
+        else:
+            blob.ref_count = count
+            db.session.add(blob)
+
+    metadata_by_digest = {digest: blob.get_metadata() for digest, blob in blobs.items()}
+    promoted = {digest: promote_metadata(metadata) for digest, metadata in metadata_by_digest.items()}
+    images = []
+    for result, *_ in staged:
+        blob = blobs[result["sha256"]]
+        image = Image(
+            user_id=user_id,
+            filename=blob.filename,
+            file_path=blob.file_path,
+            latitude=blob.latitude,
+            longitude=blob.longitude,
+            content_hash=blob.sha256
+        )
+        image.copy_metadata(blob, promoted[blob.sha256])
+        images.append(image)
+    with stage("flush"):
+        db.session.add_all(images)
+        db.session.flush()
+
+    for (result, *_), image in zip(staged, images):
+        result.update(image_id=image.id, metadata_keys=len(metadata_by_digest[result["sha256"]]))
+    with stage("commit"):
+        db.session.commit()
+
+
+def delete_image(image):
+    """
+    Deletes an image and releases its blob, removing the file on the last reference.
+
+    Args:
+        image (Image): The image to delete.
+
+    Returns:
+        bool: True if the stored file was removed.
+    """
+    blob = image.blob
+    file_path = image.file_path
+    image_id = image.id
+    db.session.delete(image)
+    if blob:
+        orphaned = blob.release()
+    else:
+        # Images uploaded before the content-addressed store own their file.
+        orphaned = True
+    db.session.commit()
+    metadata_cache.invalidate(image_id)
+    if orphaned:
+        discard(file_path)
+        logger.info(f"Removed unreferenced file {file_path}.")
+    return orphaned
@@ -0,0 +1,214 @@
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, BrokenExecutor
+from functools import partial
+from ingest import extract_for_storage, complete_extraction
+from models import Blob, EXTRACTION_PENDING
+import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionQueue:
+    """
+    Runs metadata extraction on a bounded process pool, off the request path.
+
+    Jobs are keyed by blob digest, so concurrent uploads of the same bytes share
+    one job. When ``EXTRACTION_MAX_PENDING`` jobs are already in flight a new
+    blob is left pending rather than queued: the queue stays bounded, the upload
+    does not wait for extraction, and the blob is picked up from the database as
+    running jobs finish (or by ``flask requeue-extractions``). With
+    ``EXTRACTION_MODE = "sync"`` every job runs inline.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._in_flight = set()
+        # Set when a blob was left pending because the backlog was full.
+        self._backlogged = False
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("EXTRACTION_MODE", os.getenv("EXTRACTION_MODE", "async"))
+        app.config.setdefault("EXTRACTION_WORKERS", int(os.getenv("EXTRACTION_WORKERS", os.cpu_count() or 1)))
+        app.config.setdefault("EXTRACTION_MAX_PENDING", int(os.getenv("EXTRACTION_MAX_PENDING", 64)))
+        app.extensions["extraction_queue"] = self
+        self.app = app
+
+    @property
+    def is_async(self):
+        return self.app is not None and self.app.config["EXTRACTION_MODE"] == "async"
+
+    def _get_executor(self):
+        # Created on first use so preforking servers don't fork a pool per import.
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.app.config["EXTRACTION_WORKERS"])
+        return self._executor
+
+    def submit(self, digest, file_path):
+        """
+        Schedules extraction for a pending blob.
+
+        Args:
+            digest (str): SHA-256 of the blob, which doubles as the job id.
+            file_path (str): Path to the stored file.
+
+        Returns:
+            bool: False if the job could not be queued and the blob was left
+            pending for the next drain.
+        """
+        if not self.is_async:
+            self._run_inline(digest, file_path)
+            return True
+
+        with self._lock:
+            if digest in self._in_flight:
+                return True
+            if len(self._in_flight) >= self.app.config["EXTRACTION_MAX_PENDING"]:
+                self._backlogged = True
+                logger.warning(f"Extraction backlog is full; {digest} stays pending until a job finishes.")
+                return False
+            self._in_flight.add(digest)
+
+        try:
+            future = self._get_executor().submit(timed_extract, file_path)
+        except Exception as e:
+            logger.error(f"Could not queue extraction for {digest}; it stays pending: {e}")
+            if isinstance(e, BrokenExecutor):
+                self._executor = None
+            with self._lock:
+                self._in_flight.discard(digest)
+                self._backlogged = True
+            return False
+        future.add_done_callback(partial(self._on_done, digest))
+        return True
+
+    def _run_inline(self, digest, file_path):
+        result, elapsed = timed_extract(file_path)
+        metrics.record_extraction(result, elapsed)
+        complete_extraction(digest, result)
+
+    def _on_done(self, digest, future):
+        try:
+            result, elapsed = future.result()
+            metrics.record_extraction(result, elapsed)
+        except Exception as e:
+            # The worker process died; timed_extract itself never raises.
+            logger.error(f"Metadata extraction failed for {digest}: {e}")
+            result = None
+
+        try:
+            with self.app.app_context():
+                complete_extraction(digest, result)
+        except Exception as e:
+            logger.error(f"Could not store extracted metadata for {digest}: {e}")
+        finally:
+            with self._lock:
+                self._in_flight.discard(digest)
+
+        try:
+            self._drain()
+        except Exception as e:
+            logger.error(f"Could not queue pending extractions: {e}")
+
+    def _drain(self):
+        """Queues blobs left pending while the backlog was full, as far as there is room."""
+        with self._lock:
+            room = self.app.config["EXTRACTION_MAX_PENDING"] - len(self._in_flight)
+            if not self._backlogged or room <= 0:
+                return
+            self._backlogged = False
+            queued = set(self._in_flight)
+
+        with self.app.app_context():
+            pending = [
+                (blob.sha256, blob.file_path)
+                for blob in Blob.query.filter(
+                    Blob.extraction_status == EXTRACTION_PENDING, Blob.sha256.notin_(queued)
+                ).order_by(Blob.created_at).limit(room)
+            ]
+        for digest, file_path in pending:
+            self.submit(digest, file_path)
+        if len(pending) == room:
+            # There may be more; look again when the next job finishes.
+            with self._lock:
+                self._backlogged = True
+
+    def map(self, file_paths):
+        """
+        Extracts metadata for many files in parallel and waits for all of them.
+
+        Args:
+            file_paths (list): Paths to the stored files.
+
+        Returns:
+            list: ``extract_for_storage`` results in input order, with None for
+            files whose extraction failed.
+        """
+        if not self.is_async or len(file_paths) < 2:
+            timed = [timed_extract(path) for path in file_paths]
+        else:
+            workers = self.app.config["EXTRACTION_WORKERS"]
+            chunksize = max(1, len(file_paths) // (workers * 4))
+            timed = list(self._get_executor().map(timed_extract, file_paths, chunksize=chunksize))
+        for result, elapsed in timed:
+            metrics.record_extraction(result, elapsed)
+        return [result for result, _ in timed]
+
+    def is_in_flight(self, digest):
+        with self._lock:
+            return digest in self._in_flight
+
+    def join(self, poll_interval=0.1):
+        """Waits until every queued job, and every blob left pending by a full backlog, is processed."""
+        while True:
+            with self._lock:
+                idle = not self._in_flight
+                backlogged = self._backlogged
+            if idle and not backlogged:
+                return
+            if idle:
+                self._drain()
+            time.sleep(poll_interval)
+
+    def requeue_pending(self):
+        """Resubmits blobs left pending by a worker that stopped before finishing them."""
+        pending = Blob.query.filter_by(extraction_status=EXTRACTION_PENDING).all()
+        for blob in pending:
+            self.submit(blob.sha256, blob.file_path)
+        return len(pending)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+def safe_extract(file_path):
+    """``extract_for_storage`` that logs failures and returns None instead of raising."""
+    try:
+        return extract_for_storage(file_path)
+    except Exception as e:
+        logger.error(f"Metadata extraction failed for {file_path}: {e}")
+        return None
+
+
+def timed_extract(file_path):
+    """
+    Runs ``safe_extract`` and measures it where it runs, so the duration excludes time spent queued.
+
+    Returns:
+        tuple: A tuple containing (the ``safe_extract`` result, seconds taken).
+    """
+    started = time.perf_counter()
+    result = safe_extract(file_path)
+    return result, time.perf_counter() - started
+
+
+extraction_queue = ExtractionQueue()
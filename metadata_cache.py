@@ -0,0 +1,240 @@
+"""
+Read-through cache of serialized image metadata.
+
+Metadata documents are written once at extraction and only change when they
+are cleared or re-extracted, so the JSON sent to clients is cached per image id
+and invalidated explicitly on those writes. Two bounded, TTL-limited backends
+are available:
+
+- ``sqlite`` (the default): a SQLite file in WAL mode shared by every worker
+  on the host, so invalidation is seen by all of them. The file is named after
+  the app's database, so deployments on one host do not share entries.
+- ``memory``: an LRU dict private to each worker process. Invalidation only
+  reaches the process that performed the write, so use it only with a single
+  worker process.
+
+Set ``METADATA_CACHE_BACKEND = "none"`` to disable caching.
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy.engine import make_url
+
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend:
+    """Thread-safe LRU of ``max_entries`` items, each expiring ``ttl`` seconds after it was stored."""
+
+    name = "memory"
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def set(self, key, payload):
+        with self._lock:
+            self._entries[key] = (payload, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """
+    A cache table in a local SQLite file shared by all worker processes.
+
+    Reads never write, so the WAL keeps them concurrent; eviction is therefore
+    by age of the write rather than strict LRU, and runs every
+    ``TRIM_INTERVAL`` stores.
+    """
+
+    name = "sqlite"
+    TRIM_INTERVAL = 64
+
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS metadata_cache ("
+                "image_id INTEGER PRIMARY KEY, payload BLOB NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_metadata_cache_expires ON metadata_cache (expires)")
+
+    def _connection(self):
+        # sqlite3 connections may not be shared between threads, or across a fork.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key):
+        row = self._connection().execute(
+            "SELECT payload FROM metadata_cache WHERE image_id = ? AND expires >= ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, payload):
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO metadata_cache (image_id, payload, expires) VALUES (?, ?, ?)",
+            (key, payload, time.time() + self.ttl)
+        )
+        self._writes += 1
+        if self._writes % self.TRIM_INTERVAL == 0:
+            self._trim(conn)
+
+    def _trim(self, conn):
+        conn.execute("DELETE FROM metadata_cache WHERE expires < ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM metadata_cache WHERE image_id NOT IN "
+            "(SELECT image_id FROM metadata_cache ORDER BY expires DESC LIMIT ?)",
+            (self.max_entries,)
+        )
+
+    def delete(self, keys):
+        keys = list(keys)
+        if keys:
+            self._connection().executemany("DELETE FROM metadata_cache WHERE image_id = ?", [(key,) for key in keys])
+
+    def clear(self):
+        self._connection().execute("DELETE FROM metadata_cache")
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM metadata_cache").fetchone()[0]
+
+
+def _default_path(app):
+    # Cache keys are image ids, so the file must not be shared between databases.
+    # The password is left out: the name is visible to every user of the host.
+    database = app.config.get("SQLALCHEMY_DATABASE_URI")
+    if database:
+        database = make_url(database).render_as_string(hide_password=True)
+    key = f"{app.instance_path}|{database}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"image_meta_cache-{digest}.sqlite3")
+
+
+class MetadataCache:
+    """
+    Caches each image's metadata as pre-serialized JSON bytes, keyed by image id.
+
+    Backend errors are logged and treated as misses, so a broken cache never
+    fails a request. Hit and miss counts are per process.
+    """
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("METADATA_CACHE_BACKEND", os.getenv("METADATA_CACHE_BACKEND", "sqlite"))
+        app.config.setdefault("METADATA_CACHE_SIZE", int(os.getenv("METADATA_CACHE_SIZE", 2048)))
+        app.config.setdefault("METADATA_CACHE_TTL", int(os.getenv("METADATA_CACHE_TTL", 3600)))
+        app.config.setdefault("METADATA_CACHE_PATH", os.getenv("METADATA_CACHE_PATH", _default_path(app)))
+
+        backend = app.config["METADATA_CACHE_BACKEND"]
+        size, ttl = app.config["METADATA_CACHE_SIZE"], app.config["METADATA_CACHE_TTL"]
+        if backend == "memory":
+            self.backend = MemoryBackend(size, ttl)
+        elif backend == "sqlite":
+            self.backend = SQLiteBackend(app.config["METADATA_CACHE_PATH"], size, ttl)
+        elif backend == "none":
+            self.backend = None
+        else:
+            raise ValueError(f"Unknown METADATA_CACHE_BACKEND: {backend}")
+        app.extensions["metadata_cache"] = self
+
+    def get(self, image_id):
+        """Returns the cached JSON bytes for an image, or None on a miss."""
+        payload = None
+        if self.backend is not None:
+            try:
+                payload = self.backend.get(image_id)
+            except Exception as e:
+                logger.warning(f"Metadata cache read failed for image {image_id}: {e}")
+        with self._lock:
+            if payload is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return payload
+
+    def set(self, image_id, payload):
+        if self.backend is None:
+            return
+        try:
+            self.backend.set(image_id, payload)
+        except Exception as e:
+            logger.warning(f"Metadata cache write failed for image {image_id}: {e}")
+
+    def invalidate(self, *image_ids):
+        """Drops cached entries; call after any write to the images' metadata."""
+        if self.backend is None or not image_ids:
+            return
+        try:
+            self.backend.delete(image_ids)
+        except Exception as e:
+            logger.error(f"Metadata cache invalidation failed for images {image_ids}: {e}")
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        try:
+            entries = len(self.backend) if self.backend is not None else 0
+        except Exception:
+            entries = None
+        return {
+            "backend": self.backend.name if self.backend is not None else "none",
+            "entries": entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / lookups, 4) if lookups else None,
+        }
+
+
+metadata_cache = MetadataCache()
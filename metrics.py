@@ -0,0 +1,308 @@
+"""
+Prometheus metrics, served in the text exposition format at ``/metrics`` to
+scrapers holding ``METRICS_TOKEN``; without a token the endpoint answers 404.
+
+Recording sits on the request path, so each metric keeps ``STRIPES`` shards,
+each with its own lock, and a thread always writes to the same shard: request
+threads almost never contend, and a sample costs one uncontended lock and a
+few additions. Shards are merged only when ``/metrics`` is scraped.
+
+Values are per process; with several workers, scrape each one (or aggregate
+by instance), as with the other per-worker statistics.
+"""
+import bisect
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from flask import current_app, g, has_request_context, request, request_started
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models import db
+import dbpool
+
+
+logger = logging.getLogger(__name__)
+
+STRIPES = 8
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_thread_ids = itertools.count()
+_local = threading.local()
+
+
+def _stripe():
+    index = getattr(_local, "stripe", None)
+    if index is None:
+        index = _local.stripe = next(_thread_ids) % STRIPES
+    return index
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Registry:
+    """The metrics and collector callbacks rendered by ``/metrics``."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def register_collector(self, collector):
+        """
+        Adds a callback evaluated on each scrape, for values that already exist elsewhere.
+
+        The callback returns a list of ``(name, type, help, samples)`` families,
+        where samples are ``(sample name, ((label, value), ...), value)``.
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """Returns every metric in the Prometheus text format."""
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        families = [metric.collect() for metric in metrics]
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+
+        lines = []
+        for name, metric_type, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for sample_name, pairs, value in samples:
+                lines.append(f"{sample_name}{_format_labels(pairs)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # One (lock, {label values: state}) per stripe.
+        self._stripes = [(threading.Lock(), {}) for _ in range(STRIPES)]
+        registry.register(self)
+
+    def _snapshot(self):
+        for lock, values in self._stripes:
+            with lock:
+                items = [(labels, self._copy(state)) for labels, state in values.items()]
+            yield from items
+
+    @staticmethod
+    def _copy(state):
+        return state
+
+
+class Counter(_Metric):
+    """A monotonically increasing total."""
+
+    type = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        lock, values = self._stripes[_stripe()]
+        with lock:
+            values[labelvalues] = values.get(labelvalues, 0) + amount
+
+    def collect(self):
+        totals = {}
+        for labels, value in self._snapshot():
+            totals[labels] = totals.get(labels, 0) + value
+        samples = [(self.name, tuple(zip(self.labelnames, labels)), value) for labels, value in sorted(totals.items())]
+        return self.name, self.type, self.documentation, samples
+
+
+class Histogram(_Metric):
+    """Counts observations into cumulative ``le`` buckets, with their sum."""
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, *labelvalues):
+        # Per-bucket (not cumulative) counts, the last one for +Inf, then the sum.
+        index = bisect.bisect_left(self.buckets, value)
+        lock, values = self._stripes[_stripe()]
+        with lock:
+            state = values.get(labelvalues)
+            if state is None:
+                state = values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            state[index] += 1
+            state[-1] += value
+
+    @staticmethod
+    def _copy(state):
+        return list(state)
+
+    def collect(self):
+        merged = {}
+        for labels, state in self._snapshot():
+            total = merged.get(labels)
+            merged[labels] = state if total is None else [a + b for a, b in zip(total, state)]
+
+        samples = []
+        for labels, state in sorted(merged.items()):
+            pairs = tuple(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), state[:-1]):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", pairs + (("le", _format_value(float(bound))),), cumulative))
+            samples.append((f"{self.name}_sum", pairs, state[-1]))
+            samples.append((f"{self.name}_count", pairs, cumulative))
+        return self.name, self.type, self.documentation, samples
+
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to produce a response, by endpoint.", ("endpoint", "method"))
+REQUESTS = Counter(
+    "http_requests_total", "Responses sent, by endpoint and status code.", ("endpoint", "method", "status"))
+DB_QUERIES = Histogram(
+    "db_queries_per_request", "SQL statements executed while handling a request, by endpoint.", ("endpoint",),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100))
+UPLOAD_BYTES = Counter("upload_bytes_total", "Bytes received in image uploads, single and batch.")
+EXTRACTION_SECONDS = Histogram(
+    "metadata_extraction_seconds", "Time spent extracting metadata from one stored file.",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+EXTRACTION_FAILURES = Counter("metadata_extraction_failures_total", "Files whose metadata extraction failed.")
+METADATA_KEYS = Histogram(
+    "image_metadata_keys", "Metadata keys extracted per stored file.", buckets=(0, 1, 5, 10, 20, 50, 100, 200, 500))
+
+
+# (metric name, dbpool.pool_stats key, type, help)
+POOL_METRICS = (
+    ("db_pool_checked_out", "checked_out", "gauge", "Connections currently checked out of the pool."),
+    ("db_pool_overflow", "overflow", "gauge", "Connections open beyond the pool size."),
+    ("db_pool_waiting", "waiting", "gauge", "Threads waiting for a pooled connection."),
+    ("db_pool_timeouts_total", "timeouts", "counter", "Checkouts that gave up after the pool timeout."),
+    ("db_pool_wait_seconds_total", "wait_seconds_total", "counter", "Time spent waiting for pooled connections."),
+)
+
+
+def record_extraction(result, seconds):
+    """Records one extraction: its duration, and the number of keys found or a failure."""
+    EXTRACTION_SECONDS.observe(seconds)
+    if result is None:
+        EXTRACTION_FAILURES.inc()
+    else:
+        METADATA_KEYS.observe(len(result[0]))
+
+
+def _endpoint():
+    return request.endpoint or "unmatched"
+
+
+def _on_request_started(sender, **extra):
+    # A signal rather than before_request, so requests rejected by an earlier
+    # before_request hook (rate limits, CSRF) are timed too.
+    g._metrics_started = time.perf_counter()
+    g._metrics_queries = 0
+
+
+def _remember_status(response):
+    g._metrics_status = response.status_code
+    return response
+
+
+def _record_request(exc):
+    # Recorded at teardown, which also runs for unhandled exceptions; those skip
+    # after_request when exceptions propagate, and are counted as 500s.
+    started = g.pop("_metrics_started", None)
+    if started is None:
+        return
+    status = 500 if exc is not None else g.pop("_metrics_status", 500)
+    endpoint, method = _endpoint(), request.method
+    REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint, method)
+    REQUESTS.inc(endpoint, method, str(status))
+    DB_QUERIES.observe(g.pop("_metrics_queries", 0), endpoint)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "_metrics_queries" in g:
+        g._metrics_queries += 1
+
+
+def _app_collector():
+    """Gauges for the metadata cache and connection pool of the app being scraped."""
+    families = []
+    cache = current_app.extensions.get("metadata_cache")
+    if cache is not None:
+        stats = cache.stats()
+        families.append(("metadata_cache_hits_total", "counter", "Metadata cache hits.",
+                         [("metadata_cache_hits_total", (), stats["hits"])]))
+        families.append(("metadata_cache_misses_total", "counter", "Metadata cache misses.",
+                         [("metadata_cache_misses_total", (), stats["misses"])]))
+        if stats["entries"] is not None:
+            families.append(("metadata_cache_entries", "gauge", "Entries in the metadata cache backend.",
+                             [("metadata_cache_entries", (), stats["entries"])]))
+
+    pool = dbpool.pool_stats(db.engine)
+    for name, key, metric_type, documentation in POOL_METRICS:
+        if key in pool:
+            families.append((name, metric_type, documentation, [(name, (), pool[key])]))
+    return families
+
+
+REGISTRY.register_collector(_app_collector)
+
+
+class Metrics:
+    """Times every request and counts its SQL statements; disabled with ``METRICS_ENABLED = false``."""
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("METRICS_ENABLED", os.getenv("METRICS_ENABLED", "true").lower() == "true")
+        # /metrics requires "Authorization: Bearer <token>", and answers 404 while this is unset.
+        app.config.setdefault("METRICS_TOKEN", os.getenv("METRICS_TOKEN"))
+        app.extensions["metrics"] = self
+        if not app.config["METRICS_ENABLED"]:
+            return
+
+        request_started.connect(_on_request_started, app)
+        app.after_request(_remember_status)
+        app.teardown_request(_record_request)
+        if not event.contains(Engine, "before_cursor_execute", _count_query):
+            event.listen(Engine, "before_cursor_execute", _count_query)
+
+    def render(self):
+        return REGISTRY.render()
+
+
+metrics = Metrics()
@@ -0,0 +1,44 @@
+"""Added content-addressed blobs with reference counting
+
+Revision ID: 4f2a9c7d1e08
+Revises: 269c9e4939f3
+Create Date: 2026-10-18 10:02:41.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f2a9c7d1e08'
+down_revision = '269c9e4939f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('blobs',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('filename', sa.String(length=255), nullable=False),
+    sa.Column('file_path', sa.String(length=500), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('latitude', sa.Float(), nullable=True),
+    sa.Column('longitude', sa.Float(), nullable=True),
+    sa.Column('metadata_json', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_images_content_hash'), ['content_hash'], unique=False)
+        batch_op.create_foreign_key('fk_images_content_hash_blobs', 'blobs', ['content_hash'], ['sha256'])
+
+
+def downgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_images_content_hash_blobs', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_images_content_hash'))
+        batch_op.drop_column('content_hash')
+
+    op.drop_table('blobs')
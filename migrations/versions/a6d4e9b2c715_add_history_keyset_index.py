@@ -0,0 +1,26 @@
+"""Added (user_id, created_at, id) index for keyset-paginated history
+
+Revision ID: a6d4e9b2c715
+Revises: f5c2d8e1a093
+Create Date: 2026-10-18 16:20:41.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d4e9b2c715'
+down_revision = 'f5c2d8e1a093'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.create_index('ix_images_user_created', ['user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.drop_index('ix_images_user_created')
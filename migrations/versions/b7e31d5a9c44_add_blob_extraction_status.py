@@ -0,0 +1,26 @@
+"""Added extraction status to blobs for deferred metadata extraction
+
+Revision ID: b7e31d5a9c44
+Revises: 4f2a9c7d1e08
+Create Date: 2026-10-18 11:37:09.604512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e31d5a9c44'
+down_revision = '4f2a9c7d1e08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('extraction_status', sa.String(length=16), nullable=False, server_default='done'))
+
+
+def downgrade():
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.drop_column('extraction_status')
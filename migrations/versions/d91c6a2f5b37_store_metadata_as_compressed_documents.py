@@ -0,0 +1,137 @@
+"""Store image metadata as one compressed document per image
+
+Converts the key/value rows in image_metadata into a zlib-compressed JSON
+document on images.metadata_doc (and blobs.metadata_json into
+blobs.metadata_doc), then drops the image_metadata table.
+
+Revision ID: d91c6a2f5b37
+Revises: b7e31d5a9c44
+Create Date: 2026-10-18 13:12:55.470391
+
+"""
+import json
+import zlib
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd91c6a2f5b37'
+down_revision = 'b7e31d5a9c44'
+branch_labels = None
+depends_on = None
+
+METADATA_DOC_LENGTH = 2 ** 24 - 1
+BATCH_SIZE = 1000
+
+images = sa.table('images',
+    sa.column('id', sa.Integer),
+    sa.column('metadata_doc', sa.LargeBinary),
+)
+blobs = sa.table('blobs',
+    sa.column('sha256', sa.String),
+    sa.column('metadata_json', sa.Text),
+    sa.column('metadata_doc', sa.LargeBinary),
+)
+image_metadata = sa.table('image_metadata',
+    sa.column('id', sa.Integer),
+    sa.column('image_id', sa.Integer),
+    sa.column('key_name', sa.String),
+    sa.column('value', sa.Text),
+    sa.column('created_at', sa.DateTime),
+)
+
+
+def pack(metadata):
+    if not metadata:
+        return None
+    return zlib.compress(json.dumps(metadata, separators=(",", ":")).encode("utf-8"))
+
+
+def unpack(document):
+    return json.loads(zlib.decompress(document)) if document else {}
+
+
+def upgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('metadata_doc', sa.LargeBinary(length=METADATA_DOC_LENGTH), nullable=True))
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('metadata_doc', sa.LargeBinary(length=METADATA_DOC_LENGTH), nullable=True))
+
+    bind = op.get_bind()
+
+    # Convert in ranges of image ids so only one batch of documents is held at a time.
+    update_images = images.update().where(images.c.id == sa.bindparam('b_id')).values(metadata_doc=sa.bindparam('b_doc'))
+    low, high = bind.execute(sa.select(sa.func.min(image_metadata.c.image_id), sa.func.max(image_metadata.c.image_id))).one()
+    if low is not None:
+        for start in range(low, high + 1, BATCH_SIZE):
+            documents = {}
+            rows = bind.execute(
+                sa.select(image_metadata.c.image_id, image_metadata.c.key_name, image_metadata.c.value)
+                .where(image_metadata.c.image_id.between(start, start + BATCH_SIZE - 1))
+                .order_by(image_metadata.c.image_id, image_metadata.c.id)
+            )
+            for image_id, key_name, value in rows:
+                documents.setdefault(image_id, {})[key_name] = value
+            if documents:
+                bind.execute(update_images, [{'b_id': image_id, 'b_doc': pack(metadata)} for image_id, metadata in documents.items()])
+
+    blob_updates = [
+        {'b_sha256': sha256, 'b_doc': pack(json.loads(metadata_json))}
+        for sha256, metadata_json in bind.execute(
+            sa.select(blobs.c.sha256, blobs.c.metadata_json).where(blobs.c.metadata_json.isnot(None))
+        )
+    ]
+    if blob_updates:
+        bind.execute(
+            blobs.update().where(blobs.c.sha256 == sa.bindparam('b_sha256')).values(metadata_doc=sa.bindparam('b_doc')),
+            blob_updates
+        )
+
+    op.drop_table('image_metadata')
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.drop_column('metadata_json')
+
+
+def downgrade():
+    op.create_table('image_metadata',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('image_id', sa.Integer(), nullable=False),
+    sa.Column('key_name', sa.String(length=255), nullable=False),
+    sa.Column('value', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['image_id'], ['images.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('metadata_json', sa.Text(), nullable=True))
+
+    bind = op.get_bind()
+    now = datetime.utcnow()
+    rows = []
+    for image_id, document in bind.execute(sa.select(images.c.id, images.c.metadata_doc).where(images.c.metadata_doc.isnot(None))):
+        rows.extend(
+            {'image_id': image_id, 'key_name': key, 'value': value, 'created_at': now}
+            for key, value in unpack(document).items()
+        )
+        if len(rows) >= BATCH_SIZE:
+            bind.execute(image_metadata.insert(), rows)
+            rows = []
+    if rows:
+        bind.execute(image_metadata.insert(), rows)
+
+    blob_updates = [
+        {'b_sha256': sha256, 'b_json': json.dumps(unpack(document))}
+        for sha256, document in bind.execute(sa.select(blobs.c.sha256, blobs.c.metadata_doc).where(blobs.c.metadata_doc.isnot(None)))
+    ]
+    if blob_updates:
+        bind.execute(
+            blobs.update().where(blobs.c.sha256 == sa.bindparam('b_sha256')).values(metadata_json=sa.bindparam('b_json')),
+            blob_updates
+        )
+
+    with op.batch_alter_table('blobs', schema=None) as batch_op:
+        batch_op.drop_column('metadata_doc')
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.drop_column('metadata_doc')
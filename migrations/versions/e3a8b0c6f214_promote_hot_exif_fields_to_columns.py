@@ -0,0 +1,124 @@
+"""Promoted camera, exposure, ISO and capture date to typed, indexed image columns
+
+Revision ID: e3a8b0c6f214
+Revises: d91c6a2f5b37
+Create Date: 2026-10-18 14:26:31.907116
+
+"""
+import json
+import re
+import zlib
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a8b0c6f214'
+down_revision = 'd91c6a2f5b37'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?(?:/\d+(?:\.\d+)?)?")
+
+images = sa.table('images',
+    sa.column('id', sa.Integer),
+    sa.column('metadata_doc', sa.LargeBinary),
+    sa.column('camera_make', sa.String),
+    sa.column('camera_model', sa.String),
+    sa.column('exposure_time', sa.Float),
+    sa.column('f_number', sa.Float),
+    sa.column('iso', sa.Integer),
+    sa.column('taken_at', sa.DateTime),
+)
+
+
+def _text(value):
+    value = str(value).strip().strip("\x00") if value is not None else ""
+    return value[:100] if value and value != "N/A" else None
+
+
+def _number(value):
+    match = NUMBER_PATTERN.search(str(value)) if value is not None else None
+    if not match:
+        return None
+    numerator, _, denominator = match.group().partition("/")
+    try:
+        return float(numerator) / float(denominator) if denominator else float(numerator)
+    except ZeroDivisionError:
+        return None
+
+
+def _datetime(value):
+    try:
+        return datetime.strptime(str(value).strip()[:19], "%Y:%m:%d %H:%M:%S")
+    except (TypeError, ValueError):
+        return None
+
+
+def promote(document):
+    metadata = json.loads(zlib.decompress(document))
+    iso = _number(metadata.get("iso", metadata.get("ISOSpeedRatings")))
+    return {
+        'b_camera_make': _text(metadata.get("camera_make", metadata.get("Make"))),
+        'b_camera_model': _text(metadata.get("camera_model", metadata.get("Model"))),
+        'b_exposure_time': _number(metadata.get("exposure_time", metadata.get("ExposureTime"))),
+        'b_f_number': _number(metadata.get("f_number", metadata.get("FNumber"))),
+        'b_iso': int(iso) if iso is not None else None,
+        'b_taken_at': _datetime(metadata.get("date_time", metadata.get("DateTimeOriginal"))),
+    }
+
+
+def upgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('camera_make', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('camera_model', sa.String(length=100), nullable=True))
+        batch_op.add_column(sa.Column('exposure_time', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('f_number', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('iso', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('taken_at', sa.DateTime(), nullable=True))
+
+    bind = op.get_bind()
+    update_images = images.update().where(images.c.id == sa.bindparam('b_id')).values(
+        camera_make=sa.bindparam('b_camera_make'),
+        camera_model=sa.bindparam('b_camera_model'),
+        exposure_time=sa.bindparam('b_exposure_time'),
+        f_number=sa.bindparam('b_f_number'),
+        iso=sa.bindparam('b_iso'),
+        taken_at=sa.bindparam('b_taken_at'),
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(images.c.id, images.c.metadata_doc)
+            .where(images.c.id > last_id, images.c.metadata_doc.isnot(None))
+            .order_by(images.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(update_images, [dict(promote(document), b_id=image_id) for image_id, document in rows])
+        last_id = rows[-1][0]
+
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.create_index('ix_images_user_camera', ['user_id', 'camera_make', 'camera_model', 'id'], unique=False)
+        batch_op.create_index('ix_images_user_make', ['user_id', 'camera_make', 'id'], unique=False)
+        batch_op.create_index('ix_images_user_taken_at', ['user_id', 'taken_at', 'id'], unique=False)
+        batch_op.create_index('ix_images_user_iso', ['user_id', 'iso', 'id'], unique=False)
+        batch_op.create_index('ix_images_user_f_number', ['user_id', 'f_number', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.drop_index('ix_images_user_f_number')
+        batch_op.drop_index('ix_images_user_iso')
+        batch_op.drop_index('ix_images_user_taken_at')
+        batch_op.drop_index('ix_images_user_make')
+        batch_op.drop_index('ix_images_user_camera')
+        batch_op.drop_column('taken_at')
+        batch_op.drop_column('iso')
+        batch_op.drop_column('f_number')
+        batch_op.drop_column('exposure_time')
+        batch_op.drop_column('camera_model')
+        batch_op.drop_column('camera_make')
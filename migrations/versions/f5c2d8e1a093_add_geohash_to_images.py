@@ -0,0 +1,76 @@
+"""Added geohash column with a per-user prefix index for spatial queries
+
+Revision ID: f5c2d8e1a093
+Revises: e3a8b0c6f214
+Create Date: 2026-10-18 15:48:02.336710
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5c2d8e1a093'
+down_revision = 'e3a8b0c6f214'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+PRECISION = 12
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+images = sa.table('images',
+    sa.column('id', sa.Integer),
+    sa.column('latitude', sa.Float),
+    sa.column('longitude', sa.Float),
+    sa.column('geohash', sa.String),
+)
+
+
+def encode(latitude, longitude):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < PRECISION:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        if coordinate >= middle:
+            value = (value << 1) | 1
+            interval[0] = middle
+        else:
+            value <<= 1
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def upgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('geohash', sa.String(length=PRECISION), nullable=True))
+
+    bind = op.get_bind()
+    update_images = images.update().where(images.c.id == sa.bindparam('b_id')).values(geohash=sa.bindparam('b_geohash'))
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(images.c.id, images.c.latitude, images.c.longitude)
+            .where(images.c.id > last_id, images.c.latitude.isnot(None), images.c.longitude.isnot(None))
+            .order_by(images.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        bind.execute(update_images, [{'b_id': image_id, 'b_geohash': encode(lat, lon)} for image_id, lat, lon in rows])
+        last_id = rows[-1][0]
+
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.create_index('ix_images_user_geohash', ['user_id', 'geohash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('images', schema=None) as batch_op:
+        batch_op.drop_index('ix_images_user_geohash')
+        batch_op.drop_column('geohash')
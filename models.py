@@ -1,14 +1,94 @@
+import json
 import logging
 import os
+import re
+import zlib
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from passwords import password_hasher
 from flask_login import UserMixin
+from sqlalchemy import inspect, or_, and_
+from sqlalchemy.orm import load_only, deferred
+from geo import encode as geohash_encode, cover as geohash_cover, prefix_upper_bound as geohash_prefix_upper_bound, GEOHASH_PRECISION
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 
 
 db = SQLAlchemy()
 
+EXTRACTION_PENDING = 'pending'
+EXTRACTION_DONE = 'done'
+EXTRACTION_FAILED = 'failed'
+
+OUTBOX_PENDING = 'pending'
+OUTBOX_SENT = 'sent'
+OUTBOX_FAILED = 'failed'
+
+# MEDIUMBLOB on MySQL; documents with large XMP packets exceed a plain BLOB.
+METADATA_DOC_LENGTH = 2 ** 24 - 1
+
+
+def pack_metadata(metadata):
+    """Serialize a metadata dict (values stringified) into a compressed JSON document."""
+    if not metadata:
+        return None
+    document = json.dumps({key: str(value) for key, value in metadata.items()}, separators=(",", ":"))
+    return zlib.compress(document.encode("utf-8"))
+
+
+def unpack_metadata(document):
+    """Deserialize a document produced by ``pack_metadata``."""
+    return json.loads(zlib.decompress(document)) if document else {}
+
+
+EXIF_DATETIME_FORMAT = "%Y:%m:%d %H:%M:%S"
+NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?(?:/\d+(?:\.\d+)?)?")
+
+
+def _parse_text(value, max_length):
+    value = str(value).strip().strip("\x00") if value is not None else ""
+    return value[:max_length] if value and value != "N/A" else None
+
+
+def _parse_number(value):
+    """Parse the first number in a stringified EXIF value ("0.004", "1/250", "(400, 400)")."""
+    match = NUMBER_PATTERN.search(str(value)) if value is not None else None
+    if not match:
+        return None
+    numerator, _, denominator = match.group().partition("/")
+    try:
+        return float(numerator) / float(denominator) if denominator else float(numerator)
+    except ZeroDivisionError:
+        return None
+
+
+def _parse_datetime(value):
+    try:
+        return datetime.strptime(str(value).strip()[:19], EXIF_DATETIME_FORMAT)
+    except (TypeError, ValueError):
+        return None
+
+
+def promote_metadata(metadata):
+    """
+    Parse the hot EXIF fields into values for Image's typed, indexed columns.
+
+    Args:
+        metadata (dict): Metadata as produced by ``utils.extract_metadata`` (raw or stringified).
+
+    Returns:
+        dict: Column values keyed by column name; unparseable fields are None.
+    """
+    metadata = metadata or {}
+    iso = _parse_number(metadata.get("iso", metadata.get("ISOSpeedRatings")))
+    return {
+        "camera_make": _parse_text(metadata.get("camera_make", metadata.get("Make")), 100),
+        "camera_model": _parse_text(metadata.get("camera_model", metadata.get("Model")), 100),
+        "exposure_time": _parse_number(metadata.get("exposure_time", metadata.get("ExposureTime"))),
+        "f_number": _parse_number(metadata.get("f_number", metadata.get("FNumber"))),
+        "iso": int(iso) if iso is not None else None,
+        "taken_at": _parse_datetime(metadata.get("date_time", metadata.get("DateTimeOriginal"))),
+    }
+
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -36,11 +116,11 @@ class User(db.Model, UserMixin):
         """Hash and set the user's password."""
         if not password:
             raise ValueError("Password cannot be empty.")
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
         """Verify the user's password."""
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)[0]
 
     @classmethod
     def get_by_id(cls, user_id):
@@ -54,12 +134,8 @@ class User(db.Model, UserMixin):
 
     @classmethod
     def create(cls, email, password):
-        """Create a new user."""
+        """Create a new user; the unique constraint on email rejects duplicates."""
         email = email.lower().strip()
-        if cls.get_by_email(email):
-            logger.warning(f"Registration attempt with existing email: {email}")
-            raise ValueError("Email already exists!")
-
         user = cls(email=email, password=password)
         try:
             db.session.add(user)
@@ -68,8 +144,8 @@ class User(db.Model, UserMixin):
             return user
         except IntegrityError:
             db.session.rollback()
-            logger.error(f"Integrity error while creating user '{email}'")
-            raise ValueError("Email is already in use.")
+            logger.warning(f"Registration attempt with existing email: {email}")
+            raise ValueError("Email already exists!")
         except SQLAlchemyError as e:
             db.session.rollback()
             logger.error(f"Database error while creating user '{email}': {str(e)}")
@@ -101,23 +177,142 @@ class Image(db.Model):
     file_extension = db.Column(db.String(10), nullable=False)
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
+    content_hash = db.Column(db.String(64), db.ForeignKey('blobs.sha256'), index=True)
+    # Loaded on first access; most reads are served from the metadata cache.
+    metadata_doc = deferred(db.Column(db.LargeBinary(length=METADATA_DOC_LENGTH)))
+    camera_make = db.Column(db.String(100))
+    camera_model = db.Column(db.String(100))
+    exposure_time = db.Column(db.Float)
+    f_number = db.Column(db.Float)
+    iso = db.Column(db.Integer)
+    taken_at = db.Column(db.DateTime)
+    geohash = db.Column(db.String(GEOHASH_PRECISION))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
-    
-    image_metadata = db.relationship('ImageMetadata', backref='image', lazy=True, cascade="all, delete-orphan")
-
-    def __init__(self, user_id, filename, file_path, latitude=None, longitude=None, **kwargs):
+    __table_args__ = (
+        db.Index('ix_images_user_geohash', 'user_id', 'geohash'),
+        db.Index('ix_images_user_created', 'user_id', 'created_at', 'id'),
+        # Search results are ordered by (column, id), so each index ends in id.
+        db.Index('ix_images_user_camera', 'user_id', 'camera_make', 'camera_model', 'id'),
+        db.Index('ix_images_user_make', 'user_id', 'camera_make', 'id'),
+        db.Index('ix_images_user_taken_at', 'user_id', 'taken_at', 'id'),
+        db.Index('ix_images_user_iso', 'user_id', 'iso', 'id'),
+        db.Index('ix_images_user_f_number', 'user_id', 'f_number', 'id'),
+    )
+
+    def __init__(self, user_id, filename, file_path, latitude=None, longitude=None, content_hash=None, **kwargs):
         super().__init__(**kwargs)
         self.user_id = user_id
         self.filename = filename
         self.file_path = file_path
         self.file_extension = os.path.splitext(filename)[1].lower().strip('.')
-        self.latitude = latitude
-        self.longitude = longitude
+        self.set_location(latitude, longitude)
+        self.content_hash = content_hash
 
     def __repr__(self):
         return f"<Image {self.filename} (User {self.user_id})>"
 
+    def set_location(self, latitude, longitude):
+        """Set the GPS position together with the geohash used for spatial queries."""
+        self.latitude = latitude
+        self.longitude = longitude
+        self.geohash = geohash_encode(latitude, longitude)
+
+    def set_metadata(self, metadata):
+        """Store the metadata document and its promoted columns; an empty dict clears them."""
+        self.metadata_doc = pack_metadata(metadata)
+        self._set_promoted(promote_metadata(metadata))
+
+    def copy_metadata(self, blob, promoted=None):
+        """
+        Share a blob's metadata document, without re-serializing it.
+
+        Args:
+            blob (Blob): Source of the document.
+            promoted (dict): Precomputed ``promote_metadata`` result, when many
+                images share the blob.
+        """
+        self.metadata_doc = blob.metadata_doc
+        self._set_promoted(promoted if promoted is not None else promote_metadata(blob.get_metadata()))
+
+    def _set_promoted(self, promoted):
+        for column, value in promoted.items():
+            setattr(self, column, value)
+
+    def get_metadata(self):
+        """Return the metadata as a dict of strings."""
+        return unpack_metadata(self.metadata_doc)
+
+    @property
+    def extraction_status(self):
+        """Metadata extraction state of the underlying blob; legacy images are always done."""
+        return self.blob.extraction_status if self.blob else EXTRACTION_DONE
+
+    @classmethod
+    def within_bbox(cls, user_id, min_lat, min_lon, max_lat, max_lon):
+        """
+        Query a user's images inside a bounding box.
+
+        The box is covered by a few geohash prefixes, each a range scan on the
+        (user_id, geohash) index; the exact coordinate check then trims the
+        cell edges. ``min_lon > max_lon`` means the box crosses the antimeridian.
+        """
+        prefixes = geohash_cover(min_lat, min_lon, max_lat, max_lon)
+        # user_id is repeated in every branch so each one is a self-contained
+        # range on the composite index that the planner can union.
+        ranges = []
+        for prefix in prefixes:
+            upper = geohash_prefix_upper_bound(prefix)
+            in_range = cls.geohash >= prefix if upper is None else and_(cls.geohash >= prefix, cls.geohash < upper)
+            ranges.append(and_(cls.user_id == user_id, in_range))
+        in_cells = or_(*ranges)
+        if min_lon <= max_lon:
+            in_lon = cls.longitude.between(min_lon, max_lon)
+        else:
+            in_lon = or_(cls.longitude >= min_lon, cls.longitude <= max_lon)
+        return cls.query.filter(in_cells, cls.latitude.between(min_lat, max_lat), in_lon)
+
+    # Columns read by to_dict(); listing queries load only these.
+    SUMMARY_COLUMNS = (
+        'id', 'filename', 'latitude', 'longitude', 'camera_make', 'camera_model',
+        'exposure_time', 'f_number', 'iso', 'taken_at', 'created_at',
+    )
+
+    @classmethod
+    def history_query(cls, user_id, before=None):
+        """
+        Query a user's images newest first, keyset-paginated on (created_at, id).
+
+        Only the columns used by ``to_dict`` are loaded, so metadata documents
+        are never read.
+
+        Args:
+            user_id (int): Owner of the images.
+            before (tuple): (created_at, id) of the last image already returned.
+        """
+        columns = [getattr(cls, column) for column in cls.SUMMARY_COLUMNS]
+        query = cls.query.options(load_only(*columns)).filter(cls.user_id == user_id)
+        if before:
+            created_at, image_id = before
+            query = query.filter(or_(cls.created_at < created_at, and_(cls.created_at == created_at, cls.id < image_id)))
+        return query.order_by(cls.created_at.desc(), cls.id.desc())
+
+    def to_dict(self):
+        """Serialize the image's indexed fields for JSON APIs."""
+        return {
+            "id": self.id,
+            "filename": self.filename,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+            "camera_make": self.camera_make,
+            "camera_model": self.camera_model,
+            "exposure_time": self.exposure_time,
+            "f_number": self.f_number,
+            "iso": self.iso,
+            "taken_at": self.taken_at.isoformat() if self.taken_at else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+        }
+
     @classmethod
     def create(cls, user_id, filename, file_path, latitude=None, longitude=None):
         """Create a new image entry."""
@@ -139,34 +334,97 @@ class Image(db.Model):
 
 
 
-class ImageMetadata(db.Model):
-    __tablename__ = 'image_metadata'
+class Blob(db.Model):
+    """Content-addressed file shared by every Image with the same bytes."""
+    __tablename__ = 'blobs'
 
-    id = db.Column(db.Integer, primary_key=True)
-    image_id = db.Column(db.Integer, db.ForeignKey('images.id'), nullable=False)
-    key_name = db.Column(db.String(255), nullable=False)
-    value = db.Column(db.Text)
+    sha256 = db.Column(db.String(64), primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(500), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, default=0, nullable=False)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    metadata_doc = db.Column(db.LargeBinary(length=METADATA_DOC_LENGTH))
+    extraction_status = db.Column(db.String(16), default=EXTRACTION_DONE, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
-    def __init__(self, image_id, key_name, value, **kwargs):
+    images = db.relationship('Image', backref='blob', lazy=True)
+
+    def __init__(self, sha256, filename, file_path, size, metadata=None, latitude=None, longitude=None,
+                 extraction_status=EXTRACTION_DONE, **kwargs):
         super().__init__(**kwargs)
-        self.image_id = image_id
-        self.key_name = key_name
-        self.value = value
+        self.sha256 = sha256
+        self.filename = filename
+        self.file_path = file_path
+        self.size = size
+        self.ref_count = 0
+        self.latitude = latitude
+        self.longitude = longitude
+        self.extraction_status = extraction_status
+        self.set_metadata(metadata or {})
 
     def __repr__(self):
-        return f"<ImageMetadata {self.key_name}: {self.value}>"
+        return f"<Blob {self.sha256[:12]} ({self.ref_count} refs)>"
+
+    def set_metadata(self, metadata):
+        """Store the extracted metadata document shared by this blob's images."""
+        self.metadata_doc = pack_metadata(metadata)
+
+    def get_metadata(self):
+        """Return the stored metadata as a dict of strings."""
+        return unpack_metadata(self.metadata_doc)
 
     @classmethod
-    def create(cls, image_id, key_name, value):
-        """Create a new metadata entry for an image."""
-        metadata = cls(image_id=image_id, key_name=key_name, value=value)
-        try:
-            db.session.add(metadata)
-            db.session.commit()
-            logger.info(f"Metadata '{key_name}' for image ID {image_id} added successfully.")
-            return metadata
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            logger.error(f"Database error while adding metadata for image ID {image_id}: {str(e)}")
-            raise ValueError("Error occurred while saving metadata. Please try again.")
\ No newline at end of file
+    def get_by_hash(cls, sha256):
+        """Retrieve a blob by its SHA-256 hex digest."""
+        return db.session.get(cls, sha256.lower())
+
+    def acquire(self):
+        """Add a reference; the caller commits."""
+        if inspect(self).persistent:
+            # Increment in SQL so concurrent uploads of the same bytes don't lose updates.
+            self.ref_count = Blob.ref_count + 1
+        else:
+            self.ref_count = (self.ref_count or 0) + 1
+
+    def release(self):
+        """
+        Drop a reference; the caller commits.
+
+        Returns:
+            bool: True if this was the last reference and the blob row was deleted.
+            The caller removes ``file_path`` once the commit succeeds.
+        """
+        self.ref_count = Blob.ref_count - 1
+        db.session.flush()
+        if self.ref_count <= 0:
+            db.session.delete(self)
+            return True
+        return False
+
+
+class OutboxEmail(db.Model):
+    """An outgoing email, stored so it can be delivered and retried off the request path."""
+    __tablename__ = 'email_outbox'
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(16), default=OUTBOX_PENDING, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # A sender owns the message until claimed_until, so concurrent senders never both deliver it.
+    claim_token = db.Column(db.String(32))
+    claimed_until = db.Column(db.DateTime)
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    def __repr__(self):
+        return f"<OutboxEmail {self.id} to {self.recipient} ({self.status})>"
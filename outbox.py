@@ -0,0 +1,187 @@
+"""
+Durable outbox for outgoing email.
+
+Requests only insert a row into ``email_outbox``; a background sender claims
+pending rows in batches, delivers each batch over one SMTP connection and
+reschedules failures with exponential backoff. Claims are leases
+(``claim_token``/``claimed_until``), so any number of worker processes (or a
+dedicated ``flask send-outbox --loop``) can run senders against the same table
+without delivering a message twice, and rows claimed by a sender that died are
+picked up again once the lease expires.
+"""
+import logging
+import os
+import random
+import threading
+import uuid
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from models import db, OutboxEmail, OUTBOX_PENDING, OUTBOX_SENT, OUTBOX_FAILED
+
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxSender:
+    """
+    Delivers queued email from a daemon thread started on the first enqueue.
+
+    With ``OUTBOX_SENDER = "off"`` no thread is started and delivery is left to
+    ``flask send-outbox``.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._thread = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("OUTBOX_SENDER", os.getenv("OUTBOX_SENDER", "thread"))
+        app.config.setdefault("OUTBOX_BATCH_SIZE", int(os.getenv("OUTBOX_BATCH_SIZE", 50)))
+        app.config.setdefault("OUTBOX_POLL_INTERVAL", float(os.getenv("OUTBOX_POLL_INTERVAL", 10)))
+        app.config.setdefault("OUTBOX_MAX_ATTEMPTS", int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8)))
+        app.config.setdefault("OUTBOX_RETRY_BASE", float(os.getenv("OUTBOX_RETRY_BASE", 30)))
+        app.config.setdefault("OUTBOX_RETRY_MAX", float(os.getenv("OUTBOX_RETRY_MAX", 3600)))
+        app.config.setdefault("OUTBOX_CLAIM_SECONDS", int(os.getenv("OUTBOX_CLAIM_SECONDS", 300)))
+        app.extensions["outbox_sender"] = self
+        self.app = app
+
+    def enqueue(self, recipient, subject, body):
+        """
+        Stores an email for delivery; one INSERT, committed before returning.
+
+        Args:
+            recipient (str): Destination address.
+            subject (str): Subject line.
+            body (str): Plain-text body.
+
+        Returns:
+            OutboxEmail: The queued message.
+        """
+        message = OutboxEmail(recipient=recipient, subject=subject, body=body)
+        db.session.add(message)
+        db.session.commit()
+        self.wake()
+        return message
+
+    def wake(self):
+        """Asks the sender thread to run a batch now, starting it if needed."""
+        if self.app is None or self.app.config["OUTBOX_SENDER"] != "thread":
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name="outbox-sender", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    delivered = self.deliver_batch()
+            except Exception as e:
+                logger.error(f"Outbox sender error: {e}")
+                delivered = 0
+            if delivered < self.app.config["OUTBOX_BATCH_SIZE"]:
+                self._wake.wait(self.app.config["OUTBOX_POLL_INTERVAL"])
+
+    def _claim(self, now):
+        config = self.app.config
+        claimable = (
+            OutboxEmail.status == OUTBOX_PENDING,
+            OutboxEmail.next_attempt_at <= now,
+            or_(OutboxEmail.claimed_until.is_(None), OutboxEmail.claimed_until < now),
+        )
+        candidates = [
+            message_id for (message_id,) in db.session.query(OutboxEmail.id)
+            .filter(*claimable)
+            .order_by(OutboxEmail.next_attempt_at)
+            .limit(config["OUTBOX_BATCH_SIZE"])
+        ]
+        if not candidates:
+            return []
+
+        # Conditional update: rows another sender claimed in the meantime are skipped.
+        token = uuid.uuid4().hex
+        OutboxEmail.query.filter(OutboxEmail.id.in_(candidates), *claimable).update(
+            {"claim_token": token, "claimed_until": now + timedelta(seconds=config["OUTBOX_CLAIM_SECONDS"])},
+            synchronize_session=False
+        )
+        db.session.commit()
+        return OutboxEmail.query.filter_by(claim_token=token).order_by(OutboxEmail.id).all()
+
+    def deliver_batch(self):
+        """
+        Claims up to ``OUTBOX_BATCH_SIZE`` due messages and sends them over one connection.
+
+        Returns:
+            int: Number of messages claimed (sent or rescheduled).
+        """
+        messages = self._claim(datetime.utcnow())
+        if not messages:
+            return 0
+
+        from flask_mail import Message
+
+        remaining = list(messages)
+        try:
+            with self._mail().connect() as connection:
+                while remaining:
+                    message = remaining[0]
+                    try:
+                        connection.send(Message(message.subject, recipients=[message.recipient], body=message.body))
+                    except Exception as e:
+                        self._reschedule(message, e)
+                    else:
+                        message.status = OUTBOX_SENT
+                        message.sent_at = datetime.utcnow()
+                        message.claim_token = message.claimed_until = None
+                        logger.info(f"Delivered outbox email {message.id} to {message.recipient}.")
+                    # Commit each outcome, so a crash mid-batch re-sends at most one message.
+                    db.session.commit()
+                    remaining.pop(0)
+        except Exception as e:
+            # Connecting (or quitting) failed: everything not yet handled is retried.
+            logger.error(f"SMTP connection failed with {len(remaining)} outbox email(s) unsent: {e}")
+            for message in remaining:
+                self._reschedule(message, e)
+            db.session.commit()
+        return len(messages)
+
+    def _mail(self):
+        # A lazily started app (STARTUP_MODE=lazy) sets up Flask-Mail on the first delivery.
+        state = self.app.extensions.get("mail")
+        if state is None:
+            from extensions import mail
+            state = mail.init_app(self.app)
+        return state
+
+    def _reschedule(self, message, error):
+        config = self.app.config
+        message.attempts += 1
+        message.last_error = str(error)[:500]
+        message.claim_token = message.claimed_until = None
+        if message.attempts >= config["OUTBOX_MAX_ATTEMPTS"]:
+            message.status = OUTBOX_FAILED
+            logger.error(f"Giving up on outbox email {message.id} after {message.attempts} attempts: {error}")
+            return
+        delay = min(config["OUTBOX_RETRY_BASE"] * 2 ** (message.attempts - 1), config["OUTBOX_RETRY_MAX"])
+        # Jitter spreads retries so a recovering SMTP server isn't hit all at once.
+        message.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay * random.uniform(0.5, 1.0))
+        logger.warning(f"Outbox email {message.id} failed (attempt {message.attempts}), retrying in ~{delay:.0f}s: {error}")
+
+    def shutdown(self, wait=True):
+        self._stop.set()
+        self._wake.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+
+outbox_sender = OutboxSender()
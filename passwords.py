@@ -0,0 +1,121 @@
+"""
+Password hashing on a bounded thread pool.
+
+Key derivation is deliberately CPU-heavy. Running it on the request threads lets
+a login burst occupy every worker, so hashes are computed on a small dedicated
+pool instead; hashlib's scrypt and PBKDF2 release the GIL, so the pool uses up
+to ``PASSWORD_HASH_WORKERS`` cores while the remaining request threads keep
+serving. At most ``PASSWORD_HASH_MAX_PENDING`` hashes may be queued or running;
+beyond that ``HasherBusy`` is raised immediately so callers can shed load
+rather than pile up behind the pool.
+
+The cost is set by ``PASSWORD_HASH_METHOD`` in Werkzeug's syntax (for example
+``scrypt:32768:8:1`` or ``pbkdf2:sha256:600000``). Hashes made with any other
+method are upgraded the next time the user logs in.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HASH_METHOD = "scrypt:32768:8:1"
+
+
+class HasherBusy(RuntimeError):
+    """Raised when too many password hashes are already queued."""
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.method = DEFAULT_HASH_METHOD
+        self._normalized_method = None
+        self.max_pending = None
+        self._workers = 1
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("PASSWORD_HASH_METHOD", os.getenv("PASSWORD_HASH_METHOD", DEFAULT_HASH_METHOD))
+        app.config.setdefault("PASSWORD_HASH_WORKERS", int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1))))
+        app.config.setdefault("PASSWORD_HASH_MAX_PENDING", int(os.getenv(
+            "PASSWORD_HASH_MAX_PENDING", app.config["PASSWORD_HASH_WORKERS"] * 8)))
+
+        self.method = app.config["PASSWORD_HASH_METHOD"]
+        self._normalized_method = None
+        self._workers = app.config["PASSWORD_HASH_WORKERS"]
+        self.max_pending = app.config["PASSWORD_HASH_MAX_PENDING"]
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        app.extensions["password_hasher"] = self
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="password-hash")
+            return self._executor
+
+    def _run(self, fn, *args):
+        if self._slots is None:
+            # Not bound to an app (scripts, shell): hash inline.
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy(f"{self.max_pending} password hashes already pending")
+        try:
+            future = self._get_executor().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result()
+
+    def hash(self, password):
+        """Returns a hash of ``password`` made with the configured method."""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """
+        Checks a password and computes its upgraded hash when the method has changed.
+
+        Both steps run as one pool task.
+
+        Args:
+            password_hash (str): The stored hash.
+            password (str): The candidate password.
+
+        Returns:
+            tuple: A tuple containing (whether the password matches, the new hash
+            to store or None if the stored one is current).
+
+        Raises:
+            HasherBusy: If the pool's queue is full.
+        """
+        return self._run(self._verify, password_hash, password)
+
+    def _verify(self, password_hash, password):
+        if not check_password_hash(password_hash, password):
+            return False, None
+        if password_hash.split("$", 1)[0] != self._current_method():
+            return True, generate_password_hash(password, self.method)
+        return True, None
+
+    def _current_method(self):
+        # Werkzeug fills in defaults ("scrypt" -> "scrypt:32768:8:1"), so compare
+        # against the prefix it actually writes; computed once, off the startup path.
+        if self._normalized_method is None:
+            self._normalized_method = generate_password_hash("", self.method).split("$", 1)[0]
+        return self._normalized_method
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+password_hasher = PasswordHasher()
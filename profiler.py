@@ -0,0 +1,168 @@
+"""
+On-demand profiling of individual requests.
+
+A request is captured when it carries a valid ``X-Profile-Token`` header (a
+signed, expiring token from ``flask profile-token``, so only someone with
+access to the server's secret can trigger it) or is picked by
+``PROFILE_SAMPLE_RATE``. A captured request runs under cProfile while a
+sampler thread records its stack every ``PROFILE_SAMPLE_INTERVAL`` seconds;
+both are written to ``PROFILE_DIR``:
+
+- ``<capture>.pstats``: load with ``pstats.Stats`` or snakeviz.
+- ``<capture>.collapsed``: one ``frame;frame;frame count`` line per stack,
+  the input format of flamegraph.pl and speedscope.
+
+Only the newest ``PROFILE_MAX_CAPTURES`` captures are kept, and one request
+is profiled at a time. Requests that are not captured run no profiler; they
+cost a header lookup (and a random draw if a sample rate is set).
+
+Profiling is off unless ``PROFILING = true``, and stays off while
+``SECRET_KEY`` is unset or app.py's public fallback, since anyone could
+sign a token with it.
+"""
+import cProfile
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from flask import g, request, request_started
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = "X-Profile-Token"
+TOKEN_SALT = "request-profile"
+# Secret keys anyone can sign tokens with: unset, or app.py's fallback.
+PUBLIC_SECRET_KEYS = (None, "", "your_secret_key_here")
+
+
+class StackSampler(threading.Thread):
+    """Counts the stacks of one thread, sampled at a fixed interval."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class RequestProfiler:
+    def __init__(self, app=None):
+        self.app = None
+        self._capturing = threading.Lock()
+        self._captures = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("PROFILING", os.getenv("PROFILING", "false").lower() == "true")
+        app.config.setdefault("PROFILE_SAMPLE_RATE", float(os.getenv("PROFILE_SAMPLE_RATE", 0)))
+        app.config.setdefault("PROFILE_SAMPLE_INTERVAL", float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.001)))
+        app.config.setdefault("PROFILE_TOKEN_MAX_AGE", int(os.getenv("PROFILE_TOKEN_MAX_AGE", 3600)))
+        app.config.setdefault("PROFILE_MAX_CAPTURES", int(os.getenv("PROFILE_MAX_CAPTURES", 20)))
+        app.config.setdefault("PROFILE_DIR", os.getenv(
+            "PROFILE_DIR", os.path.join(tempfile.gettempdir(), "image_meta_profiles")))
+        app.extensions["request_profiler"] = self
+        self.app = app
+        if app.config["PROFILING"] and app.config.get("SECRET_KEY") in PUBLIC_SECRET_KEYS:
+            logger.error("PROFILING is on but SECRET_KEY is unset or the default; profiling stays disabled.")
+            app.config["PROFILING"] = False
+        if not app.config["PROFILING"]:
+            return
+
+        request_started.connect(self._maybe_start, app)
+        app.teardown_request(self._finish)
+
+    def _serializer(self):
+        return URLSafeTimedSerializer(self.app.config["SECRET_KEY"], salt=TOKEN_SALT)
+
+    def make_token(self):
+        """Returns a token that profiles any request carrying it until it expires."""
+        return self._serializer().dumps("profile")
+
+    def _triggered(self):
+        token = request.headers.get(TOKEN_HEADER)
+        if token:
+            try:
+                self._serializer().loads(token, max_age=self.app.config["PROFILE_TOKEN_MAX_AGE"])
+                return True
+            except BadSignature:
+                logger.warning(f"Ignoring invalid or expired {TOKEN_HEADER} for {request.path}.")
+                return False
+        rate = self.app.config["PROFILE_SAMPLE_RATE"]
+        return rate > 0 and random.random() < rate
+
+    def _maybe_start(self, sender, **extra):
+        if not self._triggered() or not self._capturing.acquire(blocking=False):
+            return
+        sampler = StackSampler(threading.get_ident(), self.app.config["PROFILE_SAMPLE_INTERVAL"])
+        profile = cProfile.Profile()
+        g._profile_capture = (profile, sampler, time.time())
+        sampler.start()
+        profile.enable()
+
+    def _finish(self, exc):
+        capture = g.pop("_profile_capture", None)
+        if capture is None:
+            return
+        profile, sampler, started = capture
+        try:
+            profile.disable()
+            sampler.stop()
+            self._write(profile, sampler, started)
+        except Exception as e:
+            logger.error(f"Could not save request profile for {request.path}: {e}")
+        finally:
+            self._capturing.release()
+
+    def _write(self, profile, sampler, started):
+        directory = self.app.config["PROFILE_DIR"]
+        os.makedirs(directory, exist_ok=True)
+        self._captures += 1
+        endpoint = (request.endpoint or "unmatched").replace(".", "-")
+        name = f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime(started))}-{endpoint}-{os.getpid()}-{self._captures}"
+        base = os.path.join(directory, name)
+
+        profile.dump_stats(base + ".pstats")
+        with open(base + ".collapsed", "w", encoding="utf-8") as fp:
+            for stack, count in sampler.stacks.most_common():
+                fp.write(f"{stack} {count}\n")
+        logger.info(f"Profiled {request.method} {request.path} in {time.time() - started:.3f}s: {base}.pstats")
+        self._rotate(directory)
+
+    def _rotate(self, directory):
+        captures = sorted(
+            (entry for entry in os.scandir(directory) if entry.name.endswith(".pstats")),
+            key=lambda entry: entry.stat().st_mtime
+        )
+        for entry in captures[:max(0, len(captures) - self.app.config["PROFILE_MAX_CAPTURES"])]:
+            base = entry.path[:-len(".pstats")]
+            for path in (base + ".pstats", base + ".collapsed"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+
+request_profiler = RequestProfiler()
@@ -0,0 +1,266 @@
+"""
+Rate-limit counters shared by every worker process on a host.
+
+``SharedMemoryStorage`` is a ``limits`` storage backend registered for
+``shm://`` URIs, so Flask-Limiter can use it through ``RATELIMIT_STORAGE_URI``.
+Counters live in a fixed-size hash table in a memory-mapped file (under
+``/dev/shm`` when available), guarded by an ``flock`` on the same file. A check
+is a few struct reads and writes inside that lock, so it costs microseconds and
+holds across gunicorn workers without Redis. The sliding-window counter
+strategy reads both windows and increments the current one under a single lock
+acquisition, so concurrent workers cannot overshoot the limit.
+
+Keys are stored as 64-bit BLAKE2b digests. When no free or expired slot is
+found within ``MAX_PROBES`` of a key's home slot, the slot expiring soonest is
+reused, so under extreme key churn a few counters can be dropped early.
+Counters are local to the host; use Redis for multi-host deployments.
+"""
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import secrets
+import struct
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from math import floor
+from urllib.parse import urlparse, parse_qs
+from limits.storage import Storage, SlidingWindowCounterSupport
+from limits.storage.base import TimestampedSlidingWindow
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOTS = 65536
+MAX_PROBES = 16
+# Holds the random id that names a deployment's default table; see default_uri.
+DEPLOYMENT_ID_FILE = "ratelimit_table_id"
+
+# Header: magic, slot count. Slot: key digest (0 = empty), count, expiry in epoch seconds.
+HEADER = struct.Struct("<8sQ")
+SLOT = struct.Struct("<Qqd")
+MAGIC = b"RLSHM001"
+EMPTY = 0
+
+
+def default_path(key=None):
+    """
+    A file in /dev/shm if the host has it, so the table never touches disk.
+
+    Args:
+        key (str): Distinguishes the tables of deployments sharing a host; see ``default_uri``.
+    """
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    name = "image_meta_ratelimit"
+    if key is not None:
+        name += "-" + key
+    return os.path.join(directory, name)
+
+
+def _deployment_id(instance_path):
+    """A random id kept in the instance folder; the first worker to start creates it."""
+    path = os.path.join(instance_path, DEPLOYMENT_ID_FILE)
+    if not os.path.exists(path):
+        os.makedirs(instance_path, exist_ok=True)
+        staged = f"{path}.{secrets.token_hex(4)}.tmp"
+        with open(staged, "w", encoding="ascii") as fp:
+            fp.write(secrets.token_hex(8))
+        try:
+            # Linking fails if another worker published its id first; theirs wins.
+            os.link(staged, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.unlink(staged)
+    with open(path, encoding="ascii") as fp:
+        return fp.read().strip()
+
+
+def default_uri(app):
+    """
+    The ``shm://`` URI of a table private to ``app``'s deployment.
+
+    The table is named after a random id stored in the instance folder, so the
+    workers of one deployment share it while other deployments on the host (or
+    a benchmark run next to a development server) get their own, and the name in
+    world-listable /dev/shm reveals nothing about the app's configuration. If
+    the instance folder is not writable, the instance path is used instead.
+    """
+    try:
+        key = _deployment_id(app.instance_path)
+    except OSError as e:
+        logger.warning(f"Could not keep a rate limit table id in {app.instance_path}: {e}")
+        key = hashlib.sha256(app.instance_path.encode("utf-8")).hexdigest()[:16]
+    return "shm://" + default_path(key)
+
+
+class SharedMemoryStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """
+    ``limits`` storage in a memory-mapped hash table shared between processes.
+
+    URI form: ``shm:///path/to/table?slots=65536``; ``shm://`` alone uses
+    ``default_path()``, a table shared by everything on the host that does so. Every process using a table must agree on ``slots``.
+    """
+
+    STORAGE_SCHEME = ["shm"]
+
+    def __init__(self, uri=None, wrap_exceptions=False, **options):
+        parsed = urlparse(uri or "shm://")
+        self.path = parsed.path or default_path()
+        self.slots = int(parse_qs(parsed.query).get("slots", [DEFAULT_SLOTS])[0])
+        self._pid = None
+        self._fd = None
+        self._map = None
+        # flock excludes other processes only; threads share the descriptor.
+        self._thread_lock = threading.Lock()
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._open()
+
+    @property
+    def base_exceptions(self):
+        return OSError
+
+    def _open(self):
+        size = HEADER.size + self.slots * SLOT.size
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            table = mmap.mmap(fd, size)
+            magic, slots = HEADER.unpack_from(table, 0)
+            if magic != MAGIC:
+                HEADER.pack_into(table, 0, MAGIC, self.slots)
+            elif slots != self.slots:
+                raise ValueError(f"{self.path} holds {slots} slots, not {self.slots}")
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        self._fd, self._map, self._pid = fd, table, os.getpid()
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            if self._pid != os.getpid():
+                # A forked worker inherits the parent's open file description, and
+                # with it the parent's flock; it needs its own.
+                self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                yield self._map
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def _find(self, table, key, now):
+        """
+        Locates a key's slot.
+
+        Returns:
+            tuple: A tuple containing (slot offset, key digest, live count, expiry);
+            count is 0 and expiry None when the key has no live counter, in which
+            case the offset is the slot to claim for it.
+        """
+        digest = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") or 1
+        home = digest % self.slots
+        claim = soonest = None
+        for probe in range(MAX_PROBES):
+            offset = HEADER.size + ((home + probe) % self.slots) * SLOT.size
+            slot_digest, count, expiry = SLOT.unpack_from(table, offset)
+            if slot_digest == digest:
+                return (offset, digest, count, expiry) if expiry > now else (offset, digest, 0, None)
+            if slot_digest == EMPTY or expiry <= now:
+                claim = offset if claim is None else claim
+                if slot_digest == EMPTY:
+                    break
+            elif soonest is None or expiry < soonest[1]:
+                soonest = (offset, expiry)
+        return (claim if claim is not None else soonest[0]), digest, 0, None
+
+    def _incr(self, table, key, expiry, amount, now):
+        offset, digest, count, expires_at = self._find(table, key, now)
+        count += amount
+        SLOT.pack_into(table, offset, digest, count, expires_at if expires_at is not None else now + expiry)
+        return count
+
+    def incr(self, key, expiry, amount=1):
+        """Increments a fixed-window counter, starting a new window if the old one expired."""
+        with self._locked() as table:
+            return self._incr(table, key, expiry, amount, time.time())
+
+    def decr(self, key, amount=1):
+        with self._locked() as table:
+            offset, digest, count, expires_at = self._find(table, key, time.time())
+            if expires_at is None:
+                return 0
+            count = max(count - amount, 0)
+            SLOT.pack_into(table, offset, digest, count, expires_at)
+            return count
+
+    def get(self, key):
+        with self._locked() as table:
+            return self._find(table, key, time.time())[2]
+
+    def get_expiry(self, key):
+        now = time.time()
+        with self._locked() as table:
+            expires_at = self._find(table, key, now)[3]
+        return expires_at if expires_at is not None else now
+
+    def clear(self, key):
+        with self._locked() as table:
+            offset, digest, _, expires_at = self._find(table, key, time.time())
+            if expires_at is not None:
+                # Expire rather than empty the slot, so probe chains through it stay intact.
+                SLOT.pack_into(table, offset, digest, 0, 0.0)
+
+    def check(self):
+        try:
+            with self._locked():
+                return True
+        except OSError:
+            return False
+
+    def reset(self):
+        with self._locked() as table:
+            now = time.time()
+            live = sum(
+                1 for index in range(self.slots)
+                for slot_digest, _, expiry in [SLOT.unpack_from(table, HEADER.size + index * SLOT.size)]
+                if slot_digest != EMPTY and expiry > now
+            )
+            table[HEADER.size:] = bytes(self.slots * SLOT.size)
+            return live
+
+    def acquire_sliding_window_entry(self, key, limit, expiry, amount=1):
+        if amount > limit:
+            return False
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        with self._locked() as table:
+            previous_count, previous_ttl, current_count, _ = self._sliding_window(
+                table, previous_key, current_key, expiry, now)
+            if floor(previous_count * previous_ttl / expiry + current_count) + amount > limit:
+                return False
+            # The current window's counter must outlive the next window, which weighs it.
+            self._incr(table, current_key, 2 * expiry, amount, now)
+            return True
+
+    def _sliding_window(self, table, previous_key, current_key, expiry, now):
+        previous_count = self._find(table, previous_key, now)[2]
+        current_count = self._find(table, current_key, now)[2]
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def get_sliding_window(self, key, expiry):
+        now = time.time()
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        with self._locked() as table:
+            return self._sliding_window(table, previous_key, current_key, expiry, now)
+
+    def clear_sliding_window(self, key, expiry):
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self.clear(previous_key)
+        self.clear(current_key)
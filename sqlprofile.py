@@ -0,0 +1,142 @@
+"""
+Opt-in per-request SQL profiling.
+
+With ``SQL_PROFILING = true`` every statement a request executes is timed
+through SQLAlchemy engine events and grouped by its normalized form (literals
+and ``IN`` lists replaced by ``?``). A statement repeated at least
+``SQL_PROFILE_N_PLUS_ONE`` times in one request is flagged as a likely N+1:
+the same query issued once per row of an earlier result.
+
+Each profiled response carries a ``Server-Timing: sql`` entry with the query
+count and total time, and one JSON log line per request lists the slowest
+statement groups (at WARNING level when an N+1 was flagged). Statements run
+while a streamed response body is being generated are not included.
+"""
+import json
+import logging
+import os
+import re
+import time
+from flask import g, has_request_context, request, request_started
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s|:\w+|\$\d+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize(statement):
+    """Reduces a SQL statement to its shape, so executions that differ only in values compare equal."""
+    statement = _STRING.sub("?", statement)
+    statement = _PLACEHOLDER.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _IN_LIST.sub("IN (?...)", statement)
+    return _WHITESPACE.sub(" ", statement).strip()
+
+
+class RequestProfile:
+    """The statements executed while handling one request."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        # normalized statement -> [executions, seconds]
+        self.statements = {}
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        entry = self.statements.setdefault(normalize(statement), [0, 0.0])
+        entry[0] += 1
+        entry[1] += seconds
+
+    def repeated(self, threshold):
+        """Statements executed at least ``threshold`` times, most frequent first."""
+        return sorted(
+            ((sql, count, seconds) for sql, (count, seconds) in self.statements.items() if count >= threshold),
+            key=lambda item: -item[1]
+        )
+
+    def slowest(self, limit):
+        return sorted(
+            ((sql, count, seconds) for sql, (count, seconds) in self.statements.items()),
+            key=lambda item: -item[2]
+        )[:limit]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # The start time lives on the per-statement context, so a statement that
+    # raises (and never reaches after_cursor_execute) leaves nothing behind.
+    if context is not None and has_request_context() and "_sql_profile" in g:
+        context._sql_profile_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_sql_profile_started", None)
+    if started is not None and has_request_context() and "_sql_profile" in g:
+        g._sql_profile.record(statement, time.perf_counter() - started)
+
+
+def _on_request_started(sender, **extra):
+    g._sql_profile = RequestProfile()
+
+
+class SQLProfiler:
+    """Attaches per-request SQL profiles to responses and the log when ``SQL_PROFILING`` is on."""
+
+    def __init__(self, app=None):
+        self.app = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("SQL_PROFILING", os.getenv("SQL_PROFILING", "false").lower() == "true")
+        app.config.setdefault("SQL_PROFILE_N_PLUS_ONE", int(os.getenv("SQL_PROFILE_N_PLUS_ONE", 3)))
+        app.config.setdefault("SQL_PROFILE_LOG_STATEMENTS", int(os.getenv("SQL_PROFILE_LOG_STATEMENTS", 10)))
+        app.extensions["sql_profiler"] = self
+        self.app = app
+        if not app.config["SQL_PROFILING"]:
+            return
+
+        request_started.connect(_on_request_started, app)
+        app.after_request(self._report)
+        for name, listener in (("before_cursor_execute", _before_cursor_execute),
+                               ("after_cursor_execute", _after_cursor_execute)):
+            if not event.contains(Engine, name, listener):
+                event.listen(Engine, name, listener)
+
+    def _report(self, response):
+        profile = g.pop("_sql_profile", None)
+        if profile is None:
+            return response
+        config = self.app.config
+        repeated = profile.repeated(config["SQL_PROFILE_N_PLUS_ONE"])
+
+        description = f"{profile.count} queries" + (f", {len(repeated)} repeated" if repeated else "")
+        response.headers.add("Server-Timing", f'sql;dur={profile.seconds * 1000:.2f};desc="{description}"')
+
+        record = {
+            "event": "sql_profile",
+            "method": request.method,
+            "path": request.path,
+            "endpoint": request.endpoint,
+            "status": response.status_code,
+            "queries": profile.count,
+            "sql_ms": round(profile.seconds * 1000, 3),
+            "statements": [
+                {"sql": sql, "count": count, "ms": round(seconds * 1000, 3)}
+                for sql, count, seconds in profile.slowest(config["SQL_PROFILE_LOG_STATEMENTS"])
+            ],
+            "n_plus_one": [{"sql": sql, "count": count} for sql, count, _ in repeated],
+        }
+        logger.log(logging.WARNING if repeated else logging.INFO, json.dumps(record))
+        return response
+
+
+sql_profiler = SQLProfiler()
@@ -0,0 +1,148 @@
+"""
+Per-stage timing of request pipelines such as uploads.
+
+Code on a request path wraps each step in ``with stage("name"):``. The stages
+of a request are timed with the monotonic clock, sent back as ``Server-Timing``
+entries and logged together, and every duration also goes into a per-endpoint
+window of the last ``STAGE_TIMING_WINDOW`` samples. ``StageTimings.summary()``
+turns those windows into p50/p90/p99 summaries, served at ``/api/timings/stages``.
+
+Outside a request (the CLI, extraction worker processes) ``stage`` does
+nothing, so shared ingest code can be instrumented unconditionally.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from flask import g, has_request_context, request, request_started
+
+
+logger = logging.getLogger(__name__)
+
+PERCENTILES = (50, 90, 99)
+
+
+class RequestStages:
+    """Stage durations for one request, in the order the stages first ran."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.depth = 0
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name):
+    """
+    Times the enclosed block as stage ``name`` of the current request.
+
+    Repeated stages add up; a stage nested in another is counted as part of
+    the outer one, so the stages of a request never overlap.
+    """
+    stages = g.get("_request_stages") if has_request_context() else None
+    if stages is None:
+        yield
+        return
+    started = time.perf_counter()
+    stages.depth += 1
+    try:
+        yield
+    finally:
+        stages.depth -= 1
+        if not stages.depth:
+            stages.add(name, time.perf_counter() - started)
+
+
+def percentile(ordered, pct):
+    """
+    Nearest-rank percentile of a sorted, non-empty list: the smallest sample with
+    at least ``pct``% of the samples at or below it. The benchmarks use it too.
+    """
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def _on_request_started(sender, **extra):
+    g._request_stages = RequestStages()
+
+
+class StageTimings:
+    """Reports each request's stages and keeps recent samples per endpoint and stage."""
+
+    def __init__(self, app=None):
+        self.window = 2048
+        self._samples = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("STAGE_TIMING", os.getenv("STAGE_TIMING", "true").lower() == "true")
+        app.config.setdefault("STAGE_TIMING_WINDOW", int(os.getenv("STAGE_TIMING_WINDOW", 2048)))
+        self.window = app.config["STAGE_TIMING_WINDOW"]
+        app.extensions["stage_timings"] = self
+        if not app.config["STAGE_TIMING"]:
+            return
+
+        request_started.connect(_on_request_started, app)
+        app.after_request(self._report)
+
+    def _report(self, response):
+        stages = g.pop("_request_stages", None)
+        if stages is None or not stages.durations:
+            return response
+
+        total = time.perf_counter() - stages.started
+        for name, seconds in stages.durations.items():
+            response.headers.add("Server-Timing", f"{name};dur={seconds * 1000:.2f}")
+        response.headers.add("Server-Timing", f"total;dur={total * 1000:.2f}")
+
+        endpoint = request.endpoint
+        self.record(endpoint, dict(stages.durations, total=total))
+        logger.info(f"Stages for {endpoint} ({response.status_code}): " + " ".join(
+            f"{name}={seconds * 1000:.1f}ms" for name, seconds in dict(stages.durations, total=total).items()))
+        return response
+
+    def record(self, endpoint, durations):
+        with self._lock:
+            samples = self._samples.setdefault(endpoint, {})
+            for name, seconds in durations.items():
+                window = samples.get(name)
+                if window is None:
+                    window = samples[name] = deque(maxlen=self.window)
+                window.append(seconds)
+
+    def summary(self):
+        """
+        Summarizes the recent samples of every endpoint's stages.
+
+        Returns:
+            dict: ``{endpoint: {stage: {"count", "mean_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms"}}}``.
+        """
+        with self._lock:
+            snapshot = {endpoint: {name: list(window) for name, window in stages.items()}
+                        for endpoint, stages in self._samples.items()}
+
+        report = {}
+        for endpoint, stages in snapshot.items():
+            report[endpoint] = {}
+            for name, samples in stages.items():
+                ordered = sorted(samples)
+                summary = {"count": len(ordered), "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3)}
+                for pct in PERCENTILES:
+                    summary[f"p{pct}_ms"] = round(percentile(ordered, pct) * 1000, 3)
+                summary["max_ms"] = round(ordered[-1] * 1000, 3)
+                report[endpoint][name] = summary
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+
+stage_timings = StageTimings()
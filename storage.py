@@ -0,0 +1,89 @@
+import hashlib
+import logging
+import os
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload stream exceeds the configured size limit."""
+
+
+def stream_to_temp(stream, directory, max_size=None, chunk_size=CHUNK_SIZE):
+    """
+    Streams an upload into a temporary file in fixed-size chunks.
+
+    The size limit is enforced and a SHA-256 digest is computed while the data
+    is written, so peak memory is one chunk regardless of the upload size.
+
+    Args:
+        stream: A readable binary file-like object (e.g. ``FileStorage.stream``).
+        directory (str): Directory for the temporary file; use the destination
+            directory so the final rename stays on one filesystem.
+        max_size (int): Maximum number of bytes accepted, or None for no limit.
+        chunk_size (int): Number of bytes read per iteration.
+
+    Returns:
+        tuple: A tuple containing (temporary path, sha256 hex digest, size in bytes).
+
+    Raises:
+        UploadTooLarge: If the stream is larger than ``max_size``.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".upload-", suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise UploadTooLarge(f"File is too large. Maximum size is {max_size // (1024 * 1024)}MB.")
+                digest.update(chunk)
+                tmp.write(chunk)
+    except BaseException:
+        discard(tmp_path)
+        raise
+    return tmp_path, digest.hexdigest(), size
+
+
+def save_stream(stream, file_path, max_size=None, chunk_size=CHUNK_SIZE):
+    """
+    Streams an upload to ``file_path``, renaming it into place atomically.
+
+    Args:
+        stream: A readable binary file-like object.
+        file_path (str): Final destination of the file.
+        max_size (int): Maximum number of bytes accepted, or None for no limit.
+        chunk_size (int): Number of bytes read per iteration.
+
+    Returns:
+        tuple: A tuple containing (sha256 hex digest, size in bytes).
+
+    Raises:
+        UploadTooLarge: If the stream is larger than ``max_size``.
+    """
+    directory = os.path.dirname(file_path) or "."
+    tmp_path, digest, size = stream_to_temp(stream, directory, max_size, chunk_size)
+    os.replace(tmp_path, file_path)
+    logger.info(f"Stored {size} bytes at {file_path}.")
+    return digest, size
+
+
+def blob_filename(digest, file_ext):
+    """Returns the content-addressed filename for a blob."""
+    return f"{digest}.{file_ext}"
+
+
+def discard(path):
+    """Removes a file, ignoring errors if it is already gone."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,24 @@
+"""flask ingest: option checks and directory walking."""
+import pytest
+from cli import _walk_images, ingest_command
+
+
+def test_walk_skips_hidden_entries_and_excluded_directories(tmp_path):
+    for relative in ["a.png", "sub/b.jpg", "sub/notes.txt", ".hidden/c.png", "sub/.d.png",
+                     "thumbnails/ab/a-small.jpg", "thumbnails/a-large.jpg"]:
+        path = tmp_path / relative
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"")
+
+    found = list(_walk_images(str(tmp_path), {"png", "jpg"}, exclude=[str(tmp_path / "thumbnails")]))
+
+    assert found == [str(tmp_path / "a.png"), str(tmp_path / "sub" / "b.jpg")]
+
+
+@pytest.mark.parametrize("option", ["--workers", "--chunk-size"])
+def test_ingest_rejects_non_positive_sizes(app, tmp_path, option):
+    result = app.test_cli_runner().invoke(
+        ingest_command, [str(tmp_path), "--user", "owner@example.com", option, "0"])
+
+    assert result.exit_code == 2
+    assert f"Invalid value for '{option}'" in result.output
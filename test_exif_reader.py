@@ -0,0 +1,68 @@
+"""Header-only metadata reading, checked against Pillow and hostile PNG text chunks."""
+import io
+import struct
+import zlib
+from PIL import Image as PILImage
+from exif_reader import read_metadata, PNG_SIGNATURE, MAX_HEADER_BYTES
+
+
+def png_chunk(chunk_type, data):
+    return struct.pack(">I4s", len(data), chunk_type) + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def write_png(path, *chunks):
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0)
+    path.write_bytes(PNG_SIGNATURE + png_chunk(b"IHDR", header) + b"".join(chunks) + png_chunk(b"IEND", b""))
+    return str(path)
+
+
+def test_jpeg_exif_matches_pillow(tmp_path):
+    exif = PILImage.Exif()
+    exif[0x010F] = "TestCam"
+    exif[0x0110] = "Model 7"
+    exif.get_ifd(0x8769)[0x8827] = 400
+    gps = exif.get_ifd(0x8825)
+    gps[1], gps[2] = "N", (48.0, 51.0, 29.5)
+    buffer = io.BytesIO()
+    PILImage.new("RGB", (16, 16)).save(buffer, "JPEG", exif=exif.tobytes())
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(buffer.getvalue())
+
+    metadata = read_metadata(str(path))
+    with PILImage.open(path) as image:
+        expected = image._getexif()
+
+    assert metadata[0x010F] == expected[0x010F] == "TestCam"
+    assert metadata[0x8827] == expected[0x8827] == 400
+    assert metadata[0x8825][1] == "N"
+    assert [float(value) for value in metadata[0x8825][2]] == [48.0, 51.0, 29.5]
+
+
+def test_png_text_chunks_are_decoded(tmp_path):
+    path = write_png(
+        tmp_path / "text.png",
+        png_chunk(b"tEXt", b"Title\x00Plain"),
+        png_chunk(b"zTXt", b"Comment\x00\x00" + zlib.compress(b"Compressed")),
+        png_chunk(b"iTXt", b"Author\x00\x01\x00en\x00\x00" + zlib.compress("Zoë".encode("utf-8"))),
+    )
+
+    assert read_metadata(path) == {"Title": "Plain", "Comment": "Compressed", "Author": "Zoë"}
+
+
+def test_png_text_chunk_inflating_past_the_read_budget_is_dropped(tmp_path):
+    bomb = zlib.compress(b"A" * (MAX_HEADER_BYTES * 8), 9)
+    assert len(bomb) < MAX_HEADER_BYTES // 10
+    path = write_png(
+        tmp_path / "bomb.png",
+        png_chunk(b"zTXt", b"Bomb\x00\x00" + bomb),
+        png_chunk(b"iTXt", b"Bomb2\x00\x01\x00\x00\x00" + bomb),
+        png_chunk(b"tEXt", b"Title\x00Still read"),
+    )
+
+    assert read_metadata(path) == {"Title": "Still read"}
+
+
+def test_truncated_compressed_text_is_dropped(tmp_path):
+    path = write_png(tmp_path / "truncated.png", png_chunk(b"zTXt", b"Comment\x00\x00" + zlib.compress(b"x" * 100)[:-6]))
+
+    assert read_metadata(path) == {}
@@ -0,0 +1,73 @@
+"""Geohash encoding, prefix ranges under different collations, and bounding-box queries."""
+import random
+import pytest
+from geo import BASE32, encode, cover, prefix_upper_bound
+from models import db, Image, User
+
+
+def mysql_ci_key(value):
+    """Approximates utf8mb4_0900_ai_ci ordering: punctuation, then digits, then letters, ignoring case."""
+    return [(0 if not ch.isalnum() else 1 if ch.isdigit() else 2, ch.lower()) for ch in value]
+
+
+def test_encode_known_position():
+    assert encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert encode(None, 2.2945) is None
+
+
+@pytest.mark.parametrize("prefix, bound", [("u4pr", "u4ps"), ("u4pz", "u4q"), ("b9", "bb"), ("zz", None)])
+def test_prefix_upper_bound(prefix, bound):
+    assert prefix_upper_bound(prefix) == bound
+
+
+@pytest.mark.parametrize("sort_key", [None, mysql_ci_key], ids=["binary", "mysql_ci"])
+def test_prefix_range_selects_exactly_the_prefixed_geohashes(sort_key):
+    key = sort_key or (lambda value: value)
+    rng = random.Random(7)
+    geohashes = ["".join(rng.choice(BASE32) for _ in range(12)) for _ in range(2000)]
+    for prefix in ["u", "u4", "u4p", "z", "zz", "0", "b9"]:
+        bound = prefix_upper_bound(prefix)
+        in_range = {
+            geohash for geohash in geohashes
+            if key(geohash) >= key(prefix) and (bound is None or key(geohash) < key(bound))
+        }
+        assert in_range == {geohash for geohash in geohashes if geohash.startswith(prefix)}
+
+
+def test_within_bbox_finds_images_in_every_cover_cell(app, user_id):
+    positions = {"eiffel": (48.8584, 2.2945), "louvre": (48.8606, 2.3376), "nyc": (40.7128, -74.0060),
+                 "north_east": (89.99, 179.99)}
+    for name, (latitude, longitude) in positions.items():
+        image = Image(user_id=user_id, filename=name, file_path=name)
+        image.set_location(latitude, longitude)
+        db.session.add(image)
+    db.session.commit()
+
+    def found(*bbox):
+        assert cover(*bbox)
+        return {image.filename for image in Image.within_bbox(user_id, *bbox)}
+
+    assert found(48.8, 2.2, 48.9, 2.4) == {"eiffel", "louvre"}
+    assert found(48.85, 2.29, 48.86, 2.30) == {"eiffel"}
+    assert found(89.0, 179.0, 90.0, 180.0) == {"north_east"}
+    assert found(40.0, 170.0, 49.0, -73.0) == {"nyc"}
+
+
+def test_near_ranks_by_distance_and_loads_only_the_page(client, monkeypatch):
+    owner = User.query.filter_by(email="owner@example.com").one()
+    # 0.001 degrees of latitude is about 111 m.
+    for i in range(10):
+        db.session.add(Image(owner.id, f"{i}.jpg", f"{i}.jpg", latitude=48.0 + i * 0.001, longitude=2.0))
+    db.session.commit()
+
+    response = client.get("/api/images/near", query_string={"lat": 48.0, "lon": 2.0, "radius": 500, "limit": 3})
+
+    body = response.get_json()
+    assert response.status_code == 200
+    assert body["count"] == 5
+    assert [result["filename"] for result in body["results"]] == ["0.jpg", "1.jpg", "2.jpg"]
+    assert [round(result["distance_m"], -1) for result in body["results"]] == [0, 110, 220]
+
+    monkeypatch.setattr("app.MAX_NEAR_CANDIDATES", 4)
+    response = client.get("/api/images/near", query_string={"lat": 48.0, "lon": 2.0, "radius": 500})
+    assert response.status_code == 400
@@ -0,0 +1,156 @@
+"""Content-addressed ingest, including uploads racing on the same bytes."""
+import hashlib
+import io
+import os
+from unittest import mock
+import pytest
+from sqlalchemy.exc import OperationalError
+from models import db, Blob, Image
+from storage import stream_to_temp
+import ingest
+from ingest import ingest_stream, register_staged
+
+
+def blob_path(app, data, ext="png"):
+    return os.path.join(app.config["UPLOAD_FOLDER"], f"{hashlib.sha256(data).hexdigest()}.{ext}")
+
+
+def upload(app, user_id, data, name="photo.png"):
+    return ingest_stream(io.BytesIO(data), name, user_id, app.config["UPLOAD_FOLDER"], defer_extraction=True)
+
+
+def failing_commit():
+    raise OperationalError("COMMIT", {}, Exception("database went away"))
+
+
+def test_identical_uploads_share_one_blob(app, user_id):
+    first = upload(app, user_id, b"same bytes")
+    second = upload(app, user_id, b"same bytes", "copy.png")
+
+    assert first.content_hash == second.content_hash
+    assert first.file_path == second.file_path == blob_path(app, b"same bytes")
+    assert Blob.query.count() == 1
+    assert Blob.get_by_hash(first.content_hash).ref_count == 2
+    assert [name for name in os.listdir(app.config["UPLOAD_FOLDER"])] == [os.path.basename(first.file_path)]
+
+
+def test_failed_upload_removes_its_unreferenced_file(app, user_id):
+    with mock.patch.object(db.session, "commit", failing_commit), pytest.raises(OperationalError):
+        upload(app, user_id, b"never committed")
+
+    assert not os.path.exists(blob_path(app, b"never committed"))
+    assert os.listdir(app.config["UPLOAD_FOLDER"]) == []
+
+
+def test_failed_upload_keeps_a_file_a_concurrent_upload_committed(app, user_id):
+    data = b"raced bytes"
+    path = blob_path(app, data)
+    commit = db.session.commit
+
+    def concurrent_commit_then_fail():
+        # Another request commits a blob for the same bytes; then this commit fails.
+        db.session.rollback()
+        db.session.add(Blob(sha256=hashlib.sha256(data).hexdigest(), filename=os.path.basename(path),
+                            file_path=path, size=len(data)))
+        commit()
+        raise OperationalError("COMMIT", {}, Exception("database went away"))
+
+    with mock.patch.object(db.session, "commit", concurrent_commit_then_fail), pytest.raises(OperationalError):
+        upload(app, user_id, data)
+
+    assert os.path.exists(path)
+    assert Blob.query.filter_by(file_path=path).count() == 1
+
+
+def test_upload_losing_the_insert_race_attaches_to_the_winner(app, user_id):
+    data = b"raced bytes"
+    path = blob_path(app, data)
+    # The dedup lookup misses, but a concurrent upload has committed the blob by the flush.
+    db.session.add(Blob(sha256=hashlib.sha256(data).hexdigest(), filename=os.path.basename(path),
+                        file_path=path, size=len(data)))
+    db.session.commit()
+    with open(path, "wb") as fp:
+        fp.write(data)
+
+    lookups = []
+    real_get_by_hash = Blob.get_by_hash
+
+    def stale_first_lookup(digest):
+        lookups.append(digest)
+        return None if len(lookups) == 1 else real_get_by_hash(digest)
+
+    with mock.patch.object(Blob, "get_by_hash", side_effect=stale_first_lookup):
+        image = upload(app, user_id, data)
+
+    assert image.file_path == path
+    assert os.path.exists(path)
+    assert Image.query.count() == 1
+    assert Blob.get_by_hash(image.content_hash).ref_count == 1
+
+
+def stage_all(app, *entries):
+    staged = []
+    for name, data in entries:
+        tmp_path, digest, size = stream_to_temp(io.BytesIO(data), app.config["UPLOAD_FOLDER"])
+        staged.append(({"name": name}, tmp_path, digest, size, "png"))
+    return staged
+
+
+def no_metadata(paths):
+    return [({}, None, None) for _ in paths]
+
+
+def test_batch_deduplicates_within_itself_and_against_stored_blobs(app, user_id):
+    upload(app, user_id, b"stored")
+    staged = stage_all(app, ("a.png", b"stored"), ("b.png", b"new"), ("c.png", b"new"))
+
+    register_staged(staged, user_id, app.config["UPLOAD_FOLDER"], no_metadata)
+
+    assert [result["status"] for result, *_ in staged] == ["deduplicated", "created", "deduplicated"]
+    assert Blob.get_by_hash(hashlib.sha256(b"stored").hexdigest()).ref_count == 2
+    assert Blob.get_by_hash(hashlib.sha256(b"new").hexdigest()).ref_count == 2
+    assert sorted(os.listdir(app.config["UPLOAD_FOLDER"])) == sorted(
+        os.path.basename(blob_path(app, data)) for data in (b"stored", b"new"))
+
+
+def test_batch_reuses_a_blob_committed_after_its_dedup_query(app, user_id):
+    data = b"raced bytes"
+    staged = stage_all(app, ("a.png", data), ("b.png", b"other"))
+    real_existing_blobs = ingest._existing_blobs
+    lookups = []
+
+    def concurrent_upload_after_first_lookup(digests):
+        lookups.append(digests)
+        if len(lookups) == 1:
+            # Another request stores the same bytes before this batch flushes.
+            upload(app, user_id, data)
+            return {}
+        return real_existing_blobs(digests)
+
+    with mock.patch.object(ingest, "_existing_blobs", side_effect=concurrent_upload_after_first_lookup):
+        register_staged(staged, user_id, app.config["UPLOAD_FOLDER"], no_metadata)
+
+    assert [result["status"] for result, *_ in staged] == ["deduplicated", "created"]
+    assert os.path.exists(blob_path(app, data))
+    assert Blob.get_by_hash(hashlib.sha256(data).hexdigest()).ref_count == 2
+    assert Image.query.count() == 3
+
+
+def test_failed_batch_keeps_a_file_a_concurrent_upload_committed(app, user_id):
+    staged = stage_all(app, ("a.png", b"raced bytes"), ("b.png", b"other"))
+    path = blob_path(app, b"raced bytes")
+    commit = db.session.commit
+
+    def concurrent_commit_then_fail():
+        db.session.rollback()
+        db.session.add(Blob(sha256=hashlib.sha256(b"raced bytes").hexdigest(), filename=os.path.basename(path),
+                            file_path=path, size=len(b"raced bytes")))
+        commit()
+        raise OperationalError("COMMIT", {}, Exception("database went away"))
+
+    with mock.patch.object(db.session, "commit", concurrent_commit_then_fail), pytest.raises(OperationalError):
+        register_staged(staged, user_id, app.config["UPLOAD_FOLDER"], no_metadata)
+
+    assert os.path.exists(path)
+    assert not os.path.exists(blob_path(app, b"other"))
+    assert not [name for name in os.listdir(app.config["UPLOAD_FOLDER"]) if name.startswith(".upload-")]
@@ -0,0 +1,87 @@
+"""The bounded extraction queue: a full backlog leaves blobs pending, and they are drained as jobs finish."""
+import io
+from concurrent.futures import Future
+import pytest
+from models import Blob, EXTRACTION_PENDING, EXTRACTION_DONE
+from ingest import ingest_stream
+from jobs import ExtractionQueue
+
+
+class HeldExecutor:
+    """Queues jobs until the test finishes them, in submission order."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.jobs.append((future, fn, args))
+        return future
+
+    def finish_next(self):
+        future, fn, args = self.jobs.pop(0)
+        future.set_result(fn(*args))
+
+    def shutdown(self, wait=True):
+        pass
+
+
+@pytest.fixture
+def extraction_queue(app):
+    app.config.update(EXTRACTION_MODE="async", EXTRACTION_MAX_PENDING=1)
+    queue = ExtractionQueue(app)
+    queue._executor = HeldExecutor()
+    return queue
+
+
+@pytest.fixture
+def extracted(monkeypatch):
+    calls = []
+    monkeypatch.setattr("jobs.safe_extract", lambda path: calls.append(path) or ({"Make": "TestCam"}, None, None))
+    return calls
+
+
+def pending_upload(app, user_id, data):
+    image = ingest_stream(io.BytesIO(data), "photo.png", user_id, app.config["UPLOAD_FOLDER"], defer_extraction=True)
+    return image.content_hash, image.file_path
+
+
+def status(digest):
+    return Blob.get_by_hash(digest).extraction_status
+
+
+def test_full_backlog_leaves_the_blob_pending_instead_of_extracting_inline(app, user_id, extraction_queue, extracted):
+    first = pending_upload(app, user_id, b"first")
+    second = pending_upload(app, user_id, b"second")
+
+    assert extraction_queue.submit(*first) is True
+    assert extraction_queue.submit(*second) is False
+
+    assert extracted == []
+    assert len(extraction_queue._executor.jobs) == 1
+    assert status(second[0]) == EXTRACTION_PENDING
+
+
+def test_finished_jobs_drain_blobs_left_pending(app, user_id, extraction_queue, extracted):
+    uploads = [pending_upload(app, user_id, data) for data in (b"first", b"second", b"third")]
+    for digest, file_path in uploads:
+        extraction_queue.submit(digest, file_path)
+
+    executor = extraction_queue._executor
+    for _ in uploads:
+        assert len(executor.jobs) == 1
+        executor.finish_next()
+
+    assert executor.jobs == []
+    assert sorted(extracted) == sorted(file_path for _, file_path in uploads)
+    assert {status(digest) for digest, _ in uploads} == {EXTRACTION_DONE}
+    assert not extraction_queue.is_in_flight(uploads[-1][0])
+
+
+def test_duplicate_submissions_share_one_job(app, user_id, extraction_queue, extracted):
+    upload = pending_upload(app, user_id, b"same")
+
+    assert extraction_queue.submit(*upload) is True
+    assert extraction_queue.submit(*upload) is True
+
+    assert len(extraction_queue._executor.jobs) == 1
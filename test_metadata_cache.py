@@ -0,0 +1,54 @@
+"""Metadata cache backends and their default location."""
+from flask import Flask
+from metadata_cache import MetadataCache
+
+
+def make_app(tmp_path, database_uri, cache_path=None):
+    app = Flask("image_meta_test", instance_path=str(tmp_path / "instance"))
+    app.config.update(SQLALCHEMY_DATABASE_URI=database_uri, METADATA_CACHE_BACKEND="sqlite")
+    if cache_path is not None:
+        app.config["METADATA_CACHE_PATH"] = str(cache_path)
+    return app
+
+
+def test_default_path_is_private_to_the_database(tmp_path, monkeypatch):
+    monkeypatch.delenv("METADATA_CACHE_PATH", raising=False)
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    first = make_app(tmp_path, "sqlite:///first.db")
+    second = make_app(tmp_path, "sqlite:///second.db")
+    MetadataCache(first)
+    MetadataCache(second)
+
+    assert first.config["METADATA_CACHE_PATH"] != second.config["METADATA_CACHE_PATH"]
+    assert first.config["METADATA_CACHE_PATH"].startswith(str(tmp_path))
+    again = make_app(tmp_path, "sqlite:///first.db")
+    MetadataCache(again)
+    assert again.config["METADATA_CACHE_PATH"] == first.config["METADATA_CACHE_PATH"]
+
+
+def test_default_path_does_not_derive_from_the_database_password(tmp_path, monkeypatch):
+    monkeypatch.delenv("METADATA_CACHE_PATH", raising=False)
+    monkeypatch.setattr("tempfile.tempdir", str(tmp_path))
+    paths = set()
+    for password in ("hunter2", "letmein"):
+        app = make_app(tmp_path, f"mysql+pymysql://app:{password}@db/image_meta")
+        MetadataCache(app)
+        paths.add(app.config["METADATA_CACHE_PATH"])
+
+    assert len(paths) == 1
+
+
+def test_sqlite_backend_is_shared_between_workers(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    # Two caches on one file stand in for two worker processes of a deployment.
+    worker_a = MetadataCache(make_app(tmp_path, "sqlite:///app.db", path))
+    worker_b = MetadataCache(make_app(tmp_path, "sqlite:///app.db", path))
+
+    worker_a.set(1, b'{"Make": "Canon"}')
+    assert worker_b.get(1) == b'{"Make": "Canon"}'
+
+    # An invalidation in one worker is seen by the other, so no stale copy survives an edit.
+    worker_b.invalidate(1)
+    assert worker_a.get(1) is None
+    assert worker_a.stats()["hits"] == 0
+    assert worker_a.stats()["misses"] == 1
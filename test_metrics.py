@@ -0,0 +1,54 @@
+"""Request metrics, including requests that end in an unhandled exception."""
+import pytest
+from flask import Flask
+from metrics import Metrics, REQUESTS
+
+
+def request_count(endpoint, status):
+    _, _, _, samples = REQUESTS.collect()
+    return sum(value for _, labels, value in samples
+               if dict(labels).get("endpoint") == endpoint and dict(labels).get("status") == status)
+
+
+def make_app(propagate):
+    app = Flask("image_meta_test")
+    app.config.update(METRICS_ENABLED=True, PROPAGATE_EXCEPTIONS=propagate)
+    Metrics(app)
+
+    @app.route("/ok")
+    def metrics_ok():
+        return "ok"
+
+    @app.route("/boom")
+    def metrics_boom():
+        raise RuntimeError("boom")
+
+    return app
+
+
+@pytest.mark.parametrize("propagate", [True, False])
+def test_unhandled_exceptions_are_counted_as_500s(propagate):
+    client = make_app(propagate).test_client()
+    ok_before = request_count("metrics_ok", "200")
+    boom_before = request_count("metrics_boom", "500")
+
+    assert client.get("/ok").status_code == 200
+    if propagate:
+        with pytest.raises(RuntimeError):
+            client.get("/boom")
+    else:
+        assert client.get("/boom").status_code == 500
+
+    assert request_count("metrics_ok", "200") == ok_before + 1
+    assert request_count("metrics_boom", "500") == boom_before + 1
+
+
+def test_endpoint_needs_a_token(client):
+    assert client.get("/metrics").status_code == 404
+
+    client.application.config["METRICS_TOKEN"] = "scraper-secret"
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer scraper-secret"})
+    assert response.status_code == 200
+    assert b"http_requests_total" in response.data
@@ -0,0 +1,216 @@
+"""
+Outbox delivery against a local SMTP stand-in.
+
+Run with ``python -m pytest test_outbox.py``. The stand-in speaks just enough
+SMTP for smtplib, records every message it accepts and can be told to refuse
+recipients, so delivery, retry and lease handling are exercised end to end
+without a real mail server.
+"""
+import socket
+import socketserver
+import threading
+from datetime import datetime, timedelta
+import pytest
+from flask import Flask
+from extensions import mail
+from models import db, OutboxEmail, OUTBOX_PENDING, OUTBOX_SENT, OUTBOX_FAILED
+from outbox import OutboxSender
+
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self.reply("220 stub ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode("utf-8", "replace").rstrip("\r\n")
+            if not line:
+                return
+            command = line.split(" ", 1)[0].upper()
+            if command in ("EHLO", "HELO"):
+                self.reply("250 stub")
+            elif command == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif command == "RCPT":
+                address = line.split(":", 1)[1].strip().strip("<>")
+                if address in server.refused:
+                    self.reply("451 try again later")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 end with <CRLF>.<CRLF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline().decode("utf-8", "replace")
+                    if data in (".\r\n", ".\n", ""):
+                        break
+                    lines.append(data)
+                server.messages.append((recipients, "".join(lines)))
+                self.reply("250 queued")
+            elif command == "RSET":
+                recipients = []
+                self.reply("250 OK")
+            elif command == "NOOP":
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("502 not implemented")
+
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubSMTPHandler)
+        self.connections = 0
+        self.messages = []
+        self.refused = set()
+
+
+@pytest.fixture
+def smtp_server():
+    server = StubSMTPServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_app(port):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI="sqlite://",
+        MAIL_SERVER="127.0.0.1",
+        MAIL_PORT=port,
+        MAIL_USE_TLS=False,
+        MAIL_USE_SSL=False,
+        MAIL_DEFAULT_SENDER="noreply@example.com",
+        OUTBOX_SENDER="off",
+        OUTBOX_BATCH_SIZE=10,
+        OUTBOX_MAX_ATTEMPTS=3,
+    )
+    db.init_app(app)
+    mail.init_app(app)
+    sender = OutboxSender(app)
+    return app, sender
+
+
+@pytest.fixture
+def outbox(smtp_server):
+    app, sender = make_app(smtp_server.server_address[1])
+    with app.app_context():
+        db.create_all()
+        yield sender
+        db.session.remove()
+        db.drop_all()
+
+
+def queue(sender, *recipients):
+    return [sender.enqueue(recipient, "Password reset", f"Hello {recipient}").id for recipient in recipients]
+
+
+def test_batch_is_delivered_over_one_connection(outbox, smtp_server):
+    ids = queue(outbox, "a@example.com", "b@example.com", "c@example.com")
+
+    assert outbox.deliver_batch() == 3
+
+    assert smtp_server.connections == 1
+    assert [recipients for recipients, _ in smtp_server.messages] == [
+        ["a@example.com"], ["b@example.com"], ["c@example.com"]
+    ]
+    for message_id in ids:
+        message = db.session.get(OutboxEmail, message_id)
+        assert message.status == OUTBOX_SENT
+        assert message.sent_at is not None
+        assert message.claim_token is None
+    assert outbox.deliver_batch() == 0
+
+
+def test_refused_message_is_retried_with_backoff(outbox, smtp_server):
+    smtp_server.refused.add("bounce@example.com")
+    bounced, delivered = queue(outbox, "bounce@example.com", "ok@example.com")
+
+    before = datetime.utcnow()
+    assert outbox.deliver_batch() == 2
+
+    message = db.session.get(OutboxEmail, bounced)
+    assert message.status == OUTBOX_PENDING
+    assert message.attempts == 1
+    assert "try again later" in message.last_error
+    assert message.claim_token is None
+    retry_base = outbox.app.config["OUTBOX_RETRY_BASE"]
+    assert before + timedelta(seconds=retry_base * 0.5) <= message.next_attempt_at
+    assert db.session.get(OutboxEmail, delivered).status == OUTBOX_SENT
+
+    # Not due yet, so nothing is claimed.
+    assert outbox.deliver_batch() == 0
+
+    smtp_server.refused.clear()
+    message.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    assert outbox.deliver_batch() == 1
+    assert db.session.get(OutboxEmail, bounced).status == OUTBOX_SENT
+    assert [recipients for recipients, _ in smtp_server.messages] == [["ok@example.com"], ["bounce@example.com"]]
+
+
+def test_message_fails_after_max_attempts(outbox, smtp_server):
+    smtp_server.refused.add("bounce@example.com")
+    (message_id,) = queue(outbox, "bounce@example.com")
+
+    for _ in range(outbox.app.config["OUTBOX_MAX_ATTEMPTS"]):
+        assert outbox.deliver_batch() == 1
+        message = db.session.get(OutboxEmail, message_id)
+        message.next_attempt_at = datetime.utcnow() - timedelta(seconds=1)
+        db.session.commit()
+
+    assert message.status == OUTBOX_FAILED
+    assert message.attempts == outbox.app.config["OUTBOX_MAX_ATTEMPTS"]
+    assert outbox.deliver_batch() == 0
+    assert smtp_server.messages == []
+
+
+def test_unreachable_server_reschedules_the_whole_batch(outbox, smtp_server):
+    ids = queue(outbox, "a@example.com", "b@example.com")
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        closed_port = probe.getsockname()[1]
+    outbox.app.extensions["mail"].port = closed_port
+
+    assert outbox.deliver_batch() == 2
+
+    for message_id in ids:
+        message = db.session.get(OutboxEmail, message_id)
+        assert message.status == OUTBOX_PENDING
+        assert message.attempts == 1
+        assert message.claim_token is None
+    assert smtp_server.connections == 0
+
+
+def test_claimed_messages_are_redelivered_after_the_lease_expires(outbox, smtp_server):
+    (message_id,) = queue(outbox, "a@example.com")
+
+    # A sender claims the message and dies before delivering it.
+    claimed = outbox._claim(datetime.utcnow())
+    assert [message.id for message in claimed] == [message_id]
+
+    # While the lease holds, no other sender picks it up.
+    assert outbox.deliver_batch() == 0
+    assert smtp_server.connections == 0
+
+    message = db.session.get(OutboxEmail, message_id)
+    message.claimed_until = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+
+    assert outbox.deliver_batch() == 1
+    assert db.session.get(OutboxEmail, message_id).status == OUTBOX_SENT
+    assert [recipients for recipients, _ in smtp_server.messages] == [["a@example.com"]]
@@ -0,0 +1,46 @@
+"""Request profiling is opt-in and needs a private secret key."""
+import os
+import pytest
+from flask import Flask
+from profiler import RequestProfiler, TOKEN_HEADER
+
+
+def make_app(tmp_path, **config):
+    app = Flask("image_meta_test")
+    app.config.update(PROFILE_DIR=str(tmp_path / "profiles"), **config)
+    profiler = RequestProfiler(app)
+
+    @app.route("/work")
+    def work():
+        return "ok"
+
+    return app, profiler
+
+
+def test_profiling_is_off_by_default(tmp_path, monkeypatch):
+    monkeypatch.delenv("PROFILING", raising=False)
+    app, _ = make_app(tmp_path, SECRET_KEY="private")
+
+    assert app.config["PROFILING"] is False
+
+
+@pytest.mark.parametrize("secret_key", [None, "", "your_secret_key_here"])
+def test_profiling_stays_off_with_a_public_secret_key(tmp_path, secret_key):
+    app, profiler = make_app(tmp_path, PROFILING=True, SECRET_KEY=secret_key)
+    app.config["SECRET_KEY"] = "your_secret_key_here"
+    token = profiler.make_token()
+
+    assert app.config["PROFILING"] is False
+    assert app.test_client().get("/work", headers={TOKEN_HEADER: token}).status_code == 200
+    assert not os.path.exists(tmp_path / "profiles")
+
+
+def test_token_captures_a_request(tmp_path):
+    app, profiler = make_app(tmp_path, PROFILING=True, SECRET_KEY="private")
+    client = app.test_client()
+
+    client.get("/work")
+    assert not os.path.exists(tmp_path / "profiles")
+
+    client.get("/work", headers={TOKEN_HEADER: profiler.make_token()})
+    assert sorted(name.rsplit(".", 1)[1] for name in os.listdir(tmp_path / "profiles")) == ["collapsed", "pstats"]
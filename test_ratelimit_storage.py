@@ -0,0 +1,40 @@
+"""The shared-memory rate limit table and its per-deployment default."""
+import hashlib
+from flask import Flask
+import ratelimit_storage
+from ratelimit_storage import SharedMemoryStorage
+
+
+def make_app(instance_path, secret_key):
+    app = Flask("image_meta_test", instance_path=str(instance_path))
+    app.config["SECRET_KEY"] = secret_key
+    return app
+
+
+def test_default_uri_is_private_to_the_deployment(tmp_path):
+    uri = ratelimit_storage.default_uri(make_app(tmp_path / "a", "secret"))
+
+    assert uri.startswith("shm:///")
+    # Workers of one deployment share the instance folder, and with it the table.
+    assert ratelimit_storage.default_uri(make_app(tmp_path / "a", "other")) == uri
+    assert ratelimit_storage.default_uri(make_app(tmp_path / "b", "secret")) != uri
+
+
+def test_default_uri_does_not_derive_from_the_secret_key(tmp_path):
+    uri = ratelimit_storage.default_uri(make_app(tmp_path, "secret"))
+
+    with open(tmp_path / ratelimit_storage.DEPLOYMENT_ID_FILE, encoding="ascii") as fp:
+        assert uri.endswith("-" + fp.read())
+    assert hashlib.sha256(f"{tmp_path}|secret".encode()).hexdigest()[:16] not in uri
+
+
+def test_storages_on_one_table_share_counters(tmp_path):
+    uri = f"shm://{tmp_path / 'table'}?slots=64"
+    # Two storages on one table stand in for two worker processes.
+    worker_a, worker_b = SharedMemoryStorage(uri), SharedMemoryStorage(uri)
+
+    worker_a.incr("login/1.2.3.4", 60)
+    worker_b.incr("login/1.2.3.4", 60)
+    assert worker_a.get("login/1.2.3.4") == 2
+
+    assert SharedMemoryStorage(f"shm://{tmp_path / 'other'}?slots=64").get("login/1.2.3.4") == 0
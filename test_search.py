@@ -0,0 +1,89 @@
+"""/api/images/search: filters, keyset paging and index use."""
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import text
+from models import db, Image, User
+
+
+@pytest.fixture
+def images(client):
+    owner = User.query.filter_by(email="owner@example.com").one()
+    start = datetime(2024, 1, 1)
+    for i in range(30):
+        db.session.add(Image(
+            owner.id, f"{i}.jpg", f"{i}.jpg",
+            camera_make="Canon" if i % 2 else "Nikon", camera_model="R5" if i % 3 else "R6",
+            iso=100 * (i % 4 + 1), f_number=[1.8, 2.8, 4.0][i % 3],
+            # Pairs of images share a capture time, so paging must break ties on id.
+            taken_at=start + timedelta(days=i // 2),
+        ))
+    db.session.commit()
+    return {image.id: image for image in Image.query.all()}
+
+
+def search(client, **params):
+    response = client.get("/api/images/search", query_string=params)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def search_all(client, **params):
+    """Follows next_cursor to the end, two results per page."""
+    ids, cursor = [], None
+    while True:
+        page = search(client, limit=2, **(dict(params, cursor=cursor) if cursor else params))
+        ids += [result["id"] for result in page["results"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("params, matches, key", [
+    ({}, lambda image: True, lambda image: image.id),
+    ({"make": "Canon"}, lambda image: image.camera_make == "Canon", lambda image: image.id),
+    ({"make": "Canon", "model": "R6"},
+     lambda image: (image.camera_make, image.camera_model) == ("Canon", "R6"), lambda image: image.id),
+    ({"taken_after": "2024-01-03", "taken_before": "2024-01-12"},
+     lambda image: datetime(2024, 1, 3) <= image.taken_at < datetime(2024, 1, 12),
+     lambda image: (image.taken_at, image.id)),
+    ({"iso_min": 200, "iso_max": 300, "make": "Nikon"},
+     lambda image: 200 <= image.iso <= 300 and image.camera_make == "Nikon", lambda image: (image.iso, image.id)),
+    ({"f_min": 2.8}, lambda image: image.f_number >= 2.8, lambda image: (image.f_number, image.id)),
+])
+def test_paging_returns_every_match_once_in_sort_order(client, images, params, matches, key):
+    expected = sorted((image for image in images.values() if matches(image)), key=key, reverse=True)
+
+    assert search_all(client, **params) == [image.id for image in expected]
+
+
+def test_zero_is_a_cursor(client, images):
+    # Cursor 0 is past every id, so the page is empty rather than the first page again.
+    from utils import encode_cursor
+    assert search(client, cursor=encode_cursor(0))["results"] == []
+
+
+@pytest.mark.parametrize("params", [
+    {"iso_min": "abc"}, {"f_max": "x"}, {"f_min": "nan"}, {"limit": "ten"},
+    {"taken_after": "yesterday"}, {"cursor": "abc"}, {"cursor": "0"}, {"cursor": ""},
+])
+def test_invalid_parameters_are_rejected(client, images, params):
+    response = client.get("/api/images/search", query_string=params)
+
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("order_by, where", [
+    ("taken_at DESC, id DESC", "taken_at >= '2024-01-03'"),
+    ("iso DESC, id DESC", "iso >= 200"),
+    ("f_number DESC, id DESC", "f_number <= 2.8"),
+    ("id DESC", "camera_make = 'Canon'"),
+    ("id DESC", "camera_make = 'Canon' AND camera_model = 'R5'"),
+])
+def test_search_order_is_served_by_an_index(client, order_by, where):
+    plan = db.session.execute(text(
+        f"EXPLAIN QUERY PLAN SELECT * FROM images WHERE user_id = 1 AND {where} ORDER BY {order_by} LIMIT 51"
+    )).all()
+    details = " ".join(row[-1] for row in plan)
+
+    assert "USING INDEX" in details
+    assert "TEMP B-TREE" not in details
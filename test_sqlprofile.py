@@ -0,0 +1,46 @@
+"""Per-request SQL profiling."""
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from models import db
+from sqlprofile import SQLProfiler, normalize
+
+
+def test_normalize_replaces_values():
+    assert normalize("SELECT * FROM images WHERE id = 42 AND name = 'a''b'") == \
+        "SELECT * FROM images WHERE id = ? AND name = ?"
+    assert normalize("SELECT * FROM blobs\n WHERE sha256 IN (%s, %s, %s)") == "SELECT * FROM blobs WHERE sha256 IN (?...)"
+
+
+@pytest.fixture
+def client(app):
+    app.config.update(SQL_PROFILING=True, SQL_PROFILE_N_PLUS_ONE=3)
+    SQLProfiler(app)
+
+    @app.route("/n-plus-one")
+    def n_plus_one():
+        for image_id in range(4):
+            db.session.execute(text("SELECT :id"), {"id": image_id})
+        return "ok"
+
+    @app.route("/failing")
+    def failing():
+        with pytest.raises(OperationalError):
+            db.session.execute(text("SELECT * FROM no_such_table"))
+        db.session.rollback()
+        db.session.execute(text("SELECT 1"))
+        return "ok"
+
+    return app.test_client()
+
+
+def test_repeated_statements_are_flagged(client):
+    response = client.get("/n-plus-one")
+
+    assert 'desc="4 queries, 1 repeated"' in response.headers["Server-Timing"]
+
+
+def test_failed_statement_is_not_timed(client):
+    response = client.get("/failing")
+
+    assert 'desc="1 queries"' in response.headers["Server-Timing"]
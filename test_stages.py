@@ -0,0 +1,12 @@
+"""The nearest-rank percentile shared by /api/timings/stages and the benchmarks."""
+import pytest
+from stages import percentile
+
+
+@pytest.mark.parametrize("pct, expected", [(0, 1), (10, 1), (11, 2), (50, 5), (90, 9), (99, 10), (100, 10)])
+def test_percentile_is_nearest_rank(pct, expected):
+    assert percentile(list(range(1, 11)), pct) == expected
+
+
+def test_percentile_of_one_sample():
+    assert percentile([0.25], 99) == 0.25
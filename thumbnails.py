@@ -0,0 +1,107 @@
+"""
+Resized derivatives of uploaded images, cached on disk.
+
+Derivatives are keyed by the stored file's name, which for content-addressed
+blobs is the SHA-256 of the source, plus the size and format, so a cached file
+never goes stale and is shared by every image pointing at the same blob.
+"""
+import logging
+import os
+import tempfile
+
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels for each named size.
+THUMBNAIL_SIZES = {
+    "small": 160,
+    "medium": 500,
+    "large": 1200,
+}
+
+# Output extension -> (Pillow format, mimetype, save options).
+THUMBNAIL_FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+}
+
+
+def thumbnail_path(folder, source_filename, size, fmt):
+    """Returns the cache path for one derivative of a stored file."""
+    stem = os.path.splitext(source_filename)[0]
+    return os.path.join(folder, stem[:2], f"{stem}-{size}.{fmt}")
+
+
+def render_thumbnail(source_path, dest_path, max_edge, fmt):
+    """
+    Writes a downscaled copy of an image.
+
+    JPEGs are decoded with draft mode at the smallest DCT scale that still
+    covers ``max_edge``, and other formats are shrunk with ``reduce()`` before
+    the final resample, so large originals are never resized at full size.
+
+    Args:
+        source_path (str): The original image.
+        dest_path (str): Where to write the derivative; written atomically.
+        max_edge (int): Longest edge of the derivative in pixels.
+        fmt (str): Key of ``THUMBNAIL_FORMATS``.
+    """
+    # Imported here so loading the app doesn't pay for Pillow until a thumbnail is rendered.
+    from PIL import Image as PILImage, ImageOps
+
+    pil_format, _, options = THUMBNAIL_FORMATS[fmt]
+    with PILImage.open(source_path) as img:
+        if img.format == "JPEG":
+            img.draft("RGB", (max_edge, max_edge))
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_edge, max_edge), PILImage.Resampling.LANCZOS, reducing_gap=2.0)
+
+        if pil_format == "JPEG" or img.mode not in ("RGB", "RGBA"):
+            has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+            img = img.convert("RGBA" if has_alpha and pil_format != "JPEG" else "RGB")
+
+        os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dest_path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                img.save(fp, pil_format, **options)
+            os.replace(tmp_path, dest_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def get_thumbnail(upload_folder, thumbnail_folder, source_filename, size, fmt):
+    """
+    Returns the path of a derivative, rendering and caching it on first use.
+
+    Args:
+        upload_folder (str): Directory holding the originals.
+        thumbnail_folder (str): Directory holding cached derivatives.
+        source_filename (str): Stored filename of the original.
+        size (str): Key of ``THUMBNAIL_SIZES``.
+        fmt (str): Key of ``THUMBNAIL_FORMATS``.
+
+    Returns:
+        str: Path to the derivative, or None if the original does not exist.
+    """
+    dest_path = thumbnail_path(thumbnail_folder, source_filename, size, fmt)
+    if os.path.exists(dest_path):
+        return dest_path
+
+    source_path = os.path.join(upload_folder, source_filename)
+    if not os.path.isfile(source_path):
+        return None
+    render_thumbnail(source_path, dest_path, THUMBNAIL_SIZES[size], fmt)
+    logger.info(f"Rendered {size} {fmt} thumbnail for {source_filename}.")
+    return dest_path
+
+
+def discard_thumbnails(thumbnail_folder, source_filename):
+    """Removes every cached derivative of a stored file."""
+    for size in THUMBNAIL_SIZES:
+        for fmt in THUMBNAIL_FORMATS:
+            path = thumbnail_path(thumbnail_folder, source_filename, size, fmt)
+            if os.path.exists(path):
+                os.remove(path)
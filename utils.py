@@ -1,8 +1,9 @@
+import base64
+import binascii
 import logging
-from PIL import Image
-from PIL.ExifTags import TAGS, GPSTAGS
-from flask_mail import Message
-from extensions import mail
+from datetime import datetime
+from outbox import outbox_sender
+from exif_reader import read_metadata
 
 
 logger = logging.getLogger(__name__)
@@ -20,6 +21,69 @@ def allowed_file(filename, allowed_extensions):
     """
     return "." in filename and filename.rsplit(".", 1)[-1].lower() in allowed_extensions
 
+def encode_cursor(*values):
+    """
+    Encodes a keyset pagination position as an opaque URL-safe token.
+
+    Args:
+        *values: Sort key of the last item returned, e.g. (created_at, image_id).
+            Datetimes are written in ISO format, anything else with ``str``.
+
+    Returns:
+        str: The cursor token.
+    """
+    raw = "|".join(value.isoformat() if isinstance(value, datetime) else str(value) for value in values).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor, parsers=(datetime.fromisoformat, int)):
+    """
+    Decodes a token produced by ``encode_cursor``.
+
+    Args:
+        cursor (str): The cursor token.
+        parsers (tuple): One callable per encoded value; the default reads (created_at, image_id).
+
+    Returns:
+        tuple: The decoded values, e.g. (created_at, image_id).
+
+    Raises:
+        ValueError: If the token is malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        values = raw.split("|")
+        if len(values) != len(parsers):
+            raise ValueError(f"expected {len(parsers)} values")
+        return tuple(parse(value) for parse, value in zip(parsers, values))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def read_raw_exif(image_path):
+    """
+    Reads EXIF tags keyed by numeric tag id.
+
+    JPEG and PNG files go through the header-only reader, which never decodes
+    pixel data; other formats, or files it cannot parse, fall back to Pillow.
+
+    Args:
+        image_path (str): Path to the image file.
+
+    Returns:
+        dict: Raw tags in the layout of Pillow's ``_getexif()``, or None.
+    """
+    try:
+        exif_data = read_metadata(image_path)
+        if exif_data is not None:
+            return exif_data
+    except Exception as e:
+        logger.warning(f"Header-only EXIF read failed for {image_path}, falling back to Pillow: {e}")
+
+    # Imported on first use, so app startup doesn't pay for PIL.Image (~45 ms);
+    # JPEG and PNG reads never open the image with it.
+    from PIL import Image
+    with Image.open(image_path) as img:
+        return img._getexif()
+
 def get_exif_data(image_path):
     """
     Extracts EXIF data from an image.
@@ -30,29 +94,38 @@ def get_exif_data(image_path):
     Returns:
         dict: A dictionary containing the EXIF metadata, or None if no data is found.
     """
+    # Only Pillow's tag-name tables (~12 ms to import, without PIL.Image) are
+    # needed here, so every extraction loads this part of Pillow.
+    from PIL.ExifTags import TAGS, GPSTAGS
+
     try:
-        with Image.open(image_path) as img:
-            exif_data = img._getexif()
-            if exif_data:
-                metadata = {}
-                for tag_id, value in exif_data.items():
-                    tag = TAGS.get(tag_id, tag_id)
-                    if tag == "GPSInfo":
-                        gps_data = {}
-                        for gps_tag_id in value:
-                            sub_tag = GPSTAGS.get(gps_tag_id, gps_tag_id)
-                            gps_data[sub_tag] = value[gps_tag_id]
-                        metadata[tag] = gps_data
-                    else:
-                        metadata[tag] = value
-                return metadata
-            else:
-                logger.warning(f"No EXIF data found in {image_path}.")
-                return None
+        exif_data = read_raw_exif(image_path)
+        if exif_data:
+            metadata = {}
+            for tag_id, value in exif_data.items():
+                tag = TAGS.get(tag_id, tag_id)
+                if tag == "GPSInfo":
+                    gps_data = {}
+                    for gps_tag_id in value:
+                        sub_tag = GPSTAGS.get(gps_tag_id, gps_tag_id)
+                        gps_data[sub_tag] = value[gps_tag_id]
+                    metadata[tag] = gps_data
+                else:
+                    metadata[tag] = value
+            return metadata
+        else:
+            logger.warning(f"No EXIF data found in {image_path}.")
+            return None
     except Exception as e:
         logger.error(f"Error extracting EXIF data from {image_path}: {e}")
         return None
 
+def _rational_to_float(value):
+    """Converts a (numerator, denominator) pair or a numeric rational to float."""
+    if isinstance(value, tuple):
+        return value[0] / value[1]
+    return float(value)
+
 def convert_gps_to_degrees(gps_coord):
     """
     Converts GPS coordinates from degrees, minutes, seconds (DMS) to decimal degrees.
@@ -66,9 +139,7 @@ def convert_gps_to_degrees(gps_coord):
     if not gps_coord:
         return None
     try:
-        deg = gps_coord[0][0] / gps_coord[0][1]
-        minute = gps_coord[1][0] / gps_coord[1][1]
-        sec = gps_coord[2][0] / gps_coord[2][1]
+        deg, minute, sec = (_rational_to_float(part) for part in gps_coord[:3])
         return deg + (minute / 60) + (sec / 3600)
     except Exception as e:
         logger.error(f"Error converting GPS coordinates: {e}")
@@ -134,7 +205,10 @@ def extract_metadata(image_path):
 
 def send_reset_email(email, token, reset_url_template="http://yourdomain.com/auth/reset_password/{token}"):
     """
-    Sends a password reset email to the user.
+    Queues a password reset email to the user.
+
+    The message is written to the outbox and delivered by the background
+    sender, so SMTP latency and failures never reach the request.
 
     Args:
         email (str): The recipient's email address.
@@ -142,7 +216,7 @@ def send_reset_email(email, token, reset_url_template="http://yourdomain.com/aut
         reset_url_template (str): A template string for the reset URL, where {token} will be replaced.
 
     Raises:
-        Exception: If sending the email fails.
+        Exception: If the message cannot be stored.
     """
     try:
         subject = "Password Reset Request"
@@ -154,9 +228,8 @@ def send_reset_email(email, token, reset_url_template="http://yourdomain.com/aut
         If you did not request this, please ignore this email.
         """
         
-        msg = Message(subject, recipients=[email], body=body)
-        mail.send(msg)
-        logger.info(f"Password reset email sent to {email}.")
+        outbox_sender.enqueue(email, subject, body)
+        logger.info(f"Password reset email queued for {email}.")
     except Exception as e:
-        logger.error(f"Failed to send password reset email to {email}: {str(e)}")
-        raise
\ No newline at end of file
+        logger.error(f"Failed to queue password reset email for {email}: {str(e)}")
+        raise